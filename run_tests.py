@@ -30,6 +30,8 @@ MENU_ITEMS = [
     ("6", "业务流测试", "test_flow.py", "模拟用户完整操作流 (Full Workflow)"),
     ("7", "AI 闲聊", "test_ai.py", "测试 AI 助手基础对话 (LLM Chat)"),
     ("8", "AI RAG", "test_rag.py", "测试 AI 结合地图知识库 (RAG Knowledge)"),
+    ("9", "性能基准", "benchmark.py", "离线测路径规划延迟 / 内存，结果存 JSON (Benchmark)"),
+    ("10", "路线一致性", "test_routing.py", "离线对比缓存/批量/CH/地标/骨架/快照与 Dijkstra (Routing)"),
 ]
 
 def run_script(filename):
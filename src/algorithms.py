@@ -1,11 +1,20 @@
 import heapq
 import math
-from typing import List, Tuple, Dict
+import time
+from array import array
+from typing import List, Tuple, Dict, Optional
+
+from tour import solve_visit_order
+
 ##############################################
 # 辅助函数和常量定义
 SPEED_WALK = 1.5   # 步行速度: 1.5 m/s (约 5.4 km/h)
 SPEED_BIKE = 5.0   # 自行车速度: 5.0 m/s (约 18 km/h)
 
+# 支持的策略和交通方式 (权重数组按组合缓存在编译图上，未知的组合直接报错，不能让请求参数撑大缓存)
+STRATEGIES = ('dist', 'time')
+TRANSPORTS = ('walk', 'bike')
+
 ###############################################
 # 核心函数：计算边的权重
 def get_edge_weight(road, strategy: str, transport: str) -> float:
@@ -18,8 +27,17 @@ def get_edge_weight(road, strategy: str, transport: str) -> float:
     - strategy: 'dist'(最短距离) 或 'time'(最短时间)
     - transport: 'walk'(步行) 或 'bike'(自行车)
     """
-    distance = road.distance
-    
+    # 只能步行的路，自行车不能走
+    if transport == 'bike' and getattr(road, 'type', None) == 'walk':
+        return float('inf')
+    congestion_factor = getattr(road, 'crowding', 1.0) # 安全获取，默认为1.0
+    return edge_cost(road.distance, congestion_factor, strategy, transport)
+
+def edge_cost(distance: float, congestion_factor: float, strategy: str, transport: str) -> float:
+    """
+    【权重公式本体】
+    get_edge_weight 和编译后的权重数组共用这一份公式，保证两边结果一致。
+    """
     # --- 策略 A: 最短距离 ---
     if strategy == 'dist':
         return distance
@@ -38,7 +56,6 @@ def get_edge_weight(road, strategy: str, transport: str) -> float:
     
     # 这里我们采用通用的逻辑：crowding 越大越慢
     # 假设 crowding 默认是 1.0 (正常)，2.0 (堵车)
-    congestion_factor = getattr(road, 'crowding', 1.0) # 安全获取，默认为1.0
     
     # 避免除以0
     if congestion_factor <= 0:
@@ -51,134 +68,986 @@ def get_edge_weight(road, strategy: str, transport: str) -> float:
     time_cost = distance / real_speed
     
     return time_cost
+
+def mode_weights(cg, strategy: str, transport: str) -> array:
+    """
+    【预计算权重数组】
+    对编译后的图 (CompiledGraph)，每种 (strategy, transport) 组合只算一次所有有向边的权重，
+    之后搜索的内层循环只需要 weights[k] 这一次数组读取。
+    自行车模式下只能步行的边权重为无穷大，松弛时永远不会被选中，等价于在 "可骑行子图" 上搜索。
+    """
+    key = (strategy, transport)
+    weights = cg.weight_cache.get(key)
+    if weights is None:
+        if strategy not in STRATEGIES or transport not in TRANSPORTS:
+            raise ValueError(f"未知的导航模式: {strategy}/{transport}")
+        weights = array('d', (
+            edge_cost(d, c, strategy, transport)
+            for d, c in zip(cg.distance, cg.crowding)
+        ))
+        _restrict_transport(cg, weights, transport)
+        cg.weight_cache[key] = weights
+    return weights
+
+def _restrict_transport(cg, weights: array, transport: str):
+    """把当前交通方式不能走的有向边权重设为无穷大 (就地修改)"""
+    if transport == 'bike' and cg.bikeable is not None:
+        inf = float('inf')
+        for k, ok in enumerate(cg.bikeable):
+            if not ok:
+                weights[k] = inf
+
 ########################################################
 # Dijkstra 最短路径算法实现
 
-def dijkstra_search(graph, start_id, end_id, criterion='dist', transport='walk'):
+def _dijkstra_core(cg, weights, source: int, target: int = -1, stats: Dict = None, targets=None,
+                   stop_after: int = None):
+    """
+    【CSR 上的 Dijkstra 内核】
+    所有节点都用稠密下标表示。
+    :param target: 目标下标，弹出它时提前结束；-1 表示算完整棵最短路径树
+    :param targets: 一对多搜索的目标下标集合，全部确定后提前结束
+    :param stop_after: 只要 targets 中最近的这么多个，确定够数就提前结束 (默认全部)
+    :param stats: 可选的统计字典，会累加 'settled' (确定最短距离的节点数)
+    :return: (dist, prev) 两个列表，prev[i] = -1 表示没有前驱
+    """
+    n = cg.num_nodes
+    offsets = cg.offsets
+    arc_targets = cg.targets
+    inf = float('inf')
+
+    dist = [inf] * n
+    prev = [-1] * n
+    dist[source] = 0.0
+    pq = [(0.0, source)]
+    heappop = heapq.heappop
+    heappush = heapq.heappush
+    settled = 0
+    pending = set(targets) if targets is not None else None
+    if pending is not None:
+        remaining = len(pending) if stop_after is None else min(stop_after, len(pending))
+
+    while pq:
+        cost, u = heappop(pq)
+        if u == target:
+            settled += 1
+            break
+        # 剪枝：过期的堆记录直接跳过
+        if cost > dist[u]:
+            continue
+        settled += 1
+        if pending is not None:
+            if u in pending:
+                pending.discard(u)
+                remaining -= 1
+            if remaining <= 0:
+                break
+        for k in range(offsets[u], offsets[u + 1]):
+            v = arc_targets[k]
+            new_cost = cost + weights[k]
+            # 松弛操作 (Relaxation)
+            if new_cost < dist[v]:
+                dist[v] = new_cost
+                prev[v] = u
+                heappush(pq, (new_cost, v))
+
+    if stats is not None:
+        stats['settled'] = stats.get('settled', 0) + settled
+    return dist, prev
+
+def _tree_path(prev, target: int) -> List[int]:
+    """沿前驱数组回溯，返回 起点 -> 终点 的节点下标列表"""
+    path = []
+    curr = target
+    while curr != -1:
+        path.append(curr)
+        curr = prev[curr]
+    return path[::-1]
+
+def _unroll_path(cg, prev, target: int) -> List[int]:
+    """沿前驱数组回溯，返回 起点 -> 终点 的景点ID列表"""
+    node_ids = cg.node_ids
+    return [node_ids[i] for i in _tree_path(prev, target)]
+
+def _on_skeleton(cg, *nodes):
+    """
+    所有端点 (完整图下标) 都在骨架图上时返回骨架 (见 road_chains 模块)，
+    否则返回 None，在完整的图上搜索
+    """
+    sk = cg.skeleton
+    if sk is not None and sk.covers(*nodes):
+        return sk
+    return None
+
+def _skeleton_ids(cg, sk, weights, path: List[int]) -> List[int]:
+    """骨架下标路径展开成完整的景点ID列表 (把收缩掉的路点补回来)"""
+    node_ids = cg.node_ids
+    return [node_ids[i] for i in sk.expand(path, weights)]
+
+def dijkstra_search(graph, start_id, end_id, criterion='dist', transport='walk', stats=None):
     """
     Dijkstra 最短路径算法
-    :param graph: CampusGraph 对象
+    :param graph: CampusGraph 对象 (或已经编译好的 CompiledGraph)
     :param start_id: 起点ID
     :param end_id: 终点ID
     :param criterion: 'dist' (最短距离) 或 'time' (最短时间/拥挤度加权)
     :param transport: 【新增】'walk' (步行) 或 'bike' (自行车)
+    :param stats: 可选的统计字典，记录搜索确定的节点数 'settled'
     :return: (path_ids, total_cost) -> (路径节点ID列表, 总消耗)
     """
-    
-    # 1. 初始化
-    # distances: 记录从起点到各点的最小消耗，初始为无穷大
-    distances = {node_id: float('inf') for node_id in graph.spots}
-    distances[start_id] = 0
-    
-    # previous: 记录路径的前驱节点，用于最后反推路径
-    previous = {node_id: None for node_id in graph.spots}
-    
-    # priority_queue: 优先队列 (消耗, 当前节点ID)，Python的heapq默认是小顶堆
-    pq = [(0, start_id)]
-    
+    # 1. 初始化：取出编译后的 CSR 图和对应模式的权重数组
+    cg = graph.compile()
+    source = cg.index.get(start_id)
+    target = cg.index.get(end_id)
+    if source is None or target is None:
+        return [], -1
+
+    # 如果启动时预计算了全源表，直接查表 + 展开路径
+    table = cg.route_tables.get((criterion, transport))
+    if table is not None:
+        cost = table.cost(source, target)
+        if cost == float('inf'):
+            return [], -1
+        return [cg.node_ids[i] for i in table.path(source, target)], cost
+
+    # 起终点都在骨架图上时，在收缩了路点链的小图上搜索
+    sk = _on_skeleton(cg, source, target)
+    if sk is not None:
+        weights = mode_weights(sk.graph, criterion, transport)
+        s, t = sk.skel_of[source], sk.skel_of[target]
+        dist, prev = _dijkstra_core(sk.graph, weights, s, t, stats)
+        if dist[t] == float('inf'):
+            return [], -1
+        return _skeleton_ids(cg, sk, weights, _tree_path(prev, t)), dist[t]
+
+    weights = mode_weights(cg, criterion, transport)
+    dist, prev = _dijkstra_core(cg, weights, source, target, stats)
+
+    # 2. 如果终点的距离还是无穷大，说明无法到达
+    if dist[target] == float('inf'):
+        return [], -1
+
+    # 3. 路径回溯 (从终点倒着找回起点)
+    return _unroll_path(cg, prev, target), dist[target]
+
+########################################################
+# A* 搜索 (利用景点像素坐标做启发式)
+
+def heuristic_scale(cg, strategy: str, transport: str) -> float:
+    """
+    【A* 启发函数的缩放系数】
+    启发值 h(v) = scale × (v 到终点的像素直线距离)。
+    要保证 h 不高估 (可采纳) 且满足三角不等式 (一致)，scale 取所有边上
+    "权重 / 两端点直线距离" 的最小值：
+    - 'dist' 策略下，它修正了地图上 "距离" 与像素长度的比例差异；
+    - 'time' 策略下，它自动包含了 1 / SPEED_WALK 或 1 / SPEED_BIKE，
+      以及全图最小拥挤系数带来的加速，所以不同交通方式的启发值各自正确。
+    """
+    key = (strategy, transport)
+    scale = cg.heuristic_scales.get(key)
+    if scale is None:
+        scale = _weights_scale(cg, mode_weights(cg, strategy, transport))
+        cg.heuristic_scales[key] = scale
+    return scale
+
+def _weights_scale(cg, weights) -> float:
+    """min(权重 / 两端点直线距离)，即一致启发函数允许的最大缩放系数"""
+    xs, ys, targets = cg.xs, cg.ys, cg.targets
+    scale = float('inf')
+    for u in range(cg.num_nodes):
+        for k in range(cg.offsets[u], cg.offsets[u + 1]):
+            v = targets[k]
+            length = math.hypot(xs[u] - xs[v], ys[u] - ys[v])
+            if length > 0:
+                scale = min(scale, weights[k] / length)
+    if scale == float('inf'):
+        scale = 0.0  # 没有可用的边，退化成普通 Dijkstra
+    return scale
+
+def _astar_core(cg, weights, scale: float, source: int, target: int, stats: Dict = None,
+                landmarks=None, node_map=None):
+    """
+    【CSR 上的 A* 内核】
+    堆里按 f = g + h 排序；启发函数一致，所以终点第一次弹出时就是最优解。
+    :param landmarks: 可选，[(地标距离数组, 地标到终点的距离), ...] (见 landmarks 模块)，
+                      h 取直线距离下界和三角不等式下界 |d(L, t) - d(L, v)| 中最大的那个；
+                      某个地标能到终点却到不了 v，说明 v 和终点不连通，直接不扩展
+    :param node_map: 在骨架图上搜索时，骨架下标 -> 完整图下标 (地标距离按完整图下标存储)
+    :return: (dist, prev)
+    """
+    n = cg.num_nodes
+    offsets = cg.offsets
+    targets = cg.targets
+    xs, ys = cg.xs, cg.ys
+    tx, ty = xs[target], ys[target]
+    hypot = math.hypot
+    inf = float('inf')
+    landmarks = landmarks or ()
+
+    def h(v):
+        bound = scale * hypot(xs[v] - tx, ys[v] - ty)
+        i = node_map[v] if node_map is not None else v
+        for d, dt in landmarks:
+            diff = dt - d[i]
+            if diff < 0:
+                diff = -diff
+            if diff > bound:
+                bound = diff
+        return bound
+
+    dist = [inf] * n
+    prev = [-1] * n
+    closed = [False] * n
+    dist[source] = 0.0
+    pq = [(h(source), source)]
+    heappop = heapq.heappop
+    heappush = heapq.heappush
+    settled = 0
+
     while pq:
-        # 贪心策略：每次弹出当前消耗最小的节点
-        current_cost, current_node = heapq.heappop(pq)
-        
-        # 如果找到了终点，可以提前结束
-        if current_node == end_id:
+        _, u = heappop(pq)
+        if closed[u]:
+            continue
+        closed[u] = True
+        settled += 1
+        if u == target:
             break
-        
-        # 剪枝：如果当前弹出的消耗比已知的还大，说明是过期的记录，跳过
-        if current_cost > distances[current_node]:
+        g = dist[u]
+        for k in range(offsets[u], offsets[u + 1]):
+            v = targets[k]
+            new_cost = g + weights[k]
+            if new_cost < dist[v]:
+                estimate = h(v)
+                if estimate == inf:
+                    continue
+                dist[v] = new_cost
+                prev[v] = u
+                heappush(pq, (new_cost + estimate, v))
+
+    if stats is not None:
+        stats['settled'] = stats.get('settled', 0) + settled
+    return dist, prev
+
+def astar_search(graph, start_id, end_id, criterion='dist', transport='walk', stats=None):
+    """
+    A* 最短路径算法 (参数和返回值与 dijkstra_search 相同)
+    用景点的像素坐标估计剩余代价，优先朝终点方向扩展，大地图上能少确定很多节点。
+    启动时做过地标预处理 (landmarks.py) 的话，再叠加地标的三角不等式下界，
+    'time' 策略下拥挤度差别很大时也能保持很强的方向性。
+    """
+    cg = graph.compile()
+    source = cg.index.get(start_id)
+    target = cg.index.get(end_id)
+    if source is None or target is None:
+        return [], -1
+
+    distances = cg.landmarks.get(criterion, transport) if cg.landmarks is not None else None
+    landmarks = distances.select(source, target) if distances is not None else None
+
+    sk = _on_skeleton(cg, source, target)
+    if sk is not None:
+        # 骨架边的权重不小于 "缩放系数 × 两端直线距离"，骨架图自己的缩放系数同样可采纳
+        sg = sk.graph
+        weights = mode_weights(sg, criterion, transport)
+        s, t = sk.skel_of[source], sk.skel_of[target]
+        dist, prev = _astar_core(sg, weights, heuristic_scale(sg, criterion, transport), s, t, stats,
+                                 landmarks, sk.full_of)
+        if dist[t] == float('inf'):
+            return [], -1
+        return _skeleton_ids(cg, sk, weights, _tree_path(prev, t)), dist[t]
+
+    weights = mode_weights(cg, criterion, transport)
+    scale = heuristic_scale(cg, criterion, transport)
+    dist, prev = _astar_core(cg, weights, scale, source, target, stats, landmarks)
+
+    if dist[target] == float('inf'):
+        return [], -1
+    return _unroll_path(cg, prev, target), dist[target]
+
+########################################################
+# 双向 Dijkstra
+
+def bidirectional_search(graph, start_id, end_id, criterion='dist', transport='walk', stats=None):
+    """
+    双向 Dijkstra (参数和返回值与 dijkstra_search 相同)
+    从起点和终点同时向中间搜索，两边堆顶之和不小于当前最优相遇代价时停止。
+    校园路网是无向图 (正反两条有向边权重相同)，所以反向搜索直接复用同一份 CSR。
+    """
+    cg = graph.compile()
+    source = cg.index.get(start_id)
+    target = cg.index.get(end_id)
+    if source is None or target is None:
+        return [], -1
+    if source == target:
+        return [start_id], 0.0
+
+    # 起终点都在骨架图上时，两边的搜索都在骨架图上进行
+    sk = _on_skeleton(cg, source, target)
+    search = cg
+    if sk is not None:
+        search = sk.graph
+        source, target = sk.skel_of[source], sk.skel_of[target]
+
+    weights = mode_weights(search, criterion, transport)
+    n = search.num_nodes
+    offsets = search.offsets
+    targets = search.targets
+    inf = float('inf')
+    heappop = heapq.heappop
+    heappush = heapq.heappush
+
+    # 下标 0 = 正向 (从起点出发)，下标 1 = 反向 (从终点出发)
+    dist = ([inf] * n, [inf] * n)
+    prev = ([-1] * n, [-1] * n)
+    closed = ([False] * n, [False] * n)
+    dist[0][source] = 0.0
+    dist[1][target] = 0.0
+    pqs = ([(0.0, source)], [(0.0, target)])
+
+    best = inf       # 目前找到的最短相遇代价
+    meet = -1        # 相遇节点
+    settled = 0
+
+    while pqs[0] and pqs[1]:
+        # 两边堆顶之和已经不可能更优，停止
+        if pqs[0][0][0] + pqs[1][0][0] >= best:
+            break
+        # 每次扩展堆顶更小的一侧，让两边大致均衡
+        side = 0 if pqs[0][0][0] <= pqs[1][0][0] else 1
+        cost, u = heappop(pqs[side])
+        if closed[side][u]:
             continue
-            
-        # 遍历邻居 (查看 adj 邻接表)
-        # 【修改】使用 graph.adj.get(u, []) 稍微安全一点，防止报错
-        if current_node in graph.adj:
-            for road in graph.adj[current_node]:
-                neighbor = road.v
-                
-                # 【修改】这里原来的逻辑被替换了
-                # 我们调用上面新写的 helper 函数来计算权重
-                # 这样代码更清晰，逻辑完全符合 PPT 的物理公式
-                weight = get_edge_weight(road, criterion, transport)
-                
-                new_cost = current_cost + weight
-                
-                # 松弛操作 (Relaxation)：如果发现了更近的路，更新它
-                if new_cost < distances[neighbor]:
-                    distances[neighbor] = new_cost
-                    previous[neighbor] = current_node
-                    heapq.heappush(pq, (new_cost, neighbor))
-    
-    # 2. 路径回溯 (从终点倒着找回起点)
-    path = []
-    curr = end_id
-    
-    # 如果终点的距离还是无穷大，说明无法到达
-    if distances[end_id] == float('inf'):
-        return [], -1 
-        
-    while curr is not None:
+        closed[side][u] = True
+        settled += 1
+
+        my_dist, my_prev = dist[side], prev[side]
+        other_dist = dist[1 - side]
+        for k in range(offsets[u], offsets[u + 1]):
+            v = targets[k]
+            new_cost = cost + weights[k]
+            if new_cost < my_dist[v]:
+                my_dist[v] = new_cost
+                my_prev[v] = u
+                heappush(pqs[side], (new_cost, v))
+            # 检查这条边是否连起了两边的搜索
+            through = my_dist[v] + other_dist[v]
+            if through < best:
+                best = through
+                meet = v
+
+    if stats is not None:
+        stats['settled'] = stats.get('settled', 0) + settled
+    if meet == -1:
+        return [], -1
+
+    # 拼接路径：起点 -> 相遇点 (正向前驱) + 相遇点 -> 终点 (反向前驱)
+    path = _tree_path(prev[0], meet)
+    curr = prev[1][meet]
+    while curr != -1:
         path.append(curr)
-        curr = previous[curr]
-    
-    # 翻转列表，变成 起点 -> 终点
-    return path[::-1], distances[end_id]
+        curr = prev[1][curr]
+    if sk is not None:
+        return _skeleton_ids(cg, sk, weights, path), best
+    return [cg.node_ids[i] for i in path], best
+
+########################################################
+# 分时段 (时间依赖) 导航
+
+def bucket_of(cg, seconds: float) -> int:
+    """一天中的第 seconds 秒落在哪个时段 (超过 24 点自动绕回)"""
+    return int(seconds // (cg.bucket_minutes * 60)) % cg.num_buckets
+
+def bucket_weights(cg, transport: str, bucket: int) -> array:
+    """
+    【某个时段的 'time' 权重数组】
+    有分时段数据的边用该时段的拥挤度，没有的边沿用当前拥挤度。
+    和 mode_weights 一样每个时段只算一次，查询时不做任何插值。
+    """
+    key = ('time', transport, bucket)
+    weights = cg.weight_cache.get(key)
+    if weights is None:
+        if transport not in TRANSPORTS:
+            raise ValueError(f"未知的交通方式: {transport}")
+        profile = cg.profiles[bucket]
+        weights = array('d', (
+            edge_cost(d, c if p != p else p, 'time', transport)  # p != p 说明是 NaN
+            for d, c, p in zip(cg.distance, cg.crowding, profile)
+        ))
+        _restrict_transport(cg, weights, transport)
+        cg.weight_cache[key] = weights
+    return weights
+
+def _cross_buckets(all_weights, k: int, t: float, bucket_seconds: float, nb: int) -> float:
+    """
+    【跨时段通过一条边的到达时刻】
+    t 时刻驶入第 k 条有向边：在每个时段内按该时段的速度 (1 / 权重) 前进，
+    走到时段边界还没走完，剩下的部分换下一个时段的速度继续走。
+    这样 "晚出发不会早到达" (FIFO)，Dijkstra 的标号在时间依赖图上仍然正确。
+    :return: 离开这条边的时刻；在某个时段不可通行 (权重为 inf) 时返回 inf
+    """
+    remaining = 1.0  # 还没走完的比例
+    while True:
+        w = all_weights[int(t // bucket_seconds) % nb][k]
+        if w == float('inf'):
+            return w
+        left = bucket_seconds - t % bucket_seconds
+        if remaining * w <= left:
+            return t + remaining * w
+        remaining -= left / w
+        t += left
+
+def time_dependent_search(graph, start_id, end_id, depart_seconds: float, transport='walk',
+                          use_heuristic=True, stats=None):
+    """
+    【时间依赖的最短时间导航】
+    从 depart_seconds (当天第几秒) 出发，按驶入每条路的时刻所在时段的速度计算通过时间，
+    所以 11:50 出发时会自动避开午饭高峰拥堵的路段。
+    - 各时段的权重数组是预先算好的；一条路在当前时段内就能走完时，松弛只多一次比较
+    - 跨过时段边界的路按各时段的速度分段计算 (_cross_buckets)，满足 FIFO，结果是精确最短时间
+    - use_heuristic=True 时用 A* (缩放系数取所有时段中最小的那个，保证可采纳)
+    地图没有分时段数据时，等价于普通的 'time' 策略查询。
+    :return: (path_ids, total_cost)，total_cost 是耗时 (秒)
+    """
+    cg = graph.compile()
+    if cg.profiles is None:
+        search = astar_search if use_heuristic else dijkstra_search
+        return search(cg, start_id, end_id, 'time', transport, stats)
+
+    source = cg.index.get(start_id)
+    target = cg.index.get(end_id)
+    if source is None or target is None:
+        return [], -1
+
+    nb = cg.num_buckets
+    all_weights = [bucket_weights(cg, transport, b) for b in range(nb)]
+    bucket_seconds = cg.bucket_minutes * 60
+
+    scale = 0.0
+    if use_heuristic:
+        key = ('td', transport)
+        scale = cg.heuristic_scales.get(key)
+        if scale is None:
+            scale = min(_weights_scale(cg, w) for w in all_weights)
+            cg.heuristic_scales[key] = scale
+
+    n = cg.num_nodes
+    offsets, targets = cg.offsets, cg.targets
+    xs, ys = cg.xs, cg.ys
+    tx, ty = xs[target], ys[target]
+    hypot = math.hypot
+    inf = float('inf')
+
+    dist = [inf] * n
+    prev = [-1] * n
+    closed = [False] * n
+    dist[source] = 0.0
+    pq = [(scale * hypot(xs[source] - tx, ys[source] - ty), source)]
+    settled = 0
+
+    while pq:
+        _, u = heapq.heappop(pq)
+        if closed[u]:
+            continue
+        closed[u] = True
+        settled += 1
+        if u == target:
+            break
+        g = dist[u]
+        # 到达 u 的时刻所在时段，以及这个时段还剩多少秒
+        now = depart_seconds + g
+        weights = all_weights[int(now // bucket_seconds) % nb]
+        left = bucket_seconds - now % bucket_seconds
+        for k in range(offsets[u], offsets[u + 1]):
+            v = targets[k]
+            w = weights[k]
+            if w <= left:
+                new_cost = g + w
+            else:
+                new_cost = _cross_buckets(all_weights, k, now, bucket_seconds, nb) - depart_seconds
+            if new_cost < dist[v]:
+                dist[v] = new_cost
+                prev[v] = u
+                heapq.heappush(pq, (new_cost + scale * hypot(xs[v] - tx, ys[v] - ty), v))
+
+    if stats is not None:
+        stats['settled'] = stats.get('settled', 0) + settled
+    if dist[target] == inf:
+        return [], -1
+    return _unroll_path(cg, prev, target), dist[target]
+
+########################################################
+# 收缩层次 (CH) 查询
+
+def ch_search(graph, start_id, end_id, criterion='dist', transport='walk', stats=None):
+    """
+    基于收缩层次的查询 (参数和返回值与 dijkstra_search 相同)
+    需要先离线运行 contraction.py 并在启动时加载；
+    当前地图版本没有可用的预处理数据时，自动回退到 dijkstra_search。
+    """
+    cg = graph.compile()
+    ch = cg.contraction.get((criterion, transport))
+    if ch is None:
+        return dijkstra_search(cg, start_id, end_id, criterion, transport, stats)
+
+    source = cg.index.get(start_id)
+    target = cg.index.get(end_id)
+    if source is None or target is None:
+        return [], -1
+
+    path, cost = ch.query(source, target, stats)
+    if not path:
+        return [], -1
+    return [cg.node_ids[i] for i in path], cost
+
+# 导航接口可选的搜索算法
+SEARCH_ALGORITHMS = {
+    'dijkstra': dijkstra_search,
+    'astar': astar_search,
+    'bidirectional': bidirectional_search,
+    'ch': ch_search,
+}
+
+########################################################
+# 批量点对查询 (按起点分组)
+
+def check_deadline(deadline: Optional[float]):
+    """
+    到了截止时刻 (time.time()) 就抛 TimeoutError
+    给没有 "当前最好结果" 可返回的计算 (代价矩阵、批量导航) 用：
+    在进程池里超时的请求已经返回 504，子进程在下一个检查点停下，不再空算
+    """
+    if deadline is not None and time.time() > deadline:
+        raise TimeoutError("超过截止时刻")
+
+def batch_routes(graph, pairs: List[Tuple[int, int]], strategy: str = 'dist',
+                 transport: str = 'walk', stats: Dict = None,
+                 deadline: Optional[float] = None) -> List[Tuple[List[int], float]]:
+    """
+    【批量导航】
+    一次回答很多个 (起点, 终点) 查询：先按起点分组，每个不同的起点只做一次
+    "一对多" Dijkstra (它的所有终点都确定后就停)，再从同一棵搜索树上回溯出各条路径。
+    N 个查询的搜索次数从 N 降到 "不同起点的个数"；有全源表时直接查表。
+    :param deadline: 截止时刻 (time.time())，每个起点搜索之前检查，到点抛 TimeoutError
+    :return: 与 pairs 一一对应的 [(path_ids, total_cost), ...]，不可达时为 ([], -1)
+    """
+    cg = graph.compile()
+    results: List[Tuple[List[int], float]] = [([], -1)] * len(pairs)
+
+    # 1. 按起点下标分组: {source: [(结果位置, target), ...]}
+    groups: Dict[int, List[Tuple[int, int]]] = {}
+    for pos, (start_id, end_id) in enumerate(pairs):
+        source = cg.index.get(start_id)
+        target = cg.index.get(end_id)
+        if source is None or target is None:
+            continue
+        groups.setdefault(source, []).append((pos, target))
+
+    table = cg.route_tables.get((strategy, transport))
+    weights = mode_weights(cg, strategy, transport)
+    inf = float('inf')
+
+    # 2. 每个起点一次搜索
+    for source, items in groups.items():
+        check_deadline(deadline)
+        if table is not None:
+            for pos, target in items:
+                cost = table.cost(source, target)
+                if cost != inf:
+                    results[pos] = ([cg.node_ids[i] for i in table.path(source, target)], cost)
+            continue
+
+        sk = _on_skeleton(cg, source, *(t for _, t in items))
+        if sk is not None:
+            sk_weights = mode_weights(sk.graph, strategy, transport)
+            skel_of = sk.skel_of
+            dist, prev = _dijkstra_core(sk.graph, sk_weights, skel_of[source], stats=stats,
+                                        targets=[skel_of[t] for _, t in items])
+            for pos, target in items:
+                t = skel_of[target]
+                if dist[t] != inf:
+                    results[pos] = (_skeleton_ids(cg, sk, sk_weights, _tree_path(prev, t)), dist[t])
+            continue
+
+        dist, prev = _dijkstra_core(cg, weights, source, stats=stats,
+                                    targets=[t for _, t in items])
+        for pos, target in items:
+            if dist[target] != inf:
+                results[pos] = (_unroll_path(cg, prev, target), dist[target])
+
+    return results
+
+########################################################
+# k 条备选路线 (Yen 算法)
+
+# 备选路线和已选路线的最大相似度 (重合路段消耗 / 备选路线总消耗)，超过就认为 "差不多是同一条路"
+ALTERNATIVE_MAX_SIMILARITY = 0.8
+
+# 最多检查多少条候选路线 (相似度过滤会丢弃一部分，防止在近似重复的路线上一直打转)
+ALTERNATIVE_MAX_CANDIDATES = 10
+
+def _spur_core(cg, weights, to_target, source: int, target: int, banned_nodes, banned_next,
+               stats: Dict = None):
+    """
+    【Yen 算法的偏离路径搜索】
+    用 "到终点的精确距离" (反向最短路径树) 作启发值的 A*：
+    删掉一些点和边只会让真实距离变长，所以启发值仍然可采纳且一致，
+    没被删到的部分几乎是沿着原最短路径直线走过去，只会确定很少的节点。
+    :param banned_nodes: 不能经过的节点 (根路径上的点)
+    :param banned_next:  从 source 出发不能走的下一个节点 (已有路线在这里走过的分支)
+    :return: (节点下标列表, 消耗)，走不通返回 None
+    """
+    offsets, targets = cg.offsets, cg.targets
+    inf = float('inf')
+    dist = {source: 0.0}
+    prev = {source: -1}
+    closed = set()
+    pq = [(to_target[source], 0.0, source)]
+    settled = 0
+
+    while pq:
+        _, g, u = heapq.heappop(pq)
+        if u in closed:
+            continue
+        closed.add(u)
+        settled += 1
+        if u == target:
+            break
+        for k in range(offsets[u], offsets[u + 1]):
+            v = targets[k]
+            h = to_target[v]
+            if h == inf or v in banned_nodes or (u == source and v in banned_next):
+                continue
+            new_cost = g + weights[k]
+            if new_cost < dist.get(v, inf):
+                dist[v] = new_cost
+                prev[v] = u
+                heapq.heappush(pq, (new_cost + h, new_cost, v))
+
+    if stats is not None:
+        stats['settled'] = stats.get('settled', 0) + settled
+    if target not in closed:
+        return None
+    path = []
+    u = target
+    while u != -1:
+        path.append(u)
+        u = prev[u]
+    return path[::-1], dist[target]
+
+def _step_costs(cg, weights, path: List[int]) -> List[float]:
+    """路径上每一步的消耗 (两点之间有多条路时取最便宜的)"""
+    costs = []
+    for a, b in zip(path, path[1:]):
+        costs.append(min(weights[k] for k in range(cg.offsets[a], cg.offsets[a + 1])
+                         if cg.targets[k] == b))
+    return costs
+
+def _route_similarity(steps: Dict[tuple, float], cost: float, other: Dict[tuple, float]) -> float:
+    """备选路线和另一条路线的相似度：重合路段的消耗占备选路线总消耗的比例"""
+    if cost <= 0:
+        return 1.0
+    shared = sum(w for pair, w in steps.items() if pair in other)
+    return shared / cost
+
+def k_shortest_paths(graph, start_id, end_id, k: int = 3, strategy: str = 'dist', transport: str = 'walk',
+                     max_similarity: float = ALTERNATIVE_MAX_SIMILARITY, target_tree=None,
+                     stats: Dict = None, deadline: Optional[float] = None) -> List[Tuple[List[int], float]]:
+    """
+    【k 条无环备选路线】(Yen 算法 + 相似度过滤)
+    - 先从终点算一棵反向最短路径树 (路网是无向的，正反权重相同)，第一条路线直接沿树展开，
+      之后所有偏离路径搜索都用它作 A* 的精确启发值，而不是每次从头跑 dijkstra_search
+    - 和已选路线太相似 (相似度 > max_similarity) 的候选会被跳过
+    :param target_tree: 可选，以终点为根的最短路径树 (dist, prev)，比如路径缓存里已有的那棵
+    :param deadline: 截止时刻 (time.time())，到点后只返回已经找到的路线
+    :return: [(path_ids, cost), ...]，按消耗从小到大，最多 k 条
+    """
+    cg = graph.compile()
+    source = cg.index.get(start_id)
+    target = cg.index.get(end_id)
+    if source is None or target is None or k <= 0:
+        return []
+    if source == target:
+        return [([start_id], 0.0)]
+
+    weights = mode_weights(cg, strategy, transport)
+    if target_tree is None:
+        target_tree = _dijkstra_core(cg, weights, target, stats=stats)
+    to_target, toward = target_tree
+    if to_target[source] == float('inf'):
+        return []
+
+    # 第一条路线：沿反向树的前驱一路走到终点
+    first = [source]
+    while first[-1] != target:
+        first.append(toward[first[-1]])
+
+    def make_route(path):
+        steps = _step_costs(cg, weights, path)
+        prefix = [0.0]
+        for w in steps:
+            prefix.append(prefix[-1] + w)
+        pairs = {}
+        for (a, b), w in zip(zip(path, path[1:]), steps):
+            pair = (a, b) if a < b else (b, a)
+            pairs[pair] = pairs.get(pair, 0.0) + w
+        return path, prefix, pairs
+
+    examined = [make_route(first)]     # 已经从候选堆里取出的路线 (Yen 算法的 A 列表)
+    accepted = [examined[0]]           # 通过相似度过滤、最终返回的路线
+    candidates = []                    # 候选堆 (Yen 算法的 B 列表)
+    seen = {tuple(first)}
+
+    while len(accepted) < k and len(examined) < ALTERNATIVE_MAX_CANDIDATES:
+        if deadline is not None and time.time() > deadline:
+            break
+        # 以最新取出的路线为基础，在每个节点处尝试偏离
+        path, prefix, _ = examined[-1]
+        for i in range(len(path) - 1):
+            root = path[:i + 1]
+            banned_next = {p[i + 1] for p, _, _ in examined if len(p) > i + 1 and p[:i + 1] == root}
+            spur = _spur_core(cg, weights, to_target, path[i], target, set(root[:-1]), banned_next, stats)
+            if spur is None:
+                continue
+            candidate = root[:-1] + spur[0]
+            key = tuple(candidate)
+            if key not in seen:
+                seen.add(key)
+                heapq.heappush(candidates, (prefix[i] + spur[1], candidate))
+
+        if not candidates:
+            break
+        _, best = heapq.heappop(candidates)
+        route = make_route(best)
+        examined.append(route)
+        cost = route[1][-1]
+        if all(_route_similarity(route[2], cost, other[2]) <= max_similarity for other in accepted):
+            accepted.append(route)
+
+    node_ids = cg.node_ids
+    return [([node_ids[i] for i in path], prefix[-1]) for path, prefix, _ in accepted]
+
+########################################################
+# 最近设施查询 (一次多目标搜索)
+
+def nearest_targets(graph, start_id, candidate_ids: List[int], k: int = 1, strategy: str = 'dist',
+                    transport: str = 'walk', stats: Dict = None) -> List[Tuple[int, List[int], float]]:
+    """
+    【最近设施】"带我去最近的食堂"
+    从起点做一次 Dijkstra，所有候选点都是目标，确定了最近的 k 个就立即停止，
+    代替对每个候选点分别搜索一次。
+    :return: [(候选点ID, 路径ID列表, 消耗), ...]，按消耗从小到大，不可达的候选点不返回
+    """
+    cg = graph.compile()
+    source = cg.index.get(start_id)
+    if source is None or k <= 0:
+        return []
+    candidates = {cg.index[c] for c in candidate_ids if c in cg.index}
+    if not candidates:
+        return []
+
+    weights = mode_weights(cg, strategy, transport)
+    dist, prev = _dijkstra_core(cg, weights, source, stats=stats, targets=candidates, stop_after=k)
+
+    reached = sorted((dist[c], c) for c in candidates if dist[c] != float('inf'))
+    results = []
+    for cost, c in reached[:k]:
+        results.append((cg.node_ids[c], _unroll_path(cg, prev, c), cost))
+    return results
+
+########################################################
+# 等时圈 / 可达范围 (有预算上限的 Dijkstra)
+
+def reachable_within(graph, start_id, budget: float, strategy: str = 'dist',
+                     transport: str = 'walk', tree_dist=None, stats: Dict = None):
+    """
+    【可达范围查询】"从这里骑车 5 分钟能到哪些地方"
+    只扩展消耗不超过 budget 的节点，堆顶超过预算就立即停止，不会遍历整张图。
+    :param tree_dist: 可选，起点的完整最短路径树 dist 数组 (来自缓存)，有的话直接筛选，不再搜索
+    :return: (reached, frontier)
+        reached:  {节点下标: 消耗}，所有预算内可达的节点
+        frontier: [(u, v, fraction), ...]，从可达节点 u 出发、走不完的边 u -> v，
+                  fraction 是预算内能走完的比例 (0~1)，供前端画出部分可达的路段
+    """
+    cg = graph.compile()
+    source = cg.index.get(start_id)
+    if source is None:
+        return {}, []
+    weights = mode_weights(cg, strategy, transport)
+    offsets, targets = cg.offsets, cg.targets
+
+    if tree_dist is not None:
+        reached = {i: d for i, d in enumerate(tree_dist) if d <= budget}
+    else:
+        # 用字典存距离，只为真正碰到的节点分配空间
+        dist = {source: 0.0}
+        reached = {}
+        pq = [(0.0, source)]
+        while pq:
+            cost, u = heapq.heappop(pq)
+            if cost > budget:
+                break
+            if u in reached:
+                continue
+            reached[u] = cost
+            for k in range(offsets[u], offsets[u + 1]):
+                v = targets[k]
+                new_cost = cost + weights[k]
+                if new_cost <= budget and new_cost < dist.get(v, float('inf')):
+                    dist[v] = new_cost
+                    heapq.heappush(pq, (new_cost, v))
+        if stats is not None:
+            stats['settled'] = stats.get('settled', 0) + len(reached)
+
+    # 边界上只能走一部分的边
+    frontier = []
+    for u, cost in reached.items():
+        for k in range(offsets[u], offsets[u + 1]):
+            w = weights[k]
+            if cost + w > budget and 0 < w < float('inf'):
+                frontier.append((u, targets[k], (budget - cost) / w))
+    return reached, frontier
 
 # ==========================================
-# 2. 新增：多点路径规划 (TSP 近似)
+# 2. 新增：多点路径规划 (代价矩阵 + TSP 求解)
 # ==========================================
+def build_cost_matrix(cg, nodes: List[int], strategy: str, transport: str,
+                      algorithm: str = 'dijkstra', num_sources: int = None, stats: Dict = None,
+                      weights=None, deadline: Optional[float] = None):
+    """
+    【构建两两代价矩阵】
+    :param nodes: 节点下标列表 (起点、途经点、终点)
+    :param num_sources: 只需要从前几个节点出发 (固定终点不需要再出发)，默认全部
+    :param weights: 指定权重数组 (例如某个时段的权重)，此时不使用全源表和收缩层次
+    :param deadline: 截止时刻 (time.time())，每个出发点搜索之前检查，到点抛 TimeoutError
+    :return: (matrix, leg)，matrix[i][j] 是 nodes[i] -> nodes[j] 的最小消耗，
+             leg(i, j) 返回这一段的节点下标路径
+    三种来源，按代价从低到高选择：
+    1. 启动时建好的全源表：直接查表
+    2. algorithm='ch' 且有收缩层次：两两做 CH 点对点查询
+    3. 否则每个出发点做一次 "一对多" Dijkstra，所有目标确定后就停
+       (所有点都在骨架图上时在骨架图上搜索，leg 返回展开后的完整路径)
+    """
+    k = len(nodes)
+    if num_sources is None:
+        num_sources = k
+    key = (strategy, transport)
+    inf = float('inf')
+
+    table = cg.route_tables.get(key) if weights is None else None
+    if table is not None:
+        matrix = [[table.cost(a, b) for b in nodes] for a in nodes]
+        return matrix, lambda i, j: table.path(nodes[i], nodes[j])
+
+    ch = cg.contraction.get(key) if algorithm == 'ch' and weights is None else None
+    if ch is not None:
+        matrix = [[inf] * k for _ in range(k)]
+        paths = {}
+        for i in range(k):
+            check_deadline(deadline)
+            for j in range(k):
+                if i >= num_sources and j >= num_sources:
+                    continue
+                if (j, i) in paths:
+                    # 无向图：反方向直接复用
+                    matrix[i][j] = matrix[j][i]
+                    paths[(i, j)] = paths[(j, i)][::-1]
+                    continue
+                path, cost = ch.query(nodes[i], nodes[j], stats)
+                matrix[i][j] = cost
+                paths[(i, j)] = path
+        return matrix, lambda i, j: paths[(i, j)]
+
+    sk = _on_skeleton(cg, *nodes) if weights is None else None
+    search, search_nodes = cg, nodes
+    if sk is not None:
+        search, search_nodes = sk.graph, [sk.skel_of[i] for i in nodes]
+    if weights is None:
+        weights = mode_weights(search, strategy, transport)
+    matrix = []
+    trees = []
+    for a in search_nodes[:num_sources]:
+        check_deadline(deadline)
+        dist, prev = _dijkstra_core(search, weights, a, stats=stats, targets=search_nodes)
+        matrix.append([dist[b] for b in search_nodes])
+        trees.append(prev)
+    for _ in range(num_sources, k):
+        matrix.append([inf] * k)
+    if sk is not None:
+        return matrix, lambda i, j: sk.expand(_tree_path(trees[i], search_nodes[j]), weights)
+    return matrix, lambda i, j: _tree_path(trees[i], nodes[j])
+
 def plan_multi_point_route(
     graph,
     start_id: int,
     via_spots: List[int],
     strategy: str = 'dist',
-    transport: str = 'walk'
+    transport: str = 'walk',
+    algorithm: str = 'dijkstra',
+    end_id: Optional[int] = None,
+    depart_seconds: Optional[float] = None,
+    stats: Dict = None,
+    deadline: Optional[float] = None
 ) -> Tuple[List[int], float]:
     """
     【核心算法：多点路径规划】
     PPT 要求：规划从当前位置出发，参观多个景点 (最后不一定返回，按PPT语境通常是游览完即可)。
-    算法策略：贪心算法 (Nearest Neighbor) - 每次找离当前最近的下一个点。
+    算法策略：
+    1. 起点和每个途经点各做一次 "一对多" 搜索，得到两两代价矩阵 (k 个途经点只需 k+1 次搜索)
+    2. 途经点少时用 Held-Karp 求精确最优顺序，多了用最近邻 + 2-opt / Or-opt 局部优化
+    3. 如果给了 end_id，终点固定在最后 (end_id 等于起点时就是回到出发地的环线)
+    4. 'time' 策略给了出发时刻 depart_seconds 且地图有分时段拥挤度时，整段游览按出发时段的权重规划
+    :param stats: 可选的统计字典，记录构建代价矩阵时搜索确定的节点数 'settled'
+    :param deadline: 截止时刻 (time.time())，局部搜索到点后返回当前最好的访问顺序；
+                     代价矩阵还没建完就到点时抛 TimeoutError
     """
-    full_path = []
+    # 只编译一次，所有搜索都在同一份 CSR 图上进行
+    cg = graph.compile()
+    source = cg.index.get(start_id)
+    if source is None:
+        return [], -1
+    end = None
+    if end_id is not None:
+        end = cg.index.get(end_id)
+        if end is None:
+            return [], -1
+
+    # 待访问的点 (去重并保持顺序)，起点 / 终点本身不算途经点，避免原地打转
+    vias = []
+    for vid in via_spots:
+        i = cg.index.get(vid)
+        if i is None or i == source or i == end or i in vias:
+            continue
+        vias.append(i)
+
+    nodes = [source] + vias + ([end] if end is not None else [])
+    num_sources = len(nodes) - 1 if end is not None else len(nodes)
+    weights = None
+    if depart_seconds is not None and strategy == 'time' and cg.profiles is not None:
+        weights = bucket_weights(cg, transport, bucket_of(cg, depart_seconds))
+    matrix, leg = build_cost_matrix(cg, nodes, strategy, transport, algorithm, num_sources,
+                                    stats=stats, weights=weights, deadline=deadline)
+
+    # 从起点到不了的途经点 (比如孤岛) 直接跳过；到不了终点则规划失败
+    inf = float('inf')
+    keep = [i for i in range(1, len(vias) + 1) if matrix[0][i] != inf]
+    picked = [0] + keep
+    if end is not None:
+        if matrix[0][len(nodes) - 1] == inf:
+            return [], -1
+        picked.append(len(nodes) - 1)
+    sub = [[matrix[a][b] for b in picked] for a in picked]
+
+    k = len(keep)
+    end_pos = k + 1 if end is not None else None
+    order = solve_visit_order(sub, k, end_pos, deadline)
+    sequence = [0] + order + ([end_pos] if end_pos is not None else [])
+
+    # 按访问顺序把每一段路径拼起来 (每段第一个点已经在 full_path 末尾了，所以从 [1:] 开始拼)
+    full_path = [start_id]
     total_cost = 0.0
-    
-    current_node = start_id
-    # 待访问的点集合 (去重)
-    to_visit = set(via_spots)
-    
-    # 如果起点也在待访问列表中，先移除，避免原地打转
-    if current_node in to_visit:
-        to_visit.remove(current_node)
-        
-    # 记录路径起点
-    full_path.append(current_node)
-    
-    # 循环直到所有点都去过
-    while to_visit:
-        best_next_node = None
-        min_segment_cost = float('inf')
-        best_segment_path = []
-        
-        # 1. 从当前点出发，计算到所有“剩下没去的点”的代价，找最近的那个
-        for target in to_visit:
-            # 调用基础导航算两点间路径
-            path, cost = dijkstra_search(graph, current_node, target, strategy, transport)
-            
-            # 如果能到达，且代价更小，就选它
-            if cost != -1 and cost < min_segment_cost:
-                min_segment_cost = cost
-                best_next_node = target
-                best_segment_path = path
-        
-        # 如果找不到下一个可达的点 (比如孤岛)，强行结束
-        if best_next_node is None:
-            break
-            
-        # 2. 更新状态
-        total_cost += min_segment_cost
-        # 拼接路径 (best_segment_path[0] 是起点，已经在 full_path 末尾了，所以从 [1:] 开始拼)
-        full_path.extend(best_segment_path[1:])
-        
-        # 3. 移动到下个点
-        current_node = best_next_node
-        to_visit.remove(current_node)
-        
-    return full_path, total_cost
\ No newline at end of file
+    for a, b in zip(sequence, sequence[1:]):
+        total_cost += sub[a][b]
+        segment = leg(picked[a], picked[b])
+        full_path.extend(cg.node_ids[i] for i in segment[1:])
+
+    return full_path, total_cost
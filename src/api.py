@@ -1,28 +1,98 @@
 import sys
 import os
+import math
+import threading
+import json
 # 把当前文件所在的目录 (src) 加入到 Python 查找路径中，这样就能找到 auth, diary 等模块了
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Depends, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Literal, Optional
+from datetime import time
 from contextlib import asynccontextmanager
-from thefuzz import process  # 用于模糊搜索
+from functools import partial
 # 导入我们自己写的模块
 import auth               # 身份认证模块
 import diary              # 日记模块 (刚才写的)
-from models import CampusGraph
-# 从 algorithms 导入两个核心函数
-from algorithms import dijkstra_search, plan_multi_point_route
-from utils import load_graph_from_json, get_data_path
+from models import CampusGraph, User
+# 从 algorithms 导入核心函数
+from algorithms import (SEARCH_ALGORITHMS, ALTERNATIVE_MAX_SIMILARITY, batch_routes,
+                        nearest_targets, reachable_within)
+from utils import load_graph, get_data_path
+from route_table import build_route_tables  # 全源最短路表 (可选加速)
+from contraction import load_contraction_hierarchies  # 收缩层次 (大地图加速)
+from landmarks import build_landmarks  # 地标距离 (A* 下界)
+from road_chains import contract_road_chains  # 路点链收缩 (骨架图)
+from route_cache import route_cache  # 路径 LRU 缓存
+from map_reload import MapWatcher, validate_graph  # 地图热更新
+from payload_cache import PreparedPayload, payload_cache  # 预序列化的 /graph、/spots/list 响应
+from route_encoding import GEOMETRY_FORMATS, MAX_COORD_PRECISION, compact_route  # 紧凑路线格式
+from route_pool import route_pool, RouteTimeout, HEAVY_VIA_COUNT, HEAVY_BATCH_PAIRS  # 重请求进程池
+from sightseeing import plan_sightseeing_tour, warm_spot_matrices, TOUR_TRANSPORTS  # 限时游览推荐
+from derived_rebuild import derived_rebuilder  # 拥挤度变化后在后台重建 'time' 派生数据
 import upload # 文件上传模块
 import ai     # AI 助手模块
 # 导入数据库初始化函数
-from database import init_db 
+from database import init_db, get_session
+from sqlmodel import Session
 
 # 全局变量：用来在内存里存地图数据
+# 热更新时整体替换这个引用，每个请求开头先把它取到局部变量里，保证一次请求只用同一个版本
 global_graph: Optional[CampusGraph] = None
+map_version = 0                     # 地图版本号，每次加载 / 热更新成功 +1
+reload_lock = threading.Lock()      # 同一时间只允许一次重新加载
+map_watcher: Optional[MapWatcher] = None
+
+def prepare_graph(path: str) -> CampusGraph:
+    """加载并校验地图，预计算派生数据 (全源表、收缩层次、骨架图、地标)，全部在上线之前完成"""
+    # 优先使用二进制快照 (mmap 零拷贝)，快照过期时自动回退到 JSON
+    graph = load_graph(path)
+    problems = validate_graph(graph)
+    if problems:
+        raise ValueError("地图校验失败: " + "；".join(problems[:5]))
+    # 小地图直接预计算全源路径表，/navigate 之后只需查表
+    build_route_tables(graph)
+    # 如果离线做过收缩层次预处理 (campus_map.ch.json)，顺便加载
+    load_contraction_hierarchies(graph, path)
+    # 只起拐弯作用的路点链收缩成骨架边，单点导航 / 多点规划在小得多的骨架图上搜索
+    contract_road_chains(graph)
+    # 地标距离 (A* 的下界，建不起全源表的中等规模地图主要靠它加速)
+    build_landmarks(graph)
+    # 限时游览推荐用的景点代价矩阵 (每种交通方式的最短时间)
+    warm_spot_matrices(graph)
+    # 前端每次打开页面都要拉 /graph 和 /spots/list，上线前先把响应生成好
+    graph_payload(graph)
+    spots_list_payload(graph)
+    # 景点名称索引 (输入框联想搜索用)
+    graph.name_index()
+    return graph
+
+def reload_map(path: Optional[str] = None) -> bool:
+    """
+    【地图热更新】在当前线程构建新地图，成功后原子替换 global_graph
+    旧地图在构建期间照常服务；已经有一次重新加载在进行时直接返回 False。
+    """
+    global global_graph, map_version
+    if not reload_lock.acquire(blocking=False):
+        return False
+    try:
+        path = path or get_data_path()
+        graph = prepare_graph(path)
+        # 进程池先切到新地图 (期间旧地图的重请求在当前线程计算)，再换全局引用
+        try:
+            route_pool.start(graph, path)
+        except Exception as e:
+            print(f"⚠️ 路线进程池启动失败，重请求将在当前线程计算: {e}")
+        global_graph = graph
+        map_version += 1
+        # 路径缓存立即对齐到新地图 (旧条目全部作废)
+        route_cache.sync(graph)
+        print(f"🔁 地图已热更新到版本 {map_version}: {len(graph.spots)} 个节点")
+    finally:
+        reload_lock.release()
+    return True
 
 # --- 生命周期管理器 ---
 @asynccontextmanager
@@ -36,17 +106,30 @@ async def lifespan(app: FastAPI):
     print("✅ 数据库表检查完毕！")
 
     # 加载地图数据
-    global global_graph
+    global global_graph, map_version, map_watcher
+    path = get_data_path()
     try:
-        path = get_data_path()
-        global_graph = load_graph_from_json(path)
+        global_graph = prepare_graph(path)
+        map_version = 1
         print(f"✅ 地图加载成功，包含 {len(global_graph.spots)} 个景点")
     except Exception as e:
         print(f"❌ 地图加载失败: {e}")
+    else:
+        # 途经点很多的游览路线等重请求交给子进程，不拖慢同一个 worker 里的其它请求
+        try:
+            route_pool.start(global_graph, path)
+        except Exception as e:
+            print(f"⚠️ 路线进程池启动失败，重请求将在当前线程计算: {e}")
+
+    # 地图文件被修改后自动热更新
+    map_watcher = MapWatcher(path, reload_map)
+    map_watcher.start()
     
     yield  # 程序在这里暂停，等待用户请求...
     
     # 【关闭阶段】
+    map_watcher.stop()
+    route_pool.stop()
     print("🛑 服务已关闭")
 
 # --- 创建 APP ---
@@ -77,63 +160,145 @@ app.include_router(ai.router)     # AI 助手
 # 【新增】地图查询接口
 # 1. 获取所有景点 (用于前端下拉框)
 @app.get("/spots/list")
-def get_all_spots():
-    if not global_graph:
+def get_all_spots(request: Request):
+    graph = global_graph
+    if not graph:
         return []
+    # 每个地图版本只生成一次，之后直接返回序列化 / 压缩好的字节 (支持 ETag 304)
+    return spots_list_payload(graph).response(request)
+
+def spots_list_payload(graph: CampusGraph) -> PreparedPayload:
     # 只返回 type='spot' 的景点，不返回路点
-    return [spot for spot in global_graph.spots.values() if spot.type == 'spot']
+    return payload_cache.get(
+        "spots_list", graph, graph.topology_version,
+        lambda: [r for r in graph.spot_records() if r["type"] == 'spot']
+    )
 
 # 2. 模糊搜索 (解决输入不准的问题)
 @app.get("/spots/search")
 def search_spots(query: str, limit: int = 5):
     """
     输入 "食堂" -> 返回 [{"name": "学生食堂", ...}, ...]
+    名称索引在加载地图时建好：先用 n-gram / 前缀挑出候选，只对候选做模糊打分，热门查询走缓存
     """
-    if not global_graph:
+    graph = global_graph
+    if not graph:
         return []
 
-    # 1. 拿到所有景点名字 map: {"学生食堂": 44, "教工食堂": 19}
-    spot_map = {s.name: s.id for s in global_graph.spots.values() if s.type == 'spot'}
-    
-    if not spot_map:
-        return []
-
-    # 2. 模糊匹配
-    matches = process.extract(query, spot_map.keys(), limit=limit)
-    
     results = []
-    for name, score in matches:
-        if score > 40:  # 匹配度大于 40 分才显示
-            spot_id = spot_map[name]
-            spot_obj = global_graph.spots[spot_id]
-            results.append({
-                "id": spot_id,
-                "name": name,
-                "score": score,
-                "x": spot_obj.x, # 把坐标也带上，方便前端定位
-                "y": spot_obj.y
-            })
+    for spot_id, name, score in graph.name_index().search(query, limit):
+        spot_obj = graph.spots[spot_id]
+        results.append({
+            "id": spot_id,
+            "name": name,
+            "score": score,
+            "x": spot_obj.x, # 把坐标也带上，方便前端定位
+            "y": spot_obj.y
+        })
             
     return results
 
+# 3. 按坐标找附近的点 (前端在地图上点击时用)
+def spot_payload(spot, distance: float) -> dict:
+    return {"id": spot.id, "name": spot.name, "type": spot.type,
+            "x": spot.x, "y": spot.y, "distance": round(distance, 1)}
+
+@app.get("/spots/nearest")
+def nearest_spots(x: float, y: float, k: int = 5, radius: Optional[float] = None):
+    """
+    返回离像素坐标 (x, y) 最近的 k 个节点；
+    指定 radius 时改为返回半径内的所有节点 (最多 k 个)
+    """
+    graph = global_graph
+    if not graph:
+        return []
+    index = graph.spatial_index()
+    if radius is not None:
+        found = index.nodes_within(x, y, radius)[:k]
+    else:
+        found = index.nearest_nodes(x, y, k)
+    cg = graph.compile()
+    return [spot_payload(graph.spots[cg.node_ids[i]], d) for i, d in found]
+
+@app.get("/spots/snap")
+def snap_to_map(x: float, y: float):
+    """
+    把地图上的任意点击吸附到最近的节点或道路上
+    - spot:     路线规划时使用的节点
+    - on_edge:  吸附点在道路中间时给出 [u, v]，否则为 null
+    - x / y:    吸附后的坐标
+    """
+    graph = global_graph
+    if not graph:
+        raise HTTPException(status_code=500, detail="地图未初始化")
+    snap = graph.spatial_index().snap(x, y)
+    if snap is None:
+        raise HTTPException(status_code=404, detail="地图上没有任何节点")
+    cg = graph.compile()
+    spot = graph.spots[cg.node_ids[snap.node]]
+    on_edge = None
+    if snap.u != snap.v:
+        on_edge = [cg.node_ids[snap.u], cg.node_ids[snap.v]]
+    return {
+        "spot": spot_payload(spot, math.hypot(spot.x - x, spot.y - y)),
+        "on_edge": on_edge,
+        "fraction": round(snap.fraction, 3),
+        "x": snap.x,
+        "y": snap.y,
+        "distance": round(snap.distance, 1)
+    }
+
 # --- 定义导航请求的数据格式 ---
+class MapPoint(BaseModel):
+    """地图上的像素坐标 (map.png 上的位置)"""
+    x: float
+    y: float
+
 # 【修改】导航请求模型
 # 对应 PPT 需求：
 # 1. 途经多点 [cite: 120] -> via_ids
 # 2. 交通工具 [cite: 127] -> transport
 class NavigateRequest(BaseModel):
-    start_id: int
+    # 起点可以是景点ID，也可以是地图上的任意坐标 (start_point，会自动吸附到最近的节点)
+    start_id: Optional[int] = None
+    start_point: Optional[MapPoint] = None
     # end_id 变为可选，因为如果是多点规划，可能只需提供 via_ids
     end_id: Optional[int] = None    
+    end_point: Optional[MapPoint] = None
     
     # 【新增】途经点列表 (多点规划用)
     via_ids: List[int] = []         
     
     # 【新增】策略: 'dist'=最短距离, 'time'=最短时间(含拥挤度) [cite: 126]
-    strategy: str = 'dist'          
+    strategy: Literal['dist', 'time'] = 'dist'
     
     # 【新增】交通工具: 'walk'=步行, 'bike'=自行车 [cite: 127]
-    transport: str = 'walk'         
+    transport: Literal['walk', 'bike'] = 'walk'
+
+    # 【新增】搜索算法: 'dijkstra' / 'astar' (坐标启发式) / 'bidirectional' (双向搜索)
+    #          / 'ch' (收缩层次，需要先离线运行 contraction.py)
+    algorithm: str = 'dijkstra'
+
+    # 【新增】出发时刻 (例如 "11:50")，'time' 策略会按该时段的拥挤度规划，避开高峰
+    depart_time: Optional[time] = None
+
+    # 【新增】一共返回几条路线 (>1 时额外给出备选路线，只支持单点导航，按当前拥挤度计算)
+    k_routes: int = 1
+    # 备选路线和已选路线的最大重合比例，超过就认为是同一条路，不作为备选
+    max_similarity: float = ALTERNATIVE_MAX_SIMILARITY
+
+    # 【新增】紧凑响应 (手机弱网用): 坐标编码成 polyline 字符串 / 差分整数，只给景点带名称
+    compact: bool = False
+    geometry: str = 'polyline'      # 'polyline' 或 'delta'
+    precision: int = 0              # 坐标保留几位小数 (像素坐标一般取 0 即可)
+    simplify_tolerance: float = 0   # Douglas-Peucker 抽稀的像素误差，0 表示不抽稀
+
+class RouteOption(BaseModel):
+    path_ids: List[int]
+    path_names: List[str]
+    path_coords: List[List[float]]
+    total_cost: float
+    cost_unit: str
 
 class NavigateResponse(BaseModel):
     path_ids: List[int]
@@ -141,6 +306,7 @@ class NavigateResponse(BaseModel):
     path_coords: List[List[float]] # ➕【新增这一行】返回像素坐标供前端画线
     total_cost: float
     cost_unit: str  # 告诉前端单位是 "米" 还是 "秒"
+    alternatives: List[RouteOption] = []  # 备选路线 (k_routes > 1 时才有)
 
 # --- 根目录测试 ---
 @app.get("/")
@@ -148,53 +314,95 @@ def read_root():
     return {"status": "ok", "message": "校园旅游系统后端正在运行"}
 
 @app.get("/graph")
-def get_graph():
+def get_graph(request: Request):
     """
     返回前端渲染地图所需的节点和边数据
+    每个地图版本只生成一次，之后直接返回序列化 / 压缩好的字节，浏览器缓存有效时返回 304
     """
-    if not global_graph:
+    graph = global_graph
+    if not graph:
         raise HTTPException(status_code=500, detail="地图数据未加载")
-    
+    return graph_payload(graph).response(request)
+
+def graph_payload(graph: CampusGraph) -> PreparedPayload:
+    # 响应里只有结构和道路距离，不含拥挤度：按 (结构版本, 距离版本) 缓存，
+    # 拥挤度上报不会让整张地图重新序列化 / 压缩，浏览器手里的 ETag 也继续有效
+    return payload_cache.get("graph", graph, (graph.topology_version, graph.distance_version),
+                             lambda: build_graph_data(graph))
+
+def build_graph_data(graph: CampusGraph) -> dict:
     # 1. 提取所有景点节点
-    # vars(obj) 可以把对象转成字典 {id:1, name:"...", x:10, y:20...}
-    nodes_data = [vars(spot) for spot in global_graph.spots.values()]
+    # spot_records 和 vars(spot) 一样是字典 {id:1, name:"...", x:10, y:20...}，快照地图不用逐个创建 Spot
+    nodes_data = list(graph.spot_records())
     
     # 2. 提取所有边 (去重)
-    # 因为是无向图逻辑，A->B 和 B->A 在算法里都有，但画图只需要一份
+    # 原始边列表里每条路只存一次，只需要去掉重复录入的同一对端点
     edges_data = []
     seen_edges = set()
     
-    for u_id, roads in global_graph.adj.items():
-        for road in roads:
-            # 使用排序后的 tuple 作为唯一标识 (1, 2) == (2, 1)
-            pair = tuple(sorted((road.u, road.v)))
-            if pair not in seen_edges:
-                edges_data.append({
-                    "u": road.u,
-                    "v": road.v,
-                    "distance": road.distance,
-                    # 如果前端需要显示拥挤度或类型，可以在这里加
-                })
-                seen_edges.add(pair)
+    for u, v, distance in graph.edge_rows():
+        # 使用排序后的 tuple 作为唯一标识 (1, 2) == (2, 1)
+        pair = (u, v) if u < v else (v, u)
+        if pair not in seen_edges:
+            edges_data.append({
+                "u": u,
+                "v": v,
+                "distance": distance,
+                # 如果前端需要显示拥挤度或类型，可以在这里加
+            })
+            seen_edges.add(pair)
                 
     return {"nodes": nodes_data, "edges": edges_data}
 
 # --- 导航接口 ---
+ROUTES_MAX_K = 5
+
 @app.post("/navigate", response_model=NavigateResponse)
 def navigate(request: NavigateRequest):
     """
     【智能导航接口】
     支持功能：
     1. A -> B 单点导航 (最短距离/最短时间)
-    2. A -> B -> C -> D 多点连线规划 (TSP近似)
+    2. A -> B -> C -> D 多点连线规划 (Held-Karp 精确解 / 2-opt 局部优化，可指定终点)
     3. 交通方式选择 (步行/自行车)
+    途经点多 / 要备选路线的重请求交给进程池计算 (route_pool)，超过时间预算返回 504
+    4. compact=true 时返回紧凑格式 (见 route_encoding.compact_route)，不走 NavigateResponse 校验
     """
     # 1. 安全检查：地图是否加载
-    if not global_graph:
+    graph = global_graph
+    if not graph:
         raise HTTPException(status_code=500, detail="地图未初始化")
     
     path_ids = []
     cost = 0.0
+
+    # 坐标形式的起终点先吸附到最近的节点
+    start_id = resolve_point(graph, request.start_id, request.start_point)
+    end_id = resolve_point(graph, request.end_id, request.end_point)
+    if start_id is None:
+        raise HTTPException(status_code=400, detail="必须提供 起点(start_id) 或 起点坐标(start_point)")
+
+    if request.algorithm not in SEARCH_ALGORITHMS:
+        raise HTTPException(status_code=400, detail=f"不支持的搜索算法: {request.algorithm}")
+    if request.compact:
+        if request.geometry not in GEOMETRY_FORMATS:
+            raise HTTPException(status_code=400, detail=f"不支持的坐标编码: {request.geometry}")
+        if not 0 <= request.precision <= MAX_COORD_PRECISION:
+            raise HTTPException(status_code=400, detail=f"坐标精度必须在 0~{MAX_COORD_PRECISION} 之间")
+        if request.simplify_tolerance < 0:
+            raise HTTPException(status_code=400, detail="抽稀误差不能为负数")
+
+    def make_route(ids: List[int], route_cost: float) -> dict:
+        if request.compact:
+            return compact_route(graph, ids, route_cost, request.strategy, request.geometry,
+                                 request.precision, request.simplify_tolerance)
+        return build_route_payload(graph, ids, route_cost, request.strategy)
+
+    # 出发时刻换算成当天第几秒
+    depart_seconds = None
+    if request.depart_time is not None:
+        t = request.depart_time
+        depart_seconds = t.hour * 3600 + t.minute * 60 + t.second
     
     # 2. 分支逻辑处理
     
@@ -202,30 +410,47 @@ def navigate(request: NavigateRequest):
     if request.via_ids:
         # 简单的错误检查：确保所有途经点都存在
         for vid in request.via_ids:
-            if vid not in global_graph.spots:
+            if vid not in graph.spots:
                  raise HTTPException(status_code=404, detail=f"途经点 ID {vid} 不存在")
         
-        # 调用我们刚才写的多点规划算法
-        path_ids, cost = plan_multi_point_route(
-            global_graph, 
-            request.start_id, 
-            request.via_ids, 
-            request.strategy, 
-            request.transport
-        )
+        # 终点 (可选) 固定在路线最后
+        if end_id is not None and end_id not in graph.spots:
+            raise HTTPException(status_code=404, detail="终点不存在")
+
+        # 调用多点规划算法 (代价矩阵 + 最优访问顺序)，热门路线直接走缓存
+        # 途经点多的重请求在缓存未命中时交给进程池
+        planner = None
+        if len(request.via_ids) >= HEAVY_VIA_COUNT:
+            planner = partial(route_pool.run, graph, "plan")
+        try:
+            path_ids, cost = route_cache.find_route(
+                graph,
+                start_id,
+                end_id,
+                request.via_ids,
+                request.strategy,
+                request.transport,
+                request.algorithm,
+                depart_seconds,
+                planner=planner
+            )
+        except RouteTimeout:
+            raise HTTPException(status_code=504, detail="路线规划超时，请减少途经点后重试")
         
     # --- 情况 B: 单点导航 (A -> B) [cite: 119] ---
-    elif request.end_id is not None:
-        if request.end_id not in global_graph.spots:
+    elif end_id is not None:
+        if end_id not in graph.spots:
             raise HTTPException(status_code=404, detail="终点不存在")
             
-        # 调用基础 Dijkstra 算法
-        path_ids, cost = dijkstra_search(
-            global_graph, 
-            request.start_id, 
-            request.end_id, 
-            request.strategy, 
-            request.transport
+        # 调用选定的搜索算法 (默认 Dijkstra)，热门路线直接走缓存
+        path_ids, cost = route_cache.find_route(
+            graph, 
+            start_id, 
+            end_id, 
+            strategy=request.strategy, 
+            transport=request.transport,
+            algorithm=request.algorithm,
+            depart_seconds=depart_seconds
         )
     
     # --- 情况 C: 参数错误 ---
@@ -236,21 +461,69 @@ def navigate(request: NavigateRequest):
     if not path_ids:
         raise HTTPException(status_code=400, detail="无法规划路径（可能是孤岛节点或无法到达）")
 
+    payload = make_route(path_ids, cost)
+
+    # 4. 备选路线 (例如让用户挑一条不那么拥挤的路)
+    if request.k_routes > 1:
+        if request.via_ids:
+            raise HTTPException(status_code=400, detail="多点规划暂不支持备选路线")
+        if request.k_routes > ROUTES_MAX_K:
+            raise HTTPException(status_code=400, detail=f"最多返回 {ROUTES_MAX_K} 条路线")
+        # 以终点为根的最短路径树 (路网无向，就是各点到终点的距离)，缓存里有就直接复用
+        # 进程池开着时交给子进程 (子进程自己算这棵树，不必把整棵树传过去)
+        tree = None
+        if not route_pool.active(graph):
+            tree = route_cache.get_tree(graph, end_id, request.strategy, request.transport, build=True)
+        try:
+            routes = route_pool.run(
+                graph, "alternatives", start_id, end_id, request.k_routes,
+                request.strategy, request.transport, request.max_similarity,
+                target_tree=(tree.dist, tree.prev) if tree is not None else None
+            )
+        except RouteTimeout:
+            raise HTTPException(status_code=504, detail="备选路线规划超时，请减少路线条数后重试")
+        if depart_seconds is None and routes:
+            # 等价最短路线可能不止一条，以 Yen 算法的第一条为主路线，保证备选路线之间的相似度过滤成立
+            path_ids, cost = routes[0]
+            payload = make_route(path_ids, cost)
+            routes = routes[1:]
+        payload["alternatives"] = [
+            make_route(ids, alt_cost)
+            for ids, alt_cost in routes if ids != path_ids
+        ][:request.k_routes - 1]
+
+    if request.compact:
+        # 紧凑格式直接序列化 (不经过 response_model 校验，也省掉一次转换)
+        return Response(json.dumps(payload, ensure_ascii=False, separators=(',', ':')),
+                        media_type="application/json")
+    return payload
+
+def resolve_point(graph: CampusGraph, spot_id: Optional[int], point: Optional[MapPoint]) -> Optional[int]:
+    """起终点参数解析：优先用景点ID，否则把坐标吸附到最近的节点，都没给时返回 None"""
+    if spot_id is not None or point is None:
+        return spot_id
+    snap = graph.spatial_index().snap(point.x, point.y)
+    if snap is None:
+        raise HTTPException(status_code=404, detail="地图上没有任何节点")
+    return graph.compile().node_ids[snap.node]
+
+def build_route_payload(graph: CampusGraph, path_ids: List[int], cost: float, strategy: str) -> dict:
+    """把路径 ID 列表整理成前端需要的格式 (名称、像素坐标、总消耗与单位)"""
     # 将 ID 转换为人类可读的景点名称
-    path_names = [global_graph.get_spot_name(pid) for pid in path_ids]
+    path_names = [graph.get_spot_name(pid) for pid in path_ids]
 
     # ➕ 提取路径上每个点的像素坐标 [x, y]，供前端在图片上画线
     path_coords = []
     for pid in path_ids:
-        # 这里的 global_graph 就是你加载进内存的“地图数据”
-        if pid in global_graph.spots:
-            spot = global_graph.spots[pid]
+        # 这里的 graph 就是你加载进内存的“地图数据”
+        if pid in graph.spots:
+            spot = graph.spots[pid]
             path_coords.append([spot.x, spot.y])
         else:
             path_coords.append([0, 0]) # 防止报错
     
     # 确定单位 (距离用米，时间用秒)
-    unit = "米" if request.strategy == 'dist' else "秒"
+    unit = "米" if strategy == 'dist' else "秒"
     
     return {
         "path_ids": path_ids,
@@ -259,6 +532,304 @@ def navigate(request: NavigateRequest):
         "total_cost": round(cost, 1), # 保留1位小数
         "cost_unit": unit
     }
+# --- 批量导航 ---
+# 一次最多查询多少对起终点
+BATCH_MAX_PAIRS = 500
+
+class RoutePair(BaseModel):
+    start_id: int
+    end_id: int
+
+class BatchNavigateRequest(BaseModel):
+    pairs: List[RoutePair]
+    strategy: Literal['dist', 'time'] = 'dist'
+    transport: Literal['walk', 'bike'] = 'walk'
+
+class BatchRouteResult(BaseModel):
+    start_id: int
+    end_id: int
+    found: bool                    # 是否可达
+    path_ids: List[int] = []
+    path_names: List[str] = []
+    path_coords: List[List[float]] = []
+    total_cost: float = -1
+    cost_unit: str = ""
+
+@app.post("/navigate/batch", response_model=List[BatchRouteResult])
+def navigate_batch(request: BatchNavigateRequest):
+    """
+    【批量导航接口】
+    给导游调度台 / 校园导览屏用：一次请求返回很多对起终点的路线。
+    后端按起点分组，每个不同的起点只搜索一次。
+    结果顺序与请求中的 pairs 一致，不可达的点对 found=false。
+    """
+    graph = global_graph
+    if not graph:
+        raise HTTPException(status_code=500, detail="地图未初始化")
+    if len(request.pairs) > BATCH_MAX_PAIRS:
+        raise HTTPException(status_code=400, detail=f"一次最多查询 {BATCH_MAX_PAIRS} 对起终点")
+    for pair in request.pairs:
+        for pid in (pair.start_id, pair.end_id):
+            if pid not in graph.spots:
+                raise HTTPException(status_code=404, detail=f"地点 ID {pid} 不存在")
+
+    pairs = [(p.start_id, p.end_id) for p in request.pairs]
+    if len(pairs) >= HEAVY_BATCH_PAIRS:
+        # 大批量请求交给进程池
+        try:
+            routes = route_pool.run(graph, "batch", pairs, request.strategy, request.transport)
+        except RouteTimeout:
+            raise HTTPException(status_code=504, detail="批量导航超时，请减少点对数量后重试")
+    else:
+        routes = batch_routes(graph, pairs, request.strategy, request.transport)
+
+    results = []
+    for pair, (path_ids, cost) in zip(request.pairs, routes):
+        item = {"start_id": pair.start_id, "end_id": pair.end_id, "found": bool(path_ids)}
+        if path_ids:
+            item.update(build_route_payload(graph, path_ids, cost, request.strategy))
+        results.append(item)
+    return results
+
+# --- 最近设施 ---
+NEAREST_MAX_K = 20
+
+def spots_in_category(graph: CampusGraph, category: str) -> List[int]:
+    """
+    按类别挑出候选地点：类型完全一致 (例如 'spot')，或者名字里带有这个词 (例如 '食堂'、'门')
+    路点 (road) 没有实际意义的名字，只按类型匹配
+    """
+    return [
+        r["id"] for r in graph.spot_records()
+        if r["type"] == category or (r["type"] != 'road' and category in r["name"])
+    ]
+
+@app.get("/navigate/nearest")
+def navigate_nearest(start_id: int, category: str, k: int = 1,
+                     strategy: Literal['dist', 'time'] = 'dist',
+                     transport: Literal['walk', 'bike'] = 'walk'):
+    """
+    【最近设施接口】"带我去最近的食堂 / 校门 / 厕所"
+    不需要终点ID：一次多目标搜索找出最近的 k 个同类地点，按消耗从小到大返回完整路线。
+    """
+    graph = global_graph
+    if not graph:
+        raise HTTPException(status_code=500, detail="地图未初始化")
+    if start_id not in graph.spots:
+        raise HTTPException(status_code=404, detail="起点不存在")
+    if not 1 <= k <= NEAREST_MAX_K:
+        raise HTTPException(status_code=400, detail=f"k 必须在 1 到 {NEAREST_MAX_K} 之间")
+
+    candidates = spots_in_category(graph, category)
+    if not candidates:
+        raise HTTPException(status_code=404, detail=f"没有找到类别为 '{category}' 的地点")
+
+    results = []
+    for spot_id, path_ids, cost in nearest_targets(graph, start_id, candidates, k,
+                                                   strategy, transport):
+        item = {"id": spot_id, "name": graph.get_spot_name(spot_id)}
+        item.update(build_route_payload(graph, path_ids, cost, strategy))
+        results.append(item)
+    return results
+
+# --- 等时圈 / 可达范围 ---
+@app.get("/navigate/isochrone")
+def get_isochrone(start_id: int, budget: float, strategy: Literal['dist', 'time'] = 'time',
+                  transport: Literal['walk', 'bike'] = 'walk'):
+    """
+    【可达范围接口】例如 "从这里骑车 5 分钟能到哪" (strategy=time, transport=bike, budget=300)
+    - spots:    预算内能到达的所有节点及其消耗
+    - frontier: 只能走一部分的边界路段，end_x / end_y 是预算耗尽时走到的位置，前端据此画出覆盖区域
+    budget 的单位随策略变化：'dist' 为米，'time' 为秒。
+    """
+    graph = global_graph
+    if not graph:
+        raise HTTPException(status_code=500, detail="地图未初始化")
+    if start_id not in graph.spots:
+        raise HTTPException(status_code=404, detail="起点不存在")
+    if budget < 0:
+        raise HTTPException(status_code=400, detail="预算不能为负数")
+
+    # 如果缓存里已经有这个起点的最短路径树，直接在树上筛选
+    tree = route_cache.get_tree(graph, start_id, strategy, transport)
+    reached, frontier = reachable_within(
+        graph, start_id, budget, strategy, transport,
+        tree_dist=tree.dist if tree is not None else None
+    )
+
+    cg = graph.compile()
+    spots = []
+    for i, cost in sorted(reached.items(), key=lambda item: item[1]):
+        spot = graph.spots[cg.node_ids[i]]
+        spots.append({
+            "id": spot.id,
+            "name": spot.name,
+            "type": spot.type,
+            "x": spot.x,
+            "y": spot.y,
+            "cost": round(cost, 1)
+        })
+
+    frontier_data = []
+    for u, v, fraction in frontier:
+        frontier_data.append({
+            "u": cg.node_ids[u],
+            "v": cg.node_ids[v],
+            "fraction": round(fraction, 3),
+            "end_x": cg.xs[u] + (cg.xs[v] - cg.xs[u]) * fraction,
+            "end_y": cg.ys[u] + (cg.ys[v] - cg.ys[u]) * fraction
+        })
+
+    return {
+        "start_id": start_id,
+        "budget": budget,
+        "cost_unit": "米" if strategy == 'dist' else "秒",
+        "spots": spots,
+        "frontier": frontier_data
+    }
+
+# --- 限时游览推荐 ---
+# 时间预算上限 (分钟)
+TOUR_MAX_BUDGET_MINUTES = 24 * 60
+
+class TourRequest(BaseModel):
+    start_id: int
+    budget_minutes: float = 60      # 一共有多少分钟
+    stay_minutes: float = 5         # 每个景点停留多久 (算在预算里)
+    transport: str = 'walk'
+    return_to_start: bool = False   # 是否要在预算内回到起点
+
+class TourResponse(BaseModel):
+    visit_ids: List[int]            # 推荐去的景点 (按访问顺序)
+    visit_names: List[str]
+    total_appeal: float             # 这些景点的吸引力之和
+    total_minutes: float            # 总耗时 (含停留)
+    path_ids: List[int]
+    path_names: List[str]
+    path_coords: List[List[float]]
+
+@app.post("/navigate/tour", response_model=TourResponse)
+def recommend_tour(request: TourRequest, session: Session = Depends(get_session)):
+    """
+    【限时游览推荐】"我有 60 分钟，怎么逛最值"
+    按日记评分和浏览量算出每个景点的吸引力，在时间预算内挑出吸引力之和最大的一组景点并排好顺序。
+    用预先算好的景点代价矩阵求解，求解时间有上限 (TOUR_SOLVE_SECONDS)，到点返回当前最好的方案。
+    """
+    graph = global_graph
+    if not graph:
+        raise HTTPException(status_code=500, detail="地图未初始化")
+    if request.start_id not in graph.spots:
+        raise HTTPException(status_code=404, detail="起点不存在")
+    if not 0 < request.budget_minutes <= TOUR_MAX_BUDGET_MINUTES:
+        raise HTTPException(status_code=400, detail=f"时间预算必须在 0 到 {TOUR_MAX_BUDGET_MINUTES} 分钟之间")
+    if request.stay_minutes < 0:
+        raise HTTPException(status_code=400, detail="停留时间不能为负数")
+    if request.transport not in TOUR_TRANSPORTS:
+        raise HTTPException(status_code=400, detail=f"不支持的交通方式: {request.transport}")
+
+    appeal = diary.spot_appeal(session)
+    result = plan_sightseeing_tour(
+        graph, request.start_id, appeal, request.budget_minutes * 60, request.transport,
+        stay=request.stay_minutes * 60, return_to_start=request.return_to_start
+    )
+    if result is None:
+        raise HTTPException(status_code=503, detail="地图景点太多，没有预计算景点代价矩阵，暂不支持游览推荐")
+    visit_ids, path_ids, cost = result
+
+    payload = build_route_payload(graph, path_ids, max(cost, 0.0), 'time')
+    return {
+        "visit_ids": visit_ids,
+        "visit_names": [graph.get_spot_name(sid) for sid in visit_ids],
+        "total_appeal": round(sum(appeal[sid] for sid in visit_ids), 2),
+        "total_minutes": round(max(cost, 0.0) / 60, 1),
+        "path_ids": payload["path_ids"],
+        "path_names": payload["path_names"],
+        "path_coords": payload["path_coords"],
+    }
+
+# --- 实时拥挤度更新 ---
+class CrowdingUpdate(BaseModel):
+    u: int           # 道路一端的节点ID
+    v: int           # 道路另一端的节点ID
+    crowding: float  # 新的拥挤系数 (1.0 正常，越大越堵)
+
+class CrowdingUpdateRequest(BaseModel):
+    updates: List[CrowdingUpdate]
+
+@app.post("/navigate/crowding")
+def update_crowding(
+    request: CrowdingUpdateRequest,
+    current_user: User = Depends(auth.get_current_user) # 必须登录才能上报
+):
+    """
+    【实时拥挤度上报接口】
+    支持一次更新一条或一批道路的拥挤度，'time' 策略的导航会立刻按新路况规划。
+    已缓存的最短路径树会被增量修复，不需要整体重算；作废的 'time' 全源表等在后台重建。
+    """
+    graph = global_graph
+    if not graph:
+        raise HTTPException(status_code=500, detail="地图未初始化")
+
+    # 1. 先整体校验，任何一条不合法都不做修改
+    updates = []
+    for item in request.updates:
+        # NaN / Infinity 也能通过 "<= 0" 的判断，写进权重数组后会污染缓存的最短路径树和地标下界
+        if not (math.isfinite(item.crowding) and item.crowding > 0):
+            raise HTTPException(status_code=400, detail=f"拥挤度必须为有限的正数: {item.u}-{item.v}")
+        edge_index = graph.find_edge(item.u, item.v)
+        if edge_index is None:
+            raise HTTPException(status_code=404, detail=f"道路 {item.u}-{item.v} 不存在")
+        updates.append((edge_index, None, item.crowding))
+
+    # 2. 写入地图，并立即同步缓存 (修复的开销由上报方承担，而不是下一个导航请求)
+    changes = graph.update_edges(updates)
+    route_cache.sync(graph)
+    if changes:
+        derived_rebuilder.schedule(graph)
+
+    return {
+        "updated": len(changes),
+        "version": graph.version
+    }
+
+# --- 地图热更新 ---
+@app.post("/admin/map/reload")
+def reload_map_now(current_user: User = Depends(auth.get_current_admin)):
+    """
+    【手动重新加载地图】(仅管理员，见环境变量 ADMIN_USERNAMES)
+    编辑完 campus_map.json 后立即生效，不用等文件监视线程，也不用重启服务。
+    新地图校验不通过时保留旧地图并返回原因。
+    """
+    try:
+        done = reload_map()
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"地图重新加载失败: {e}")
+    if not done:
+        raise HTTPException(status_code=409, detail="地图正在重新加载，请稍后再试")
+    if map_watcher is not None:
+        map_watcher.mark_loaded()
+
+    graph = global_graph
+    return {
+        "version": map_version,
+        "spots": len(graph.spots),
+        "edges": len(graph.edges)
+    }
+
+@app.get("/navigate/cache")
+def get_route_cache_stats():
+    """
+    路径缓存的运行状态：命中 / 未命中 / 淘汰 / 失效次数与当前条目数，以及路线进程池的使用情况
+    fallback 列出拥挤度变化后还在等后台重建、暂时回退到普通搜索的派生数据，例如 {"route_tables": ["time_walk"]}
+    """
+    graph = global_graph
+    fallback = {}
+    if graph is not None:
+        fallback = {name: sorted(f"{s}_{t}" for s, t in modes)
+                    for name, modes in list(graph.compile().stale.items())}
+    return {**route_cache.stats(), "pool": route_pool.stats(),
+            "fallback": fallback, "rebuild": derived_rebuilder.stats()}
+
 # ==========================================
 # 【重要】前端静态文件挂载 - 必须放在所有 API 路由之后
 # 这样 API 路由优先匹配，未匹配的请求才会走静态文件
@@ -21,6 +21,9 @@ ALGORITHM = "HS256"
 # 安全检查：如果没有密钥，直接阻止程序启动
 if not SECRET_KEY:
     raise ValueError("❌ 严重错误：未设置 SECRET_KEY！请检查 .env 文件。")
+
+# 管理员用户名 (逗号分隔)，只有他们能调用 /admin/... 接口；不设置则没有管理员
+ADMIN_USERNAMES = {name.strip() for name in os.getenv("ADMIN_USERNAMES", "").split(",") if name.strip()}
 #################################
 
 router = APIRouter(prefix="/auth", tags=["用户认证"])
@@ -128,4 +131,13 @@ def get_current_user(token: str = Depends(oauth2_scheme), session: Session = Dep
     if user is None:
         raise credentials_exception
         
-    return user
\ No newline at end of file
+    return user
+
+def get_current_admin(user: User = Depends(get_current_user)) -> User:
+    """
+    管理员接口的依赖项：先按 get_current_user 验证登录，
+    再检查用户名是否在 ADMIN_USERNAMES 里，不在就返回 403。
+    """
+    if user.username not in ADMIN_USERNAMES:
+        raise HTTPException(status_code=403, detail="需要管理员权限")
+    return user
@@ -0,0 +1,238 @@
+from array import array
+from typing import Dict, List, Iterable, NamedTuple
+
+# patched() 没法沿用、交给后台重建 (derived_rebuild 模块) 的派生数据
+REBUILT_STORES = ('route_tables', 'contraction', 'spot_matrices')
+
+
+class EdgeChange(NamedTuple):
+    """一条无向边的属性变化记录 (edge 是它在 CampusGraph.edges 中的序号)"""
+    edge: int
+    old_distance: float
+    old_crowding: float
+    new_distance: float
+    new_crowding: float
+
+
+class CompiledGraph:
+    """
+    【紧凑图结构 (CSR, Compressed Sparse Row)】
+    把 CampusGraph 里 "字典 + Edge 对象列表" 的邻接表编译成几块连续的数组，
+    搜索算法只做数组下标访问，不再逐条边访问 SQLModel 对象。
+
+    - 节点: 用 0..n-1 的稠密下标表示，node_ids[i] 是原始景点 ID
+    - 边:   节点 i 的所有出边位于 [offsets[i], offsets[i+1]) 区间
+            targets[k] 是第 k 条有向边的终点下标
+            distance[k] / crowding[k] 是这条边的距离和拥挤度
+            arc_edge[k] 是它在原始无向边列表中的序号 (正反两条有向边共享)
+            bikeable[k] 为 0 表示这条边只能步行 (道路类型 'walk')
+
+    编译后的对象视为只读：地图变化时重新编译一个新对象，而不是原地修改。
+    """
+
+    def __init__(self, node_ids, xs, ys, offsets, targets, distance, crowding, arc_edge, version=0,
+                 profiles=None, bucket_minutes=60, bikeable=None):
+        self.node_ids = node_ids      # 下标 -> 景点ID
+        self.xs = xs                  # 每个节点的像素 X 坐标
+        self.ys = ys                  # 每个节点的像素 Y 坐标
+        self.offsets = offsets        # CSR 偏移数组，长度 n+1
+        self.targets = targets        # CSR 目标数组，长度 m (有向边数)
+        self.distance = distance      # 每条有向边的距离
+        self.crowding = crowding      # 每条有向边的拥挤度
+        self.arc_edge = arc_edge      # 有向边 -> 原始无向边序号
+        self.version = version        # 编译时对应的地图版本号
+        # 分时段拥挤度: profiles[b][k] 是第 b 个时段第 k 条有向边的拥挤度，
+        # NaN 表示这条边没有分时段数据，沿用 crowding[k]；整张图都没有时为 None
+        self.profiles = profiles
+        self.bucket_minutes = bucket_minutes
+        # 每条有向边能否骑车 (None 表示全图都能骑)
+        self.bikeable = bikeable if bikeable is not None and 0 in bikeable else None
+
+        # 景点ID -> 下标 的反查表
+        self.index: Dict[int, int] = {sid: i for i, sid in enumerate(node_ids)}
+
+        # 各种 (strategy, transport) 组合下的权重数组缓存，由 algorithms 按需填充
+        self.weight_cache: Dict[tuple, array] = {}
+        # A* 启发函数的缩放系数缓存 {(strategy, transport): scale}
+        self.heuristic_scales: Dict[tuple, float] = {}
+
+        # 可选的全源最短路表 {(strategy, transport): RouteTable}，由 route_table 模块填充
+        self.route_tables: Dict[tuple, object] = {}
+
+        # 可选的收缩层次 {(strategy, transport): ContractionHierarchy}，由 contraction 模块填充
+        self.contraction: Dict[tuple, object] = {}
+
+        # 可选的地标距离 (LandmarkSet)，由 landmarks 模块填充，A* 用它算下界
+        self.landmarks = None
+
+        # 可选的景点代价矩阵 {(strategy, transport): SpotMatrix}，由 sightseeing 模块按需填充
+        self.spot_matrices: Dict[tuple, object] = {}
+
+        # 可选的骨架图 (RoadSkeleton，路点链收缩后的小图)，由 road_chains 模块填充
+        self.skeleton = None
+
+        # 打补丁时作废、还在等后台重建的派生数据 {属性名: {(strategy, transport), ...}}，
+        # 重建完成前对应模式的查询回退到普通搜索
+        self.stale: Dict[str, set] = {}
+
+        # 可选的空间索引 (SpatialIndex)，由 CampusGraph.spatial_index() 按需建立
+        self.spatial = None
+
+        # 无向边 -> 有向边 的反查表 (按需建立)
+        self._edge_arcs = None
+
+    @classmethod
+    def build(cls, spots: Iterable, edges: List, version: int = 0,
+              bucket_minutes: int = 60) -> "CompiledGraph":
+        """
+        从景点对象和无向边对象编译 CSR 结构
+        :param spots: Spot 对象序列 (决定节点下标顺序)
+        :param edges: Edge 对象列表 (每条无向边会展开成正反两条有向边)
+        :param bucket_minutes: 分时段拥挤度每个时段的长度 (分钟)
+        """
+        node_ids = array('q')
+        xs = array('d')
+        ys = array('d')
+        for spot in spots:
+            node_ids.append(spot.id)
+            xs.append(spot.x)
+            ys.append(spot.y)
+
+        index = {sid: i for i, sid in enumerate(node_ids)}
+        n = len(node_ids)
+
+        # 1. 统计每个节点的出度 (端点不在景点表里的边直接忽略)
+        degree = [0] * n
+        valid = []
+        for k, edge in enumerate(edges):
+            ui = index.get(edge.u)
+            vi = index.get(edge.v)
+            if ui is None or vi is None:
+                continue
+            valid.append((k, ui, vi, edge))
+            degree[ui] += 1
+            degree[vi] += 1
+
+        # 2. 前缀和得到偏移数组
+        offsets = array('i', [0]) * (n + 1)
+        for i in range(n):
+            offsets[i + 1] = offsets[i] + degree[i]
+
+        m = offsets[n]
+        targets = array('i', [0]) * m
+        distance = array('d', [0.0]) * m
+        crowding = array('d', [0.0]) * m
+        arc_edge = array('i', [0]) * m
+        bikeable = array('b', [1]) * m
+
+        # 3. 按原始插入顺序填充 (与旧邻接表的遍历顺序保持一致)
+        cursor = list(offsets[:n])
+        for k, ui, vi, edge in valid:
+            c = edge.crowding
+            bike = 0 if getattr(edge, 'type', None) == 'walk' else 1
+            for a, b in ((ui, vi), (vi, ui)):
+                pos = cursor[a]
+                targets[pos] = b
+                distance[pos] = edge.distance
+                crowding[pos] = c
+                arc_edge[pos] = k
+                bikeable[pos] = bike
+                cursor[a] = pos + 1
+
+        # 4. 分时段拥挤度 (只有地图里真的配置了才建)
+        profiles = None
+        if any(getattr(edge, 'crowding_profile', None) for _, _, _, edge in valid):
+            num_buckets = 24 * 60 // bucket_minutes
+            profiles = [array('d', [float('nan')]) * m for _ in range(num_buckets)]
+            for k in range(m):
+                profile = getattr(edges[arc_edge[k]], 'crowding_profile', None)
+                if profile:
+                    for b in range(num_buckets):
+                        profiles[b][k] = profile[b]
+
+        return cls(node_ids, xs, ys, offsets, targets, distance, crowding, arc_edge, version,
+                   profiles, bucket_minutes, bikeable)
+
+    # ------------------------------------------
+    # 基本查询
+    # ------------------------------------------
+    @property
+    def num_nodes(self) -> int:
+        return len(self.node_ids)
+
+    @property
+    def num_arcs(self) -> int:
+        return len(self.targets)
+
+    def compile(self) -> "CompiledGraph":
+        """已经是编译结果，直接返回自己 (让算法函数同时接受 CampusGraph 和 CompiledGraph)"""
+        return self
+
+    def edge_arcs(self, edge: int) -> List[int]:
+        """原始无向边序号 -> 它展开出的有向边下标 (第一次调用时建立反查表)"""
+        if self._edge_arcs is None:
+            mapping: Dict[int, List[int]] = {}
+            for k, e in enumerate(self.arc_edge):
+                mapping.setdefault(e, []).append(k)
+            self._edge_arcs = mapping
+        return self._edge_arcs.get(edge, [])
+
+    def patched(self, changes: List[EdgeChange], version: int) -> "CompiledGraph":
+        """
+        【增量更新】
+        只有边的距离 / 拥挤度变了 (拓扑没变) 时，不必重新编译：
+        复制距离和拥挤度数组，改掉受影响的有向边，其余数组 (以及空间索引) 直接共享。
+        只依赖距离的派生数据 ('dist' 策略的权重、全源表、收缩层次、景点矩阵) 在距离没变时原样沿用，
+        其余的记进 cg.stale 等后台重建；地标距离和骨架图则按这批变化增量修复。
+        """
+        distance = array('d', self.distance)
+        crowding = array('d', self.crowding)
+        for change in changes:
+            for k in self.edge_arcs(change.edge):
+                distance[k] = change.new_distance
+                crowding[k] = change.new_crowding
+
+        cg = CompiledGraph(self.node_ids, self.xs, self.ys, self.offsets, self.targets,
+                           distance, crowding, self.arc_edge, version,
+                           self.profiles, self.bucket_minutes, self.bikeable)
+        cg._edge_arcs = self._edge_arcs
+        cg.spatial = self.spatial  # 坐标和拓扑都没变
+
+        if all(c.old_distance == c.new_distance for c in changes):
+            for store, new_store in ((self.weight_cache, cg.weight_cache),
+                                     (self.heuristic_scales, cg.heuristic_scales),
+                                     (self.route_tables, cg.route_tables),
+                                     (self.contraction, cg.contraction),
+                                     (self.spot_matrices, cg.spot_matrices)):
+                for key, value in store.items():
+                    if key[0] == 'dist':
+                        new_store[key] = value
+        for name in REBUILT_STORES:
+            missing = (self.stale.get(name, set()) | set(getattr(self, name))) - set(getattr(cg, name))
+            if missing:
+                cg.stale[name] = missing
+        # 景点矩阵重建完成前先沿用旧的 (游览推荐按 cg.stale 得知它已过期，会用真实耗时校验)
+        for key in cg.stale.get('spot_matrices', ()):
+            if key in self.spot_matrices:
+                cg.spot_matrices[key] = self.spot_matrices[key]
+        if self.landmarks is not None:
+            cg.landmarks = self.landmarks.patched(cg, changes)
+        if self.skeleton is not None:
+            cg.skeleton = self.skeleton.patched(cg, changes)
+        return cg
+
+    @property
+    def num_buckets(self) -> int:
+        """一天被分成多少个时段 (没有分时段数据时为 0)"""
+        return len(self.profiles) if self.profiles is not None else 0
+
+    def edge_bikeable(self, edge: int) -> bool:
+        """原始无向边能否骑车"""
+        if self.bikeable is None:
+            return True
+        arcs = self.edge_arcs(edge)
+        return not arcs or bool(self.bikeable[arcs[0]])
+
+    def neighbors(self, i: int):
+        """返回节点下标 i 的所有出边下标区间"""
+        return range(self.offsets[i], self.offsets[i + 1])
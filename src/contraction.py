@@ -0,0 +1,373 @@
+import os
+import sys
+import json
+import heapq
+import hashlib
+from array import array
+from typing import Dict, List, Tuple, Optional
+
+# 作为脚本运行时 (python src/contraction.py) 也能找到同目录下的模块
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from algorithms import mode_weights
+from route_table import ROUTE_MODES
+
+# ==========================================
+# 收缩层次 (Contraction Hierarchies, CH)
+# ==========================================
+# 思路：离线按 "重要程度" 依次把节点从图里 "收缩" 掉，
+# 为了不改变剩余节点之间的最短距离，需要补上一些捷径边 (shortcut)。
+# 查询时只沿 "等级升高" 的方向做双向搜索，搜索空间通常只有几百个节点。
+#
+# 预处理结果保存在 campus_map.json 旁边 (campus_map.ch.json)，
+# 服务启动时加载并挂到 CompiledGraph.contraction 上。
+# 拥挤度变化后 'dist' 的收缩层次原样沿用，'time' 的由 derived_rebuild 在后台按新权重重新预处理。
+
+CH_FORMAT_VERSION = 1
+
+# 见证搜索 (witness search) 最多确定的节点数，越大捷径越少，但预处理越慢
+WITNESS_SETTLE_LIMIT = 60
+
+
+def get_ch_path(map_path: str) -> str:
+    """campus_map.json -> campus_map.ch.json"""
+    root, _ = os.path.splitext(map_path)
+    return root + ".ch.json"
+
+
+def file_sha1(path: str) -> str:
+    """计算地图文件的指纹，用来判断预处理结果是否过期"""
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ContractionHierarchy:
+    """
+    【单一模式的收缩层次】
+    - rank[i]:  节点下标 i 被收缩的次序 (越大越 "重要")
+    - 上行图:   CSR 结构，节点 i 的上行边位于 [up_offsets[i], up_offsets[i+1])
+                up_targets / up_weights 是终点和权重，
+                up_mid 是捷径绕过的中间节点 (-1 表示原始边)
+    路网是无向的，所以正向和反向搜索都只需要这一份上行图。
+    """
+
+    def __init__(self, rank, up_offsets, up_targets, up_weights, up_mid):
+        self.rank = rank
+        self.up_offsets = up_offsets
+        self.up_targets = up_targets
+        self.up_weights = up_weights
+        self.up_mid = up_mid
+
+        # (较小下标, 较大下标) -> 中间节点，只记录捷径，供路径展开使用
+        self.shortcut_mid: Dict[Tuple[int, int], int] = {}
+        for u in range(len(rank)):
+            for k in range(up_offsets[u], up_offsets[u + 1]):
+                mid = up_mid[k]
+                if mid != -1:
+                    v = up_targets[k]
+                    self.shortcut_mid[(u, v) if u < v else (v, u)] = mid
+
+    # ------------------------------------------
+    # 预处理
+    # ------------------------------------------
+    @classmethod
+    def build(cls, cg, weights) -> "ContractionHierarchy":
+        """
+        对编译后的图做收缩预处理
+        节点顺序采用经典的 "边差 + 已删除邻居数" 启发式，并用懒更新的优先队列维护。
+        """
+        n = cg.num_nodes
+        # 剩余图: adj[u] = {v: (权重, 中间节点)}，平行边只保留最短的
+        adj: List[Dict[int, Tuple[float, int]]] = [dict() for _ in range(n)]
+        for u in range(n):
+            for k in range(cg.offsets[u], cg.offsets[u + 1]):
+                v = cg.targets[k]
+                if v == u:
+                    continue
+                w = weights[k]
+                if w == float('inf'):
+                    continue  # 当前交通方式不能走的路 (例如自行车遇到只能步行的路)
+                if v not in adj[u] or w < adj[u][v][0]:
+                    adj[u][v] = (w, -1)
+                    adj[v][u] = (w, -1)
+
+        contracted = [False] * n
+        deleted_neighbors = [0] * n
+        rank = array('i', [0]) * n
+        up: List[List[Tuple[int, float, int]]] = [[] for _ in range(n)]
+
+        def witness_dist(source: int, skip: int, limit: float) -> Dict[int, float]:
+            """在剩余图里从 source 出发做受限 Dijkstra，不经过 skip 节点"""
+            dist = {source: 0.0}
+            pq = [(0.0, source)]
+            settled = 0
+            while pq and settled < WITNESS_SETTLE_LIMIT:
+                d, x = heapq.heappop(pq)
+                if d > dist.get(x, float('inf')):
+                    continue
+                if d > limit:
+                    break
+                settled += 1
+                for y, (w, _) in adj[x].items():
+                    if y == skip:
+                        continue
+                    nd = d + w
+                    if nd < dist.get(y, float('inf')):
+                        dist[y] = nd
+                        heapq.heappush(pq, (nd, y))
+            return dist
+
+        def shortcuts_for(v: int) -> List[Tuple[int, int, float]]:
+            """收缩 v 需要添加的捷径列表 [(u, w, 权重)]"""
+            neighbors = list(adj[v].items())
+            result = []
+            for i, (u, (wu, _)) in enumerate(neighbors):
+                rest = neighbors[i + 1:]
+                if not rest:
+                    break
+                limit = wu + max(ww for _, (ww, _) in rest)
+                dist = witness_dist(u, v, limit)
+                for x, (wx, _) in rest:
+                    via = wu + wx
+                    if dist.get(x, float('inf')) > via:
+                        result.append((u, x, via))
+            return result
+
+        def priority(v: int) -> int:
+            return len(shortcuts_for(v)) - len(adj[v]) + deleted_neighbors[v]
+
+        pq = [(priority(v), v) for v in range(n)]
+        heapq.heapify(pq)
+        order = 0
+        while pq:
+            _, v = heapq.heappop(pq)
+            if contracted[v]:
+                continue
+            # 懒更新：重新计算优先级，如果不再是最小的就放回去
+            p = priority(v)
+            if pq and p > pq[0][0]:
+                heapq.heappush(pq, (p, v))
+                continue
+
+            for u, x, w in shortcuts_for(v):
+                old = adj[u].get(x)
+                if old is None or w < old[0]:
+                    adj[u][x] = (w, v)
+                    adj[x][u] = (w, v)
+
+            # v 剩下的邻居都比它晚收缩，对应的边就是 v 的上行边
+            for u, (w, mid) in adj[v].items():
+                up[v].append((u, w, mid))
+                del adj[u][v]
+                deleted_neighbors[u] = max(deleted_neighbors[u], deleted_neighbors[v] + 1)
+            adj[v] = {}
+            contracted[v] = True
+            rank[v] = order
+            order += 1
+
+        up_offsets = array('i', [0]) * (n + 1)
+        up_targets = array('i')
+        up_weights = array('d')
+        up_mid = array('i')
+        for v in range(n):
+            for u, w, mid in up[v]:
+                up_targets.append(u)
+                up_weights.append(w)
+                up_mid.append(mid)
+            up_offsets[v + 1] = len(up_targets)
+
+        return cls(rank, up_offsets, up_targets, up_weights, up_mid)
+
+    # ------------------------------------------
+    # 查询
+    # ------------------------------------------
+    def _upward_search(self, source: int, stats: Dict = None):
+        """沿上行图做完整的 Dijkstra (CH 的上行搜索空间很小，不需要提前结束)"""
+        up_offsets, up_targets, up_weights = self.up_offsets, self.up_targets, self.up_weights
+        dist = {source: 0.0}
+        prev = {source: -1}
+        pq = [(0.0, source)]
+        settled = 0
+        while pq:
+            d, u = heapq.heappop(pq)
+            if d > dist[u]:
+                continue
+            settled += 1
+            for k in range(up_offsets[u], up_offsets[u + 1]):
+                v = up_targets[k]
+                nd = d + up_weights[k]
+                if nd < dist.get(v, float('inf')):
+                    dist[v] = nd
+                    prev[v] = u
+                    heapq.heappush(pq, (nd, v))
+        if stats is not None:
+            stats['settled'] = stats.get('settled', 0) + settled
+        return dist, prev
+
+    def query(self, source: int, target: int, stats: Dict = None) -> Tuple[List[int], float]:
+        """
+        点到点查询
+        :return: (节点下标路径, 总消耗)，不可达时返回 ([], inf)
+        """
+        if source == target:
+            return [source], 0.0
+        dist_f, prev_f = self._upward_search(source, stats)
+        dist_b, prev_b = self._upward_search(target, stats)
+
+        best = float('inf')
+        meet = -1
+        for x, d in dist_b.items():
+            df = dist_f.get(x)
+            if df is not None and df + d < best:
+                best = df + d
+                meet = x
+        if meet == -1:
+            return [], best
+
+        # 上行路径: source -> meet 和 target -> meet
+        forward = []
+        x = meet
+        while x != -1:
+            forward.append(x)
+            x = prev_f[x]
+        forward.reverse()
+        x = prev_b[meet]
+        while x != -1:
+            forward.append(x)
+            x = prev_b[x]
+
+        return self.unpack(forward), best
+
+    def unpack(self, path: List[int]) -> List[int]:
+        """把含捷径的路径展开成原始图上的节点序列"""
+        result = [path[0]]
+        for a, b in zip(path, path[1:]):
+            stack = [(a, b)]
+            while stack:
+                x, y = stack.pop()
+                mid = self.shortcut_mid.get((x, y) if x < y else (y, x))
+                if mid is None:
+                    result.append(y)
+                else:
+                    # 先处理 x -> mid，再处理 mid -> y (栈是后进先出)
+                    stack.append((mid, y))
+                    stack.append((x, mid))
+        return result
+
+    # ------------------------------------------
+    # 序列化
+    # ------------------------------------------
+    def to_dict(self) -> dict:
+        return {
+            "rank": list(self.rank),
+            "up_offsets": list(self.up_offsets),
+            "up_targets": list(self.up_targets),
+            "up_weights": list(self.up_weights),
+            "up_mid": list(self.up_mid),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ContractionHierarchy":
+        return cls(
+            array('i', data["rank"]),
+            array('i', data["up_offsets"]),
+            array('i', data["up_targets"]),
+            array('d', data["up_weights"]),
+            array('i', data["up_mid"]),
+        )
+
+
+def build_contraction_hierarchies(graph, modes=ROUTE_MODES) -> Dict[Tuple[str, str], ContractionHierarchy]:
+    """
+    为导航模式做收缩预处理 (权重完全相同的模式共用一份)
+    编译图上已经有的 (打补丁时沿用下来的) 不会重做；全部做完后一次替换 cg.contraction
+    """
+    cg = graph.compile()
+    result = dict(cg.contraction)
+    built = [(mode_weights(cg, strategy, transport), ch) for (strategy, transport), ch in result.items()]
+    for strategy, transport in modes:
+        if (strategy, transport) in result:
+            continue
+        weights = mode_weights(cg, strategy, transport)
+        ch = next((c for w, c in built if w == weights), None)
+        if ch is None:
+            ch = ContractionHierarchy.build(cg, weights)
+            built.append((weights, ch))
+        result[(strategy, transport)] = ch
+    cg.contraction = result
+    return result
+
+
+def save_contraction_hierarchies(graph, map_path: str, out_path: Optional[str] = None) -> str:
+    """离线预处理并写入磁盘，返回输出文件路径"""
+    out_path = out_path or get_ch_path(map_path)
+    cg = graph.compile()
+    hierarchies = build_contraction_hierarchies(graph)
+
+    # 相同的对象只序列化一次，模式通过名字引用
+    names: Dict[int, str] = {}
+    payload = {}
+    modes = {}
+    for (strategy, transport), ch in hierarchies.items():
+        if id(ch) not in names:
+            names[id(ch)] = f"{strategy}_{transport}"
+            payload[names[id(ch)]] = ch.to_dict()
+        modes[f"{strategy}_{transport}"] = names[id(ch)]
+
+    data = {
+        "format": CH_FORMAT_VERSION,
+        "source_sha1": file_sha1(map_path),
+        "node_ids": list(cg.node_ids),
+        "num_arcs": cg.num_arcs,
+        "modes": modes,
+        "hierarchies": payload,
+    }
+    with open(out_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    return out_path
+
+
+def load_contraction_hierarchies(graph, map_path: str) -> Dict[Tuple[str, str], ContractionHierarchy]:
+    """
+    加载预处理结果并挂到当前的编译图上
+    文件不存在、格式不对或者地图已经改过 (指纹不一致) 时返回空字典，查询会自动回退。
+    """
+    cg = graph.compile()
+    ch_path = get_ch_path(map_path)
+    if not os.path.exists(ch_path):
+        return {}
+
+    with open(ch_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    if (data.get("format") != CH_FORMAT_VERSION
+            or data.get("source_sha1") != file_sha1(map_path)
+            or data.get("node_ids") != list(cg.node_ids)
+            or data.get("num_arcs") != cg.num_arcs):
+        print(f"⚠️ 收缩层次文件已过期，请重新运行 contraction.py: {ch_path}")
+        return {}
+
+    loaded = {name: ContractionHierarchy.from_dict(d) for name, d in data["hierarchies"].items()}
+    result = {}
+    for mode, name in data["modes"].items():
+        strategy, transport = mode.split('_', 1)
+        result[(strategy, transport)] = loaded[name]
+    cg.contraction = result
+    print(f"✅ 收缩层次加载成功: {len(loaded)} 份预处理数据")
+    return result
+
+
+if __name__ == "__main__":
+    import time
+    from utils import load_graph_from_json, get_data_path
+
+    # 用法: python src/contraction.py [地图文件路径]
+    map_path = sys.argv[1] if len(sys.argv) > 1 else get_data_path()
+    graph = load_graph_from_json(map_path)
+
+    start = time.time()
+    out = save_contraction_hierarchies(graph, map_path)
+    print(f"🎉 收缩层次预处理完成，用时 {time.time() - start:.1f} 秒，已保存至: {out}")
@@ -0,0 +1,118 @@
+import os
+import threading
+import time
+import weakref
+from typing import Callable, Dict
+
+from route_table import build_route_tables
+from contraction import build_contraction_hierarchies
+from sightseeing import build_spot_matrix
+
+# ==========================================
+# 派生数据后台重建 (Derived Data Rebuild)
+# ==========================================
+# 实时拥挤度变化后，CompiledGraph.patched 只能沿用只依赖距离的派生数据，
+# 'time' 策略的全源表、收缩层次、景点矩阵随旧的编译结果作废 (记在新编译图的 cg.stale 里)，
+# 期间 'time' 查询回退到普通搜索，/navigate/cache 的 "fallback" 能看到哪些数据还缺着。
+#
+# 这里用一个后台线程把它们重新建出来：
+#   - /navigate/crowding 写完拥挤度后调用 schedule()，不阻塞上报请求
+#   - 拥挤度往往是一批批连续上报的，等 REBUILD_DELAY 秒没有新的上报再开始 (去抖)
+#   - 建好的数据直接挂到当时的编译图上；建的过程中拥挤度又变了，就对新版本再来一轮
+
+# 最后一次拥挤度上报之后等待多久再开始重建 (秒)
+REBUILD_DELAY = float(os.getenv("DERIVED_REBUILD_DELAY", "5"))
+
+
+def _rebuild_route_tables(graph, cg, modes):
+    # build_route_tables 只补建缺少的模式，已经沿用下来的 'dist' 表原样保留
+    build_route_tables(cg)
+
+
+def _rebuild_contraction(graph, cg, modes):
+    # 只重做启动时加载过的模式 (离线预处理文件里有哪些就补哪些)
+    build_contraction_hierarchies(cg, sorted(modes))
+    print(f"✅ 收缩层次已按新的拥挤度重新预处理: {len(modes)} 种模式")
+
+
+def _rebuild_spot_matrices(graph, cg, modes):
+    # 期间请求用的是沿用下来的旧矩阵，新的算好后一次替换
+    rebuilt = {}
+    for strategy, transport in modes:
+        matrix = build_spot_matrix(graph, cg, strategy, transport)
+        if matrix is not None:
+            rebuilt[(strategy, transport)] = matrix
+    cg.spot_matrices = {**cg.spot_matrices, **rebuilt}
+
+
+# 各种派生数据的重建函数 {cg.stale 里的名字: fn(graph, cg, 缺少的模式集合)}
+REBUILDERS: Dict[str, Callable] = {
+    "route_tables": _rebuild_route_tables,
+    "contraction": _rebuild_contraction,
+    "spot_matrices": _rebuild_spot_matrices,
+}
+
+
+class DerivedRebuilder:
+    """
+    【后台重建线程】
+    只跟踪最新的一张地图 (弱引用，热更新换掉的旧地图不再重建)，同一时间只有一个重建线程。
+    """
+
+    def __init__(self, delay: float = REBUILD_DELAY):
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._graph_ref = None
+        self._thread = None
+        self.counters = {"scheduled": 0, "rebuilds": 0, "failures": 0}
+        self.last_seconds = None
+
+    def schedule(self, graph):
+        """地图的边属性变了: 稍后在后台补建缺少的派生数据"""
+        with self._lock:
+            self._graph_ref = weakref.ref(graph)
+            self.counters["scheduled"] += 1
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="derived-rebuild", daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            # 去抖: 等上报停下来
+            while True:
+                self._wakeup.clear()
+                time.sleep(self.delay)
+                if not self._wakeup.is_set():
+                    break
+            graph = self._graph_ref() if self._graph_ref is not None else None
+            if graph is not None:
+                try:
+                    self.rebuild(graph)
+                except Exception as e:
+                    self.counters["failures"] += 1
+                    print(f"❌ 派生数据后台重建失败，查询继续回退到普通搜索: {e}")
+
+    def rebuild(self, graph):
+        """在当前线程里为地图当前版本补建所有缺少的派生数据 (测试和离线脚本也可以直接调用)"""
+        cg = graph.compile()
+        if not cg.stale:
+            return
+        start = time.time()
+        for name, modes in list(cg.stale.items()):
+            builder = REBUILDERS.get(name)
+            if builder is not None:
+                builder(graph, cg, set(modes))
+            cg.stale.pop(name, None)
+        self.counters["rebuilds"] += 1
+        self.last_seconds = round(time.time() - start, 3)
+        print(f"🔧 派生数据已按地图版本 {cg.version} 重建完成，用时 {self.last_seconds} 秒")
+
+    def stats(self) -> dict:
+        return {**self.counters, "last_seconds": self.last_seconds}
+
+
+# 进程内共享的默认实例
+derived_rebuilder = DerivedRebuilder()
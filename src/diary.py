@@ -1,8 +1,10 @@
 import json
+import math
+import time
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlmodel import Session, select, or_
+from sqlmodel import Session, select, or_, func
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 
 # 导入你自己写的工具模块
@@ -307,4 +309,31 @@ def search_diaries(
             media_files=json.loads(d.media_json) if d.media_json else [],
             created_at=d.created_at
         ))
-    return result
\ No newline at end of file
+    return result
+
+
+# ==========================================
+# 景点吸引力 (给限时游览推荐用)
+# ==========================================
+# 聚合结果的缓存时间 (秒)，推荐游览路线时不必每次都扫一遍日记表
+APPEAL_CACHE_SECONDS = 60
+_appeal_cache = (0.0, {})
+
+def spot_appeal(session: Session) -> Dict[int, float]:
+    """
+    【景点吸引力】{景点ID: 分数}
+    每个景点 = 所有日记的评分之和 + log(1 + 总浏览量)
+    评分体现口碑，浏览量取对数，防止一篇爆款日记把分数拉得太高；没有日记的景点不出现
+    """
+    global _appeal_cache
+    updated_at, cached = _appeal_cache
+    if time.time() - updated_at < APPEAL_CACHE_SECONDS:
+        return cached
+
+    # 在数据库里按景点分组聚合，而不是把日记全部读出来
+    rows = session.exec(
+        select(Diary.spot_id, func.sum(Diary.score), func.sum(Diary.view_count)).group_by(Diary.spot_id)
+    ).all()
+    appeal = {spot_id: float(scores or 0) + math.log1p(views or 0) for spot_id, scores, views in rows}
+    _appeal_cache = (time.time(), appeal)
+    return appeal
@@ -1,14 +1,35 @@
+import argparse
 import json
 import random
 import math
 import os
+import time
+from typing import Dict, List, Tuple
+
+# ==========================================
+# 合成地图生成器 (压测用)
+# ==========================================
+# 生成任意规模 (几百 ~ 100 万节点) 的随机校园路网，格式和打点工具导出的 campus_map.json 一致
+# (spots / edges，边的 key 是 distance / crowding)，可以直接交给 utils.load_graph_from_json 加载。
+#
+# 旧版本每次查节点都线性扫描、连骨架时和所有已连接节点比距离 (O(n²))、查重边要扫整个边表，
+# 几千个节点就跑不动了。现在用网格 (空间哈希) 加速：
+#   1. 节点按固定密度撒在地图上，地图边长随节点数增长
+#   2. 每个节点只和周围 3x3 个格子里最近的几个节点连路 (像真实路网一样只连邻近路口)
+#   3. 并查集合并连通分量：不连通的小块沿着网格向外找最近的、属于其它分量的节点接上
+#   4. 重边用 (小ID, 大ID) 集合去重，O(1)
+# 同一个随机种子总是生成完全相同的地图。
 
 # 配置参数
 OUTPUT_DIR = "data"
-OUTPUT_FILE = "campus_map.json"
+OUTPUT_FILE = "campus_map.json"   # 默认输出就是应用加载的地图 (utils.get_data_path)
 MAP_SIZE = 1000
-MIN_NODES = 200
-EXTRA_EDGES = 100  # 在生成树基础上增加的随机边数量
+MIN_NODES = 220          # 默认节点数 (和旧版本一样)
+NEIGHBORS = 3            # 每个节点连向最近的几个邻居
+SPOT_RATIO = 0.1         # 有名字的景点占比，其余是路点 (type='road')
+WALK_ONLY_RATIO = 0.15   # 非骨干路中只能步行的比例 (骨干路都能骑车，保证自行车也能到达所有节点)
+POINTS_PER_CELL = 2      # 网格每个格子平均放几个节点
+MERGE_TRIES = 20         # 合并孤立分量时最多从几个节点出发找最近的外部节点
 
 # 名字生成的配置
 NAME_CONFIG = {
@@ -21,163 +42,230 @@ NAME_CONFIG = {
 }
 
 DESCRIPTIONS = [
-    "这里环境优美，适合拍照。", "平常这里人比较多。", "是学校的标志性建筑。", 
+    "这里环境优美，适合拍照。", "平常这里人比较多。", "是学校的标志性建筑。",
     "很多同学喜欢在这里晨读。", "刚刚翻新过，设施很新。", "这也是很多猫咪聚集的地方。",
     "历史悠久的建筑。", "你需要刷卡才能进入。", "这里Wi-Fi信号很好。", "比较偏僻，注意安全。"
 ]
 
-def calculate_dist(n1, n2):
-    """计算两个节点间的欧几里得距离"""
-    return math.sqrt((n1['x'] - n2['x'])**2 + (n1['y'] - n2['y'])**2)
+def spot_names(count: int, rng: random.Random):
+    """
+    依次生成 count 个景点的 (名字, 介绍)
+    先用固定名字 (校门、食堂、景点)，再循环生成教学楼，最后用宿舍补足 (编号递增，名字不会重复)
+    """
+    fixed = NAME_CONFIG["gate"] + NAME_CONFIG["canteen"] + NAME_CONFIG["sight"]
+    for name in fixed[:count]:
+        yield name, rng.choice(DESCRIPTIONS)
+    count -= len(fixed)
 
-def generate_nodes():
-    nodes = []
-    node_id = 0
-
-    # 1. 生成固定名字的节点 (Gate, Canteen, Sight)
-    for cat in ["gate", "canteen", "sight"]:
-        for name in NAME_CONFIG[cat]:
-            nodes.append({
-                "id": node_id,
-                "name": name,
-                "category": cat,
-                "x": random.randint(50, MAP_SIZE - 50),
-                "y": random.randint(50, MAP_SIZE - 50),
-                "desc": random.choice(DESCRIPTIONS)
-            })
-            node_id += 1
-
-    # 2. 循环生成教学楼 (Building) - 约 50 个
-    for i in range(1, 51):
-        # 随机分配前缀，例如 "教1楼", "实验楼3号"
-        prefix = random.choice(NAME_CONFIG["building_prefix"])
+    # 教学楼约占剩下的四分之一，例如 "教1楼", "实验楼3"
+    buildings = max(0, min(count, max(50, count // 4)))
+    for i in range(1, buildings + 1):
+        prefix = rng.choice(NAME_CONFIG["building_prefix"])
         suffix = f"{i}号楼" if "楼" not in prefix else f"{i}"
         if prefix == "教": suffix = f"{i}楼"
-        
-        nodes.append({
-            "id": node_id,
-            "name": f"{prefix}{suffix}",
-            "category": "building",
-            "x": random.randint(100, MAP_SIZE - 100),
-            "y": random.randint(100, MAP_SIZE - 100),
-            "desc": f"这是{prefix}{suffix}，主要用于日常教学和办公。"
-        })
-        node_id += 1
-
-    # 3. 循环生成宿舍 (Dorm) - 补足到至少 200 个以上
-    dorm_count = 1
-    while len(nodes) < 220: # 生成到 220 个节点
-        prefix = random.choice(NAME_CONFIG["dorm_prefix"])
-        nodes.append({
-            "id": node_id,
-            "name": f"{prefix}{dorm_count}号楼",
-            "category": "dorm",
-            "x": random.randint(50, MAP_SIZE - 50),
-            "y": random.randint(50, MAP_SIZE - 50),
-            "desc": "学生休息区域，保持安静。"
-        })
-        node_id += 1
-        dorm_count += 1
+        yield f"{prefix}{suffix}", f"这是{prefix}{suffix}，主要用于日常教学和办公。"
+
+    for i in range(1, count - buildings + 1):
+        prefix = rng.choice(NAME_CONFIG["dorm_prefix"])
+        yield f"{prefix}{i}号楼", "学生休息区域，保持安静。"
+
+def map_side(num_nodes: int) -> float:
+    """地图边长：保持和默认 220 个节点 / 1000x1000 地图相同的节点密度"""
+    return MAP_SIZE * math.sqrt(max(num_nodes, MIN_NODES) / MIN_NODES)
+
+def generate_nodes(num_nodes: int, rng: random.Random) -> List[dict]:
+    side = map_side(num_nodes)
+    num_spots = min(num_nodes, max(len(NAME_CONFIG["gate"]) + len(NAME_CONFIG["canteen"])
+                                   + len(NAME_CONFIG["sight"]), round(num_nodes * SPOT_RATIO)))
+    # 景点随机分布在路点之间
+    is_spot = [True] * num_spots + [False] * (num_nodes - num_spots)
+    rng.shuffle(is_spot)
 
-    print(f"✅ 生成节点总数: {len(nodes)}")
+    names = spot_names(num_spots, rng)
+    nodes = []
+    for node_id in range(num_nodes):
+        x = round(rng.uniform(0, side), 1)
+        y = round(rng.uniform(0, side), 1)
+        if is_spot[node_id]:
+            name, desc = next(names)
+            nodes.append({"id": node_id, "name": name, "type": "spot", "x": x, "y": y, "desc": desc})
+        else:
+            nodes.append({"id": node_id, "name": f"路点_{node_id}", "type": "road", "x": x, "y": y})
+
+    print(f"✅ 生成节点总数: {len(nodes)} (景点 {num_spots} 个)，地图大小 {side:.0f}x{side:.0f}")
     return nodes
 
-def generate_edges(nodes):
+class Grid:
+    """【空间哈希网格】格子 (cx, cy) -> 落在里面的节点下标列表"""
+
+    def __init__(self, nodes: List[dict], cell: float):
+        self.cell = cell
+        self.inv = 1.0 / cell
+        self.cells: Dict[Tuple[int, int], List[int]] = {}
+        self.xs = [n['x'] for n in nodes]
+        self.ys = [n['y'] for n in nodes]
+        inv, cells = self.inv, self.cells
+        for i, (x, y) in enumerate(zip(self.xs, self.ys)):
+            key = (int(x * inv), int(y * inv))
+            bucket = cells.get(key)
+            if bucket is None:
+                cells[key] = [i]
+            else:
+                bucket.append(i)
+        self.max_ring = 1 + int(max(max(self.xs, default=0.0), max(self.ys, default=0.0)) * inv)
+
+    def key(self, x: float, y: float) -> Tuple[int, int]:
+        return int(x * self.inv), int(y * self.inv)
+
+    def ring(self, cx: int, cy: int, r: int):
+        """以 (cx, cy) 为中心、切比雪夫半径恰好为 r 的一圈格子里的节点"""
+        cells = self.cells
+        if r == 0:
+            yield from cells.get((cx, cy), ())
+            return
+        for dx in range(-r, r + 1):
+            yield from cells.get((cx + dx, cy - r), ())
+            yield from cells.get((cx + dx, cy + r), ())
+        for dy in range(-r + 1, r):
+            yield from cells.get((cx - r, cy + dy), ())
+            yield from cells.get((cx + r, cy + dy), ())
+
+    def nearest_where(self, i: int, accept) -> int:
+        """
+        离节点 i 最近的、满足 accept(j) 的节点 (一圈一圈向外找)
+        第 r 圈找到候选后再多看一圈就够了: 更外面的格子离 i 至少 r * cell 远
+        """
+        x, y = self.xs[i], self.ys[i]
+        cx, cy = self.key(x, y)
+        best, best_d = -1, float('inf')
+        for r in range(self.max_ring + 1):
+            if best != -1 and (r - 1) * self.cell > best_d:
+                break
+            for j in self.ring(cx, cy, r):
+                if j != i and accept(j):
+                    d = math.hypot(self.xs[j] - x, self.ys[j] - y)
+                    if d < best_d:
+                        best, best_d = j, d
+        return best
+
+def generate_edges(nodes: List[dict], rng: random.Random, neighbors: int = NEIGHBORS) -> List[dict]:
+    n = len(nodes)
     edges = []
-    connected_ids = {nodes[0]['id']} # 已连接到主图的节点ID集合
-    remaining_ids = [n['id'] for n in nodes[1:]] # 尚未连接的节点ID列表
-
-    # --- 第一阶段：构建骨架 (保证连通性) ---
-    # 逻辑：每次从“未连接集合”中取出一个节点，连接到“已连接集合”中距离它最近的那个点。
-    # 这类似 Prim 算法的思想，生成的图路网比较自然，不会出现超长连线。
-    
-    
-    while remaining_ids:
-        # 随机取一个未连接的点（为了打乱顺序，避免线性偏向）
-        current_id = remaining_ids.pop(random.randint(0, len(remaining_ids) - 1))
-        current_node = next(n for n in nodes if n['id'] == current_id)
-
-        # 在已连接的节点中寻找距离最近的点
-        nearest_id = -1
-        min_dist = float('inf')
-
-        for cid in connected_ids:
-            target_node = next(n for n in nodes if n['id'] == cid)
-            d = calculate_dist(current_node, target_node)
-            if d < min_dist:
-                min_dist = d
-                nearest_id = cid
-        
-        # 添加这条骨干边
+    if n < 2:
+        return edges
+
+    side = map_side(n)
+    grid = Grid(nodes, side / math.sqrt(n / POINTS_PER_CELL))
+    xs, ys = grid.xs, grid.ys
+
+    # 并查集: 哪些节点已经连在一起
+    parent = list(range(n))
+
+    def find(a: int) -> int:
+        while parent[a] != a:
+            parent[a] = parent[parent[a]]
+            a = parent[a]
+        return a
+
+    def add_edge(a: int, b: int):
+        ra, rb = find(a), find(b)
+        backbone = ra != rb  # 连接了两个分量的路是骨干路
+        if backbone:
+            parent[ra] = rb
+        road_type = "walk" if not backbone and rng.random() < WALK_ONLY_RATIO else "bike"
         edges.append({
-            "u": current_id,
-            "v": nearest_id,
-            "dist": round(min_dist, 2),
-            "type": "walk", # 骨干路默认为步行
-            "crowding": round(random.uniform(0.5, 1.5), 2)
+            "u": nodes[a]['id'],
+            "v": nodes[b]['id'],
+            "distance": round(math.hypot(xs[a] - xs[b], ys[a] - ys[b]), 2),
+            "crowding": round(rng.uniform(0.5, 1.5), 2),
+            "type": road_type
         })
-        connected_ids.add(current_id)
-
-    print(f"✅ 骨架构建完成，当前边数: {len(edges)}")
-
-    # --- 第二阶段：添加随机边 (增加复杂度) ---
-    # 随机连接两个点，模拟捷径或骑行道
-    added_count = 0
-    while added_count < EXTRA_EDGES:
-        u = random.choice(nodes)
-        v = random.choice(nodes)
-
-        # 避免自环
-        if u['id'] == v['id']:
-            continue
-        
-        # 避免重复边 (检查是否已经存在 u-v 或 v-u)
-        exists = False
-        for e in edges:
-            if (e['u'] == u['id'] and e['v'] == v['id']) or \
-               (e['u'] == v['id'] and e['v'] == u['id']):
-                exists = True
-                break
-        
-        if not exists:
-            dist = calculate_dist(u, v)
-            # 只有距离不太远的点才连接，避免横跨整个地图的奇怪路线
-            if dist < 300: 
-                edges.append({
-                    "u": u['id'],
-                    "v": v['id'],
-                    "dist": round(dist, 2),
-                    "type": random.choice(["walk", "bike"]),
-                    "crowding": round(random.uniform(0.5, 2.0), 2)
-                })
-                added_count += 1
-
-    print(f"✅ 随机边添加完成，总边数: {len(edges)}")
+
+    # --- 第一阶段：连接邻近路口 ---
+    # 按格子处理：同一个格子里的节点共享同一批 3x3 候选，只取一次
+    # 先只记下要连的节点对 (a * n + b, a < b)，用字典去重并保持插入顺序
+    pairs: Dict[int, None] = {}
+    cells = grid.cells
+    for (cx, cy) in sorted(cells):
+        candidates = [j for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+                      for j in cells.get((cx + dx, cy + dy), ())]
+        cxs = [xs[j] for j in candidates]
+        cys = [ys[j] for j in candidates]
+        for i in cells[(cx, cy)]:
+            x, y = xs[i], ys[i]
+            near = sorted([((px - x) ** 2 + (py - y) ** 2, j) for px, py, j in zip(cxs, cys, candidates)])
+            # 距离最近的是 i 自己，跳过
+            for _, j in near[1:neighbors + 1]:
+                if i != j:
+                    pairs[i * n + j if i < j else j * n + i] = None
+    for key in pairs:
+        add_edge(key // n, key % n)
+
+    print(f"✅ 邻近路口连接完成，当前边数: {len(edges)}")
+
+    # --- 第二阶段：把孤立的小块接到最近的其它分量上 (保证连通) ---
+    components: Dict[int, List[int]] = {}
+    for i in range(n):
+        components.setdefault(find(i), []).append(i)
+    # 最大的分量不用动，其余每个分量各接一条路出去，每接一条分量数减一，最后正好连成一片
+    ordered = sorted(components.values(), key=len, reverse=True)
+    for members in ordered[1:]:
+        root = find(members[0])
+        best = None
+        # 从分量里的 (最多 MERGE_TRIES 个) 节点分别找最近的外部节点，取最短的那条
+        for a in members[:MERGE_TRIES]:
+            b = grid.nearest_where(a, lambda j: find(j) != root)
+            if b != -1:
+                d = math.hypot(xs[a] - xs[b], ys[a] - ys[b])
+                if best is None or d < best[0]:
+                    best = (d, a, b)
+        add_edge(best[1], best[2])
+    merged = len(ordered) - 1
+
+    print(f"✅ 连通性修复完成，合并了 {merged} 个孤立分量，总边数: {len(edges)}")
     return edges
 
 def main():
+    parser = argparse.ArgumentParser(description="生成随机校园地图 (压测用)")
+    parser.add_argument("nodes", nargs="?", type=int, default=MIN_NODES, help="节点数 (默认 220)")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子，相同种子生成相同地图")
+    parser.add_argument("--neighbors", type=int, default=NEIGHBORS, help="每个节点连向最近的几个邻居")
+    parser.add_argument("--out", default=None, help="输出路径 (默认 data/campus_map.json，即应用加载的地图)")
+    parser.add_argument("--synthetic", action="store_true",
+                        help="输出到 data/synthetic_map_<节点数>.json，不覆盖应用加载的地图 (压测用)")
+    args = parser.parse_args()
+
     # 1. 确保目录存在
-    if not os.path.exists(OUTPUT_DIR):
-        os.makedirs(OUTPUT_DIR)
-        print(f"📂 创建目录: {OUTPUT_DIR}")
+    if args.out:
+        out_path = args.out
+    elif args.synthetic:
+        out_path = os.path.join(OUTPUT_DIR, f"synthetic_map_{args.nodes}.json")
+    else:
+        out_path = os.path.join(OUTPUT_DIR, OUTPUT_FILE)
+    out_dir = os.path.dirname(out_path)
+    if out_dir and not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+        print(f"📂 创建目录: {out_dir}")
 
     # 2. 生成数据
-    nodes = generate_nodes()
-    edges = generate_edges(nodes)
+    start = time.time()
+    rng = random.Random(args.seed)
+    nodes = generate_nodes(args.nodes, rng)
+    edges = generate_edges(nodes, rng, args.neighbors)
 
     data = {
-        "nodes": nodes,
+        "spots": nodes,
         "edges": edges
     }
 
-    # 3. 写入文件
-    filepath = os.path.join(OUTPUT_DIR, OUTPUT_FILE)
-    with open(filepath, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
-    
-    print(f"🎉 数据生成成功！已保存至: {filepath}")
+    # 3. 写入文件 (大地图不缩进，文件小一半；先整体序列化再写，比 json.dump 逐块写快得多)
+    text = json.dumps(data, ensure_ascii=False, indent=4 if len(nodes) <= 5000 else None)
+    with open(out_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+    print(f"🎉 数据生成成功！用时 {time.time() - start:.1f} 秒，已保存至: {out_path}")
     print(f"   - 节点数: {len(nodes)}")
     print(f"   - 边数: {len(edges)}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,180 @@
+import os
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from algorithms import _dijkstra_core, mode_weights
+from route_cache import mode_change, repair_tree, EPS
+from route_table import ROUTE_MODES
+
+# ==========================================
+# 地标预处理 (ALT: A*, Landmarks, Triangle inequality)
+# ==========================================
+# 纯直线距离的 A* 在 'time' 策略下很弱: 缩放系数取的是全图最小拥挤度，拥挤度差别一大，
+# 启发值就远远低于真实耗时，A* 几乎退化成 Dijkstra。
+#
+# 这里选出少量 "地标" (优先是校门，再按离已选地标最远的原则补充景点)，
+# 对每种导航模式预先算好每个地标到所有节点的最短距离 d(L, ·)。由三角不等式：
+#     d(v, t) >= |d(L, t) - d(L, v)|
+# 对所有地标取最大值就是一个可采纳、一致的下界，再和直线距离下界取最大值交给 A*。
+#
+# 预处理量是 "地标数 × 模式数" 次 Dijkstra，介于不预处理和全源表 (n 次) 之间，
+# 适合建不起全源表的中等规模地图。拥挤度变化时 (CompiledGraph.patched)，
+# 地标的最短路径树按变化日志增量修复 (route_cache.repair_tree)，不需要重新预处理。
+
+# 地标个数，设为 0 关闭此功能
+LANDMARK_COUNT = int(os.getenv("LANDMARK_COUNT", "8"))
+
+# 节点数超过这个值就不做地标预处理 (内存 O(地标数 × 模式数 × n))
+LANDMARK_MAX_NODES = int(os.getenv("LANDMARK_MAX_NODES", "100000"))
+
+# 每次查询只用在起点处下界最大的这几个地标 (地标越多，每次松弛的计算越多)
+ACTIVE_LANDMARKS = 4
+
+# 名称里带这个字的景点当作校门，优先选为地标 (出入口通常在地图边缘，下界效果最好)
+GATE_KEYWORD = "门"
+
+
+class LandmarkDistances:
+    """
+    【单一模式的地标距离】
+    dist[i][v] 是第 i 个地标到节点下标 v 的最短距离 (不可达为 inf)，
+    prev[i] 是对应的最短路径树，拥挤度变化时用来增量修复。
+    """
+
+    def __init__(self, strategy: str, transport: str, dist: List[array], prev: List[array]):
+        self.strategy = strategy
+        self.transport = transport
+        self.dist = dist
+        self.prev = prev
+
+    def select(self, source: int, target: int, count: int = ACTIVE_LANDMARKS) -> List[Tuple[array, float]]:
+        """
+        挑出对这次查询最有用的地标: 按起点处的下界从大到小取前 count 个
+        :return: [(地标距离数组, 地标到终点的距离), ...]，到不了终点的地标不返回
+        """
+        inf = float('inf')
+        scored = []
+        for d in self.dist:
+            dt = d[target]
+            if dt == inf:
+                continue
+            scored.append((abs(dt - d[source]), d, dt))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [(d, dt) for _, d, dt in scored[:count]]
+
+    def patched(self, cg, changes) -> "LandmarkDistances":
+        """按边变化修复所有地标的最短路径树，权重没有变化时直接返回自己"""
+        affected = any(
+            abs(old - new) > EPS
+            for old, new in (mode_change(cg, c, self.strategy, self.transport) for c in changes)
+            if old != new
+        )
+        if not affected:
+            return self
+        # 复制后再修复: 旧的编译图上可能还有请求在用这些数组
+        dist = [array('d', d) for d in self.dist]
+        prev = [array('i', p) for p in self.prev]
+        for d, p in zip(dist, prev):
+            repair_tree(cg, d, p, self.strategy, self.transport, changes)
+        return LandmarkDistances(self.strategy, self.transport, dist, prev)
+
+
+class LandmarkSet:
+    """
+    【一组地标及其各模式下的距离】
+    挂在 CompiledGraph.landmarks 上；地图结构变化时随编译结果一起作废，
+    只有边属性变化时由 CompiledGraph.patched 调用 patched() 得到修复后的新对象。
+    """
+
+    def __init__(self, nodes: List[int], modes: Dict[Tuple[str, str], LandmarkDistances]):
+        self.nodes = nodes    # 地标的节点下标
+        self.modes = modes    # {(strategy, transport): LandmarkDistances}
+
+    def get(self, strategy: str, transport: str) -> Optional[LandmarkDistances]:
+        return self.modes.get((strategy, transport))
+
+    def patched(self, cg, changes) -> "LandmarkSet":
+        repaired: Dict[LandmarkDistances, LandmarkDistances] = {}
+        modes = {}
+        for key, distances in self.modes.items():
+            # 权重相同的模式共用同一份数据，修复一次就够
+            if distances not in repaired:
+                repaired[distances] = distances.patched(cg, changes)
+            modes[key] = repaired[distances]
+        return LandmarkSet(self.nodes, modes)
+
+
+def _tree(cg, weights, source: int) -> Tuple[array, array]:
+    dist, prev = _dijkstra_core(cg, weights, source)
+    return array('d', dist), array('i', prev)
+
+
+def select_landmarks(graph, cg, count: int) -> Tuple[List[int], List[Tuple[array, array]]]:
+    """
+    【选地标】
+    1. 名称带 "门" 的景点 (校门) 优先，最多占一半名额，按连接的道路数从多到少；
+       没有校门时从连接道路最多的景点 (枢纽) 开始
+    2. 剩下的名额在景点里按 "离已选地标最远" 依次补充 (最远点采样)，让地标分散在地图四周
+    景点太少时在所有节点里选。
+    :return: (地标下标列表, 'dist' 策略步行模式下每个地标的最短路径树)，后者顺便给预处理复用
+    """
+    # 景点下标 -> 名称 (读 spot_records，快照地图不会因此把每个 Spot 对象都建出来)
+    names = {cg.index[r["id"]]: r["name"] for r in graph.spot_records()
+             if r["type"] == 'spot' and r["id"] in cg.index}
+    spots = list(names)
+    candidates = spots if len(spots) >= count else list(range(cg.num_nodes))
+
+    def degree(i):
+        return cg.offsets[i + 1] - cg.offsets[i]
+
+    gates = sorted((i for i in spots if GATE_KEYWORD in names[i]), key=degree, reverse=True)
+    chosen = gates[:max(1, count // 2)] or [max(candidates, key=degree)]
+
+    weights = mode_weights(cg, 'dist', 'walk')
+    trees = [_tree(cg, weights, i) for i in chosen]
+    # 每个候选点到已选地标的最近距离
+    nearest = [min(tree[0][i] for tree in trees) for i in candidates]
+    while len(chosen) < count:
+        best = max(range(len(candidates)), key=lambda j: nearest[j])
+        if nearest[best] <= 0:
+            break  # 候选点已经全部选完
+        node = candidates[best]
+        chosen.append(node)
+        tree = _tree(cg, weights, node)
+        trees.append(tree)
+        for j, i in enumerate(candidates):
+            if tree[0][i] < nearest[j]:
+                nearest[j] = tree[0][i]
+    return chosen, trees
+
+
+def build_landmarks(graph, count: int = LANDMARK_COUNT,
+                    max_nodes: int = LANDMARK_MAX_NODES) -> Optional[LandmarkSet]:
+    """
+    【预处理入口】
+    为当前版本的地图选地标、算好所有导航模式的地标距离，并挂到编译后的图上。
+    权重完全相同的模式 (例如没有只能步行的道路时，两种交通方式下的 'dist') 共用同一份数据。
+    """
+    cg = graph.compile()
+    cg.landmarks = None
+    if count <= 0 or cg.num_nodes == 0 or cg.num_nodes > max_nodes:
+        return None
+
+    nodes, walk_trees = select_landmarks(graph, cg, min(count, cg.num_nodes))
+    walk_weights = mode_weights(cg, 'dist', 'walk')
+    built: List[Tuple[array, LandmarkDistances]] = []
+    modes = {}
+    for strategy, transport in ROUTE_MODES:
+        weights = mode_weights(cg, strategy, transport)
+        distances = next((d for w, d in built if w == weights), None)
+        if distances is None:
+            trees = walk_trees if weights == walk_weights else [_tree(cg, weights, i) for i in nodes]
+            distances = LandmarkDistances(strategy, transport,
+                                          [t[0] for t in trees], [t[1] for t in trees])
+            built.append((weights, distances))
+        modes[(strategy, transport)] = distances
+
+    cg.landmarks = LandmarkSet(nodes, modes)
+    names = "、".join(graph.get_spot_name(cg.node_ids[i]) for i in nodes[:4])
+    print(f"✅ 地标预处理完成: {len(nodes)} 个地标 ({names}...), {len(built)} 份距离数据")
+    return cg.landmarks
@@ -0,0 +1,116 @@
+import os
+import threading
+from bisect import bisect_right
+from typing import Callable, List, Optional, Set
+
+# ==========================================
+# 地图热更新 (Hot Reload)
+# ==========================================
+# 修改 data/campus_map.json (例如用 tests/map_tool.html 重新打点) 之后不必重启服务：
+#   1. 后台线程定时检查地图文件 (或管理员调用 /admin/map/reload)
+#   2. 在后台加载新地图、校验、预计算派生数据，期间旧地图照常服务
+#   3. 一次赋值原子地换掉全局地图引用；已经开始的请求手里拿的还是旧地图，会在旧版本上算完
+#      (拥挤度上报也不会原地修改旧的 Edge 对象和编译结果，见 CampusGraph.update_edges)
+# 校验不通过时保留旧地图，只打印原因。
+
+# 检查地图文件变化的间隔 (秒)，设为 0 关闭自动检查 (仍可通过接口手动触发)
+MAP_WATCH_INTERVAL = float(os.getenv("MAP_WATCH_INTERVAL", "2"))
+
+# 道路类型的合法取值 ('walk' = 只能步行, 'bike' = 可以骑车, None = 不限制)
+ROAD_TYPES = {'walk', 'bike', None}
+
+
+def validate_graph(graph) -> List[str]:
+    """
+    【新地图校验】返回致命问题列表 (空列表表示可以上线)
+    直接检查编译后的距离 / 拥挤度数组，不逐条构造 Edge 对象 (快照加载的地图里它们是按需创建的，
+    全部建出来要好几秒，等于白白抵消了快照的启动速度)。
+    端点不存在的道路和不认识的道路类型只打印警告 (编译时本来就会被忽略 / 当作可骑行)，不阻止上线。
+    """
+    problems = []
+    cg = graph.compile()
+    if cg.num_nodes == 0:
+        problems.append("地图中没有任何节点")
+
+    # 每条道路在 CSR 里正反各有一条有向边，按原始道路序号去重后报告
+    inf = float('inf')
+    bad = {}
+    for k, (d, c) in enumerate(zip(cg.distance, cg.crowding)):
+        # NaN 和任何数比较都是 False，所以也会被挑出来
+        if not (0 < d < inf and 0 < c < inf):
+            bad.setdefault(cg.arc_edge[k], k)
+    for e, k in sorted(bad.items()):
+        u = cg.node_ids[bisect_right(cg.offsets, k) - 1]
+        v = cg.node_ids[cg.targets[k]]
+        d, c = cg.distance[k], cg.crowding[k]
+        if not 0 < d < inf:
+            problems.append(f"第 {e} 条道路 {u}-{v} 的距离必须为正数: {d}")
+        if not 0 < c < inf:
+            problems.append(f"第 {e} 条道路 {u}-{v} 的拥挤度必须为正数: {c}")
+
+    dangling = len(graph.edges) - len(set(cg.arc_edge))
+    if dangling:
+        print(f"⚠️ 警告: 有 {dangling} 条道路的端点不存在，已忽略")
+    unknown = _road_types(graph) - ROAD_TYPES
+    if unknown:
+        print(f"⚠️ 警告: 不认识的道路类型 {sorted(unknown)}，按不限制交通方式处理")
+    return problems
+
+
+def _road_types(graph) -> Set[Optional[str]]:
+    """地图里出现过的道路类型；快照加载的地图直接读字符串表，不创建 Edge 对象"""
+    snap = graph.snapshot
+    if snap is not None:
+        return {snap.string(idx) for idx in set(snap.edge_type)}
+    return {edge.type for edge in graph.edges}
+
+
+class MapWatcher:
+    """
+    【地图文件监视线程】
+    定时比较文件的 (修改时间, 大小)，变化后要连续两次检查都不再变化才触发回调，
+    避免读到编辑器还没写完的半个文件。
+    """
+
+    def __init__(self, path: str, on_change: Callable[[], None], interval: float = MAP_WATCH_INTERVAL):
+        self.path = path
+        self.on_change = on_change
+        self.interval = interval
+        self._loaded = self._signature()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _signature(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def start(self):
+        if self.interval <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, name="map-watcher", daemon=True)
+        self._thread.start()
+        print(f"👀 正在监视地图文件变化: {self.path}")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
+
+    def mark_loaded(self):
+        """手动重新加载之后调用，避免同一个版本再被自动加载一次"""
+        self._loaded = self._signature()
+
+    def _run(self):
+        last = self._loaded
+        while not self._stop.wait(self.interval):
+            current = self._signature()
+            if current is not None and current != self._loaded and current == last:
+                self._loaded = current
+                try:
+                    self.on_change()
+                except Exception as e:
+                    print(f"❌ 地图热更新失败，继续使用旧地图: {e}")
+            last = current
@@ -1,6 +1,14 @@
-from typing import Dict, Optional, List
+import threading
+from typing import Dict, Iterator, Optional, List, Tuple, Deque
+from collections import deque
 from datetime import datetime
 from sqlmodel import SQLModel, Field
+from compiled_graph import CompiledGraph, EdgeChange
+from spatial_index import SpatialIndex
+from spot_search import SpotNameIndex
+
+# 边属性变化日志最多保留的条数，缓存落后太多时直接整体清空
+CHANGE_LOG_SIZE = 1000
 
 # ==========================================
 # 景点与地图相关模型 
@@ -29,6 +37,11 @@ class Edge(SQLModel):
     v: int              # 终点ID
     distance: float     # 距离 (像素或米)
     crowding: float = 1.0 # 拥挤度
+    # 道路类型: 'walk' = 只能步行, 'bike' = 可以骑车；不填表示不限制 (旧地图没有这个字段)
+    type: Optional[str] = None
+    # 分时段拥挤度 (可选): 按 CampusGraph.bucket_minutes 把一天切成若干时段，每个时段一个拥挤度
+    # 例如 60 分钟一段时长度为 24，crowding_profile[11] 就是 11:00-12:00 的拥挤度
+    crowding_profile: Optional[List[float]] = None
 
     @property
     def weight(self):
@@ -36,35 +49,152 @@ class Edge(SQLModel):
         return self.distance * self.crowding
 
 class CampusGraph:
-    """图结构类：存储所有的景点和道路"""
+    """
+    图结构类：存储所有的景点和道路
+    对外仍然提供 spots / adj 这些老接口，真正给搜索算法用的是 compile() 编译出的 CSR 结构
+    """
     def __init__(self):
         self.spots: Dict[int, Spot] = {}  # 字典存储所有景点: {ID: Spot对象}
-        self.adj: Dict[int, List[Edge]] = {} # 邻接表: {ID: [Edge对象列表]}
+        self.edges: List[Edge] = []       # 原始无向边列表 (每条路只存一个对象)
+        self.version = 0                  # 地图版本号，每次改动 (包括拥挤度变化) +1
+        self.topology_version = 0         # 结构版本号，只有增加景点 / 道路时 +1
+        self.distance_version = 0         # 道路距离版本号，只有距离被修改时 +1 (拥挤度变化不算)
+        self.bucket_minutes = 60          # 分时段拥挤度每个时段的长度 (分钟)
+        # 边属性变化日志 [(版本号, [EdgeChange...])]，供路径缓存做精确失效
+        self.change_log: Deque[Tuple[int, List[EdgeChange]]] = deque(maxlen=CHANGE_LOG_SIZE)
+        self._adj: Optional[Dict[int, List[Edge]]] = None
+        self._compiled: Optional[CompiledGraph] = None
+        self._edge_lookup = None
+        self._name_index = None
+        self.snapshot = None              # 从二进制快照加载时指向 GraphSnapshot (路线进程池共用这个文件)
+        # 串行化 "改边属性 -> 版本号 +1 -> 写变化日志 -> 打补丁" 以及编译，避免并发的拥挤度更新互相覆盖
+        self._lock = threading.Lock()
+
+    def _touch(self):
+        """地图结构发生变化：版本号 +1，丢弃旧的邻接表视图和编译结果"""
+        self.version += 1
+        self.topology_version += 1
+        self.change_log.clear()
+        self._adj = None
+        self._compiled = None
 
     def add_spot(self, spot: Spot):
         """添加一个景点"""
         self.spots[spot.id] = spot
-        if spot.id not in self.adj:
-            self.adj[spot.id] = []
+        self._touch()
 
     def add_edge(self, edge: Edge):
-        """添加一条路 (自动处理无向图的双向添加)"""
-        # 正向路: u -> v
-        self.adj[edge.u].append(edge)
-        
-        # 反向路: v -> u (创建一条新的反向边)
-        reverse_edge = Edge(
-            u=edge.v, 
-            v=edge.u, 
-            distance=edge.distance, 
-            crowding=edge.crowding
-        )
-        
-        # 确保字典里有 key
-        if edge.v not in self.adj:
-            self.adj[edge.v] = []
-            
-        self.adj[edge.v].append(reverse_edge)
+        """添加一条路 (无向图，正反两个方向在 adj / compile 时自动展开)"""
+        self.edges.append(edge)
+        self._touch()
+
+    @property
+    def adj(self) -> Dict[int, List[Edge]]:
+        """
+        邻接表视图: {ID: [Edge对象列表]}
+        兼容旧代码，第一次访问时才构建 (包含自动生成的反向边)
+        """
+        if self._adj is None:
+            adj: Dict[int, List[Edge]] = {sid: [] for sid in self.spots}
+            for edge in self.edges:
+                # 正向路: u -> v
+                adj.setdefault(edge.u, []).append(edge)
+                # 反向路: v -> u (创建一条新的反向边)
+                reverse_edge = Edge(
+                    u=edge.v,
+                    v=edge.u,
+                    distance=edge.distance,
+                    crowding=edge.crowding,
+                    crowding_profile=edge.crowding_profile,
+                    type=edge.type
+                )
+                adj.setdefault(edge.v, []).append(reverse_edge)
+            self._adj = adj
+        return self._adj
+
+    def find_edge(self, u: int, v: int) -> Optional[int]:
+        """查找连接 u、v 两点的道路序号 (不分方向)，找不到返回 None"""
+        if self._edge_lookup is None or self._edge_lookup[0] != self.topology_version:
+            lookup: Dict[Tuple[int, int], int] = {}
+            for k, edge in enumerate(self.edges):
+                lookup.setdefault((min(edge.u, edge.v), max(edge.u, edge.v)), k)
+            self._edge_lookup = (self.topology_version, lookup)
+        return self._edge_lookup[1].get((min(u, v), max(u, v)))
+
+    def update_edges(self, updates: List[Tuple[int, Optional[float], Optional[float]]]) -> List[EdgeChange]:
+        """
+        【修改道路属性】(例如实时拥挤度)
+        :param updates: [(道路序号, 新距离或None, 新拥挤度或None), ...]
+        :return: 实际发生变化的记录列表
+        拓扑不变，所以只打补丁生成新的编译结果，并把变化写进 change_log。
+        写时复制：换上新的道路列表和新的 Edge 对象，旧的原样保留，已经拿到它们的请求在旧版本上算完。
+        """
+        with self._lock:
+            edges = self.edges.copy()
+            changes = []
+            for k, distance, crowding in updates:
+                edge = edges[k]
+                new_distance = edge.distance if distance is None else distance
+                new_crowding = edge.crowding if crowding is None else crowding
+                if (new_distance, new_crowding) != (edge.distance, edge.crowding):
+                    edges[k] = edge.model_copy(update={"distance": new_distance, "crowding": new_crowding})
+                    changes.append(EdgeChange(k, edge.distance, edge.crowding, new_distance, new_crowding))
+            if not changes:
+                return changes
+
+            # 先生成新的编译结果和日志，最后才把版本号 +1：
+            # 别的线程看到新版本号时，对应的日志和编译结果一定已经就绪
+            version = self.version + 1
+            old_compiled = self._compiled
+            if old_compiled is not None and old_compiled.version == self.version:
+                self._compiled = old_compiled.patched(changes, version)
+            else:
+                self._compiled = None
+            self.change_log.append((version, changes))
+            self.edges = edges
+            self._adj = None
+            if any(c.new_distance != c.old_distance for c in changes):
+                self.distance_version += 1
+            self.version = version
+            return changes
+
+    def compile(self) -> CompiledGraph:
+        """获取 (并缓存) 当前版本地图的 CSR 编译结果"""
+        with self._lock:
+            if self._compiled is None or self._compiled.version != self.version:
+                self._compiled = CompiledGraph.build(self.spots.values(), self.edges, self.version,
+                                                     self.bucket_minutes)
+            return self._compiled
+
+    def spatial_index(self) -> SpatialIndex:
+        """获取 (并缓存) 当前地图的空间索引，用于按坐标找最近的节点 / 道路"""
+        cg = self.compile()
+        if cg.spatial is None:
+            cg.spatial = SpatialIndex(cg)
+        return cg.spatial
+
+    def name_index(self) -> SpotNameIndex:
+        """获取 (并缓存) 景点名称索引，景点增删后自动重建"""
+        if self._name_index is None or self._name_index[0] != self.topology_version:
+            self._name_index = (self.topology_version, SpotNameIndex(self.spot_records()))
+        return self._name_index[1]
+
+    def spot_records(self) -> Iterator[dict]:
+        """
+        所有节点的字段字典 (和 vars(spot) 相同)
+        快照加载的地图直接读字符串表和坐标数组，启动时的预处理不会把每个 Spot 对象都建出来
+        """
+        records = getattr(self.spots, "records", None)
+        if records is not None:
+            return records()
+        return (vars(spot) for spot in self.spots.values())
+
+    def edge_rows(self) -> Iterator[Tuple[int, int, float]]:
+        """所有道路的 (u, v, distance)，快照地图同样不创建 Edge 对象"""
+        rows = getattr(self.edges, "rows", None)
+        if rows is not None:
+            return rows()
+        return ((edge.u, edge.v, edge.distance) for edge in self.edges)
 
     def get_spot_name(self, id):
         """辅助函数：通过ID查名字"""
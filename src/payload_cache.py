@@ -0,0 +1,88 @@
+import gzip
+import hashlib
+import json
+import weakref
+from typing import Callable, Dict, Optional, Tuple
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+# ==========================================
+# 预序列化的响应缓存 (/graph、/spots/list)
+# ==========================================
+# 这两个接口的内容只在地图变化时才变，但每次前端打开页面都要先拉一遍 /graph。
+# 这里每个地图版本只生成一次：
+#   JSON 序列化好的字节 + gzip 压缩好的字节 + 强 ETag
+# 之后的请求直接返回现成的字节；浏览器带着 If-None-Match 回来时返回 304，连正文都不用发。
+
+# gzip 压缩级别 (每个版本只压缩一次，可以用较高的级别)
+GZIP_LEVEL = 9
+
+
+class PreparedPayload:
+    """一份已经序列化好的 JSON 响应 (原文 + gzip 两种表示，各有自己的强 ETag)"""
+    __slots__ = ('body', 'gzip_body', 'etag', 'gzip_etag')
+
+    def __init__(self, data):
+        # 只有 json 自己处理不了的对象 (例如 Spot) 才交给 jsonable_encoder，
+        # 整张大地图的普通字典 / 列表不用再被它逐个遍历一遍
+        self.body = json.dumps(data, default=jsonable_encoder, ensure_ascii=False,
+                               separators=(',', ':')).encode('utf-8')
+        self.gzip_body = gzip.compress(self.body, compresslevel=GZIP_LEVEL, mtime=0)
+        digest = hashlib.sha1(self.body).hexdigest()
+        # 强 ETag 要求字节完全一致，压缩前后是两种不同的表示，所以 ETag 也要区分
+        self.etag = f'"{digest}"'
+        self.gzip_etag = f'"{digest}-gzip"'
+
+    def response(self, request: Request) -> Response:
+        """按请求头选择 304 / gzip / 原文"""
+        use_gzip = 'gzip' in request.headers.get('accept-encoding', '')
+        etag = self.gzip_etag if use_gzip else self.etag
+        headers = {"ETag": etag, "Vary": "Accept-Encoding", "Cache-Control": "no-cache"}
+
+        if _etag_matches(request.headers.get('if-none-match'), (self.etag, self.gzip_etag)):
+            return Response(status_code=304, headers=headers)
+        if use_gzip:
+            headers["Content-Encoding"] = "gzip"
+            return Response(self.gzip_body, media_type="application/json", headers=headers)
+        return Response(self.body, media_type="application/json", headers=headers)
+
+
+def _etag_matches(header: Optional[str], etags) -> bool:
+    """If-None-Match 可能是 "*" 或逗号分隔的多个 ETag (304 判断按弱比较，忽略 W/ 前缀)"""
+    if not header:
+        return False
+    for tag in header.split(','):
+        tag = tag.strip()
+        if tag == '*':
+            return True
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag in etags:
+            return True
+    return False
+
+
+class PayloadCache:
+    """
+    【按地图版本缓存的响应】
+    每个名字只保留最新版本的一份；地图对象换了 (热更新) 或者版本号变了就重新生成。
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, Tuple[weakref.ref, object, PreparedPayload]] = {}
+
+    def get(self, name: str, graph, version, build: Callable[[], object]) -> PreparedPayload:
+        """
+        :param version: 决定内容是否变化的版本号 (任意可比较的值，例如 graph.topology_version 或版本号元组)
+        :param build:   生成响应数据 (可 JSON 序列化的对象) 的函数，只在版本变化时调用
+        """
+        entry = self._entries.get(name)
+        if entry is not None and entry[0]() is graph and entry[1] == version:
+            return entry[2]
+        payload = PreparedPayload(build())
+        self._entries[name] = (weakref.ref(graph), version, payload)
+        return payload
+
+
+payload_cache = PayloadCache()
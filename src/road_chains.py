@@ -0,0 +1,212 @@
+import os
+from array import array
+from typing import List, Optional
+
+from compiled_graph import CompiledGraph, EdgeChange
+
+# ==========================================
+# 路点链收缩 (Road Chain Contraction)
+# ==========================================
+# 地图里大部分节点是 "路点_N" 这种 type='road'、只连着两条路的点，
+# 它们只是为了让道路在地图上拐弯 (tests/map_tool.html 画出的地图尤其多)。
+# 加载地图时把这样的路点链 A - x1 - x2 - ... - B 收缩成一条 A - B 的 "骨架边"：
+#   - 距离 = 链上距离之和
+#   - 拥挤度 = 按距离加权的平均拥挤度 (这样 'time' 策略的耗时也和逐段相加完全一致)
+#   - 链上有任何一段只能步行，整条骨架边就不能骑车
+# 搜索在小得多的骨架图上进行，找到路径后再把每条骨架边展开回原来的路点，
+# /navigate 返回的 path_ids / path_coords 和不收缩时完全一样。
+#
+# 景点 (type='spot') 和路口永远保留在骨架图上；起终点恰好是链中间的路点时
+# (例如 /spots/snap 吸附到了路点上)，算法自动回退到完整的图上搜索。
+
+# 设为 0 关闭路点链收缩
+ROAD_CHAIN_CONTRACTION = int(os.getenv("ROAD_CHAIN_CONTRACTION", "1"))
+
+# 收缩后节点至少要减少这个比例才值得使用骨架图 (否则展开路径的开销得不偿失)
+MIN_CONTRACTED_RATIO = 0.1
+
+
+class RoadSkeleton:
+    """
+    【骨架图】
+    - graph:     骨架图本身 (CompiledGraph，所有搜索内核可以直接在上面跑)，
+                 它的 arc_edge[k] 是骨架边对应的链编号
+    - full_of:   骨架下标 -> 完整图下标
+    - skel_of:   完整图下标 -> 骨架下标 (被收缩掉的路点为 -1)
+    - chains:    每条链经过的完整图节点下标 (含两端)
+    - chain_edges: 每条链经过的原始无向边序号
+    - edge_chain:  原始无向边序号 -> 链编号 (不在任何链上为 -1)
+    """
+
+    def __init__(self, graph: CompiledGraph, full_of: array, skel_of: array,
+                 chains: List[array], chain_edges: List[array], edge_chain: array):
+        self.graph = graph
+        self.full_of = full_of
+        self.skel_of = skel_of
+        self.chains = chains
+        self.chain_edges = chain_edges
+        self.edge_chain = edge_chain
+
+    def covers(self, *nodes: int) -> bool:
+        """这些完整图下标是否都在骨架图上"""
+        skel_of = self.skel_of
+        return all(skel_of[i] != -1 for i in nodes)
+
+    def expand(self, path: List[int], weights) -> List[int]:
+        """
+        骨架下标路径 -> 完整图下标路径
+        两点之间有多条骨架边 (平行的链) 时取当前权重最小的那条，和搜索时松弛的是同一条
+        """
+        if not path:
+            return []
+        sg = self.graph
+        offsets, targets, arc_edge = sg.offsets, sg.targets, sg.arc_edge
+        full_of = self.full_of
+        result = [full_of[path[0]]]
+        for a, b in zip(path, path[1:]):
+            best_k = -1
+            for k in range(offsets[a], offsets[a + 1]):
+                if targets[k] == b and (best_k == -1 or weights[k] < weights[best_k]):
+                    best_k = k
+            chain = self.chains[arc_edge[best_k]]
+            if chain[0] == result[-1]:
+                result.extend(chain[1:])
+            else:
+                result.extend(reversed(chain[:-1]))
+        return result
+
+    def patched(self, cg: CompiledGraph, changes: List[EdgeChange]) -> "RoadSkeleton":
+        """
+        道路属性变化后，重新计算受影响的链的距离 / 拥挤度，
+        骨架图本身用 CompiledGraph.patched 打补丁 (没变的派生数据照常沿用)
+        """
+        touched = {self.edge_chain[c.edge] for c in changes} - {-1}
+        if not touched:
+            return self
+        sg = self.graph
+        chain_changes = []
+        for c in touched:
+            distance, crowding = _chain_weight(cg, self.chain_edges[c])
+            k = sg.edge_arcs(c)[0]
+            chain_changes.append(EdgeChange(c, sg.distance[k], sg.crowding[k], distance, crowding))
+        graph = sg.patched(chain_changes, cg.version)
+        return RoadSkeleton(graph, self.full_of, self.skel_of, self.chains, self.chain_edges,
+                            self.edge_chain)
+
+
+def _chain_weight(cg: CompiledGraph, edges) -> tuple:
+    """链的总距离和按距离加权的平均拥挤度"""
+    total = weighted = 0.0
+    for e in edges:
+        k = cg.edge_arcs(e)[0]
+        total += cg.distance[k]
+        weighted += cg.distance[k] * cg.crowding[k]
+    return total, (weighted / total if total > 0 else 1.0)
+
+
+def contract_road_chains(graph, min_ratio: float = MIN_CONTRACTED_RATIO) -> Optional[RoadSkeleton]:
+    """
+    【收缩入口】
+    找出所有只连着两个不同邻居的路点，把它们串成的链收缩成骨架边，结果挂在 cg.skeleton 上。
+    节点减少的比例不到 min_ratio 时不使用骨架图，返回 None。
+    """
+    cg = graph.compile()
+    cg.skeleton = None
+    n = cg.num_nodes
+    if not ROAD_CHAIN_CONTRACTION or n == 0:
+        return None
+    offsets, targets, arc_edge = cg.offsets, cg.targets, cg.arc_edge
+
+    # 1. 可以收缩的路点 (类型从 spot_records 读，不逐个创建 Spot 对象)
+    road = bytearray(n)
+    for r in graph.spot_records():
+        i = cg.index.get(r["id"])
+        if i is not None and r["type"] == 'road':
+            road[i] = 1
+    interior = bytearray(n)
+    for i in range(n):
+        start = offsets[i]
+        if offsets[i + 1] - start != 2 or not road[i]:
+            continue
+        a, b = targets[start], targets[start + 1]
+        if a != b and a != i and b != i:
+            interior[i] = 1
+
+    skeleton_nodes = [i for i in range(n) if not interior[i]]
+    if len(skeleton_nodes) > n * (1 - min_ratio):
+        return None
+
+    # 2. 从每个骨架节点的每条边出发，沿路点一直走到下一个骨架节点
+    num_edges = max(arc_edge) + 1 if len(arc_edge) else 0
+    edge_chain = array('i', [-1]) * num_edges
+    walked = bytearray(num_edges)
+    chains: List[array] = []
+    chain_edges: List[array] = []
+    for a in skeleton_nodes:
+        for k in range(offsets[a], offsets[a + 1]):
+            if walked[arc_edge[k]]:
+                continue
+            nodes = [a]
+            edges = [arc_edge[k]]
+            cur = targets[k]
+            while interior[cur]:
+                first = offsets[cur]
+                nk = first if arc_edge[first] != edges[-1] else first + 1
+                nodes.append(cur)
+                edges.append(arc_edge[nk])
+                cur = targets[nk]
+            nodes.append(cur)
+            for e in edges:
+                walked[e] = 1
+            if cur == a:
+                continue  # 绕回原地的环，不可能出现在最短路径上
+            for e in edges:
+                edge_chain[e] = len(chains)
+            chains.append(array('i', nodes))
+            chain_edges.append(array('i', edges))
+
+    # 3. 把链编译成骨架图的 CSR 结构
+    skel_of = array('i', [-1]) * n
+    for s, i in enumerate(skeleton_nodes):
+        skel_of[i] = s
+    m = len(skeleton_nodes)
+    degree = [0] * m
+    for chain in chains:
+        degree[skel_of[chain[0]]] += 1
+        degree[skel_of[chain[-1]]] += 1
+    sk_offsets = array('i', [0]) * (m + 1)
+    for s in range(m):
+        sk_offsets[s + 1] = sk_offsets[s] + degree[s]
+
+    arcs = sk_offsets[m]
+    sk_targets = array('i', [0]) * arcs
+    sk_distance = array('d', [0.0]) * arcs
+    sk_crowding = array('d', [0.0]) * arcs
+    sk_chain = array('i', [0]) * arcs
+    sk_bikeable = array('b', [1]) * arcs
+    cursor = list(sk_offsets[:m])
+    for c, (chain, edges) in enumerate(zip(chains, chain_edges)):
+        distance, crowding = _chain_weight(cg, edges)
+        bike = 1
+        if cg.bikeable is not None and not all(cg.edge_bikeable(e) for e in edges):
+            bike = 0
+        u, v = skel_of[chain[0]], skel_of[chain[-1]]
+        for x, y in ((u, v), (v, u)):
+            pos = cursor[x]
+            sk_targets[pos] = y
+            sk_distance[pos] = distance
+            sk_crowding[pos] = crowding
+            sk_chain[pos] = c
+            sk_bikeable[pos] = bike
+            cursor[x] = pos + 1
+
+    full_of = array('i', skeleton_nodes)
+    node_ids = array('q', (cg.node_ids[i] for i in skeleton_nodes))
+    xs = array('d', (cg.xs[i] for i in skeleton_nodes))
+    ys = array('d', (cg.ys[i] for i in skeleton_nodes))
+    sg = CompiledGraph(node_ids, xs, ys, sk_offsets, sk_targets, sk_distance, sk_crowding, sk_chain,
+                       cg.version, bucket_minutes=cg.bucket_minutes, bikeable=sk_bikeable)
+
+    cg.skeleton = RoadSkeleton(sg, full_of, skel_of, chains, chain_edges, edge_chain)
+    print(f"✅ 路点链收缩完成: {n} -> {m} 个节点, {cg.num_arcs // 2} -> {len(chains)} 条边")
+    return cg.skeleton
@@ -0,0 +1,523 @@
+import heapq
+import math
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple, Iterable
+
+from compiled_graph import EdgeChange
+from algorithms import (
+    SEARCH_ALGORITHMS, plan_multi_point_route, mode_weights, edge_cost,
+    heuristic_scale, time_dependent_search, _dijkstra_core, _tree_path,
+)
+
+# ==========================================
+# 路径缓存 (Versioned LRU Route Cache)
+# ==========================================
+# /navigate 的流量高度集中在少数热门点对 (西门 -> 食堂、西门 -> 图书馆 ...)，
+# 这里在 algorithms.py 的各个算法前面加一层进程内 LRU 缓存：
+#   1. 路线缓存: (起点, 终点, 途经点集合, 策略, 交通方式, 地图结构版本, 出发分钟) -> 路线
+#   2. 最短路径树缓存: (起点下标, 策略, 交通方式) -> 一对全的 dist / prev 数组
+#      同一个起点被反复查询时，后续请求直接在树上回溯，不再搜索。
+#
+# 失效规则 (精确失效，而不是有变化就全部清空)：
+#   - 地图结构变化 (topology_version 改变): 全部清空
+#   - 某条边的距离 / 拥挤度变化: 读取 CampusGraph.change_log，
+#       只清理真正可能受影响的路线 (见 _route_affected)，
+#       最短路径树则复制一份用动态最短路算法修复后替换 (见 _repair_tree)
+#
+# FastAPI 在线程池里执行同步接口，所有对缓存结构的读写都在 self._lock 里进行；
+# 搜索本身在锁外做，算完后如果地图已经又变了 (编译结果的版本号落后)，结果直接丢弃不入缓存。
+
+ROUTE_CACHE_SIZE = int(os.getenv("ROUTE_CACHE_SIZE", "1024"))
+TREE_CACHE_SIZE = int(os.getenv("TREE_CACHE_SIZE", "64"))
+
+# 同一个起点被查询到第几次时，改为计算整棵最短路径树并缓存
+TREE_BUILD_THRESHOLD = 2
+
+# 浮点比较的容差
+EPS = 1e-9
+
+
+def merge_changes(pending) -> List[EdgeChange]:
+    """
+    把多个版本的变化日志合并成一批：同一条边只保留 "最早的旧值 -> 最新的新值"
+    :param pending: [(版本号, [EdgeChange...]), ...]，按版本号升序
+    """
+    merged: Dict[int, EdgeChange] = {}
+    for _, changes in pending:
+        for change in changes:
+            first = merged.get(change.edge)
+            if first is None:
+                merged[change.edge] = change
+            else:
+                merged[change.edge] = first._replace(
+                    new_distance=change.new_distance, new_crowding=change.new_crowding
+                )
+    return list(merged.values())
+
+
+def mode_change(cg, change, strategy: str, transport: str) -> Tuple[float, float]:
+    """某条边在指定模式下的 (旧权重, 新权重)，当前交通方式不能走的边两者都是无穷大"""
+    if transport == 'bike' and not cg.edge_bikeable(change.edge):
+        return float('inf'), float('inf')
+    old = edge_cost(change.old_distance, change.old_crowding, strategy, transport)
+    new = edge_cost(change.new_distance, change.new_crowding, strategy, transport)
+    return old, new
+
+
+def repair_tree(cg, dist, prev, strategy: str, transport: str, changes) -> bool:
+    """
+    【动态单源最短路：增量修复最短路径树】
+    不重新跑整棵树，只处理真正受影响的部分：
+    1. 变重的树边 u -> v：v 的整棵子树失去了最短路，先把它们标成 "待定"
+       (dist = inf)，再从子树外的邻居给它们一个临时距离放进堆里
+    2. 变轻的边 u -> v：如果经过它能让 v 更近，直接更新 v 并放进堆里
+    3. 从这些种子出发跑一遍 Dijkstra，只会扩展到距离真的变化的节点
+    校园路网是无向图，正反两条有向边权重相同，所以 "入边" 直接用出边数组代替。
+    :return: 树是否有变化
+    """
+    weights = mode_weights(cg, strategy, transport)
+    offsets, targets = cg.offsets, cg.targets
+    inf = float('inf')
+
+    # 按本模式下的权重变化分类，端点用下标表示
+    increased = []
+    decreased = []
+    for change in changes:
+        old_w, new_w = mode_change(cg, change, strategy, transport)
+        if old_w == new_w or abs(old_w - new_w) <= EPS:
+            continue
+        arcs = cg.edge_arcs(change.edge)
+        if not arcs:
+            continue
+        a, b = cg.targets[arcs[0]], cg.targets[arcs[-1]]
+        for u, v in ((a, b), (b, a)):
+            if new_w > old_w:
+                if prev[v] == u and abs(dist[u] + old_w - dist[v]) <= EPS:
+                    increased.append(v)
+            else:
+                decreased.append((u, v, new_w))
+    if not increased and not decreased:
+        return False
+
+    heap = []
+    # 1. 变重的树边：整棵子树标记为待定 (子节点表只在需要时构建一次)
+    if increased:
+        children: List[List[int]] = [[] for _ in range(len(prev))]
+        for node, parent in enumerate(prev):
+            if parent != -1:
+                children[parent].append(node)
+        affected = []
+        stack = list(increased)
+        while stack:
+            x = stack.pop()
+            if dist[x] == inf:
+                continue
+            dist[x] = inf
+            prev[x] = -1
+            affected.append(x)
+            stack.extend(children[x])
+        # 从子树外面的邻居重新接上
+        for x in affected:
+            for k in range(offsets[x], offsets[x + 1]):
+                y = targets[k]
+                candidate = dist[y] + weights[k]
+                if candidate < dist[x]:
+                    dist[x] = candidate
+                    prev[x] = y
+            if dist[x] < inf:
+                heapq.heappush(heap, (dist[x], x))
+
+    # 2. 变轻的边：能改进就更新
+    for u, v, w in decreased:
+        if dist[u] + w < dist[v] - EPS:
+            dist[v] = dist[u] + w
+            prev[v] = u
+            heapq.heappush(heap, (dist[v], v))
+
+    # 3. 只在受影响的区域内继续做 Dijkstra
+    while heap:
+        cost, x = heapq.heappop(heap)
+        if cost > dist[x]:
+            continue
+        for k in range(offsets[x], offsets[x + 1]):
+            y = targets[k]
+            candidate = cost + weights[k]
+            if candidate < dist[y] - EPS:
+                dist[y] = candidate
+                prev[y] = x
+                heapq.heappush(heap, (candidate, y))
+    return True
+
+
+class RouteEntry:
+    """一条缓存的路线"""
+    __slots__ = ('path_ids', 'cost', 'edges', 'nodes', 'strategy', 'transport', 'timed')
+
+    def __init__(self, path_ids, cost, edges, nodes, strategy, transport, timed=False):
+        self.path_ids = path_ids    # 完整路径 (景点ID)
+        self.cost = cost            # 总消耗
+        self.edges = edges          # 路线用到的无向边序号集合
+        self.nodes = nodes          # 关键节点下标 (起点、途经点、终点)，用于边变短时的下界判断
+        self.strategy = strategy
+        self.transport = transport
+        self.timed = timed          # 是否按分时段拥挤度规划 (权重随时刻变化)
+
+
+class ShortestPathTree:
+    """一棵缓存的一对全最短路径树 (节点都是 CompiledGraph 下标)"""
+    __slots__ = ('source', 'dist', 'prev', 'strategy', 'transport')
+
+    def __init__(self, source, dist, prev, strategy, transport):
+        self.source = source
+        self.dist = dist
+        self.prev = prev
+        self.strategy = strategy
+        self.transport = transport
+
+
+class RouteCache:
+    """
+    【带版本号的 LRU 路径缓存】
+    OrderedDict 按访问顺序排列，命中时移到末尾，超出容量时从头部淘汰。
+    下划线开头的方法都假定调用方已经持有 self._lock。
+    """
+
+    def __init__(self, maxsize: int = ROUTE_CACHE_SIZE, tree_maxsize: int = TREE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.tree_maxsize = tree_maxsize
+        self.routes: "OrderedDict[tuple, RouteEntry]" = OrderedDict()
+        self.trees: "OrderedDict[tuple, ShortestPathTree]" = OrderedDict()
+        # 边 -> 使用了这条边的路线 key，边变长时直接按索引失效
+        self.edge_index: Dict[int, set] = {}
+        # 各起点被查询 (未命中) 的次数，用来决定是否值得建整棵树
+        self.source_counts: Dict[tuple, int] = {}
+
+        # 当前缓存对应的地图 (弱引用：热更新换掉的旧地图被回收后，新地图可能复用同一个 id)
+        self._graph_ref = None
+        self._topology_version = None
+        self._seen_version = None
+
+        self._lock = threading.Lock()
+
+        self.counters = {
+            "hits": 0, "misses": 0, "evictions": 0, "invalidations": 0,
+            "tree_hits": 0, "tree_misses": 0, "tree_evictions": 0, "tree_repairs": 0,
+        }
+
+    # ------------------------------------------
+    # 同步地图变化
+    # ------------------------------------------
+    def clear(self):
+        """清空所有缓存条目 (计数器保留)"""
+        with self._lock:
+            self._clear()
+
+    def _clear(self):
+        self.routes.clear()
+        self.trees.clear()
+        self.edge_index.clear()
+        self.source_counts.clear()
+
+    def sync(self, graph):
+        """
+        对齐地图版本：结构变了就全部清空；只是边属性变了就按变化日志精确失效
+        每次读写缓存之前调用。
+        """
+        with self._lock:
+            self._sync(graph)
+
+    def _sync(self, graph):
+        # 以编译结果的版本为准: 读版本号和日志的同时可能又有新的拥挤度更新写进来，
+        # 修复用的权重 (cg) 和消费的日志必须对应同一个版本
+        cg = graph.compile()
+        current = self._graph_ref() if self._graph_ref is not None else None
+        if current is not graph or self._topology_version != graph.topology_version:
+            self._clear()
+            self._graph_ref = weakref.ref(graph)
+            self._topology_version = graph.topology_version
+            self._seen_version = cg.version
+            return
+        if self._seen_version == cg.version:
+            return
+
+        pending = [(v, changes) for v, changes in list(graph.change_log)
+                   if self._seen_version < v <= cg.version]
+        # 日志被截断，缺了中间的变化，无法精确判断，只能全清
+        if not pending or pending[0][0] != self._seen_version + 1:
+            self._clear()
+        else:
+            self.invalidate_changes(cg, merge_changes(pending))
+        self._seen_version = cg.version
+
+    def _is_current(self, graph, cg) -> bool:
+        """
+        在 cg 上算出的结果现在还能不能入缓存：
+        计算期间地图被热更新替换，或者又有新的边变化已经被 _sync 消费掉时，
+        这个结果不会再被任何失效流程处理到，只能丢弃
+        """
+        current = self._graph_ref() if self._graph_ref is not None else None
+        return current is graph and cg.version == graph.version == self._seen_version
+
+    def invalidate_changes(self, cg, changes):
+        """根据一批边变化，清理受影响的路线，并修复受影响的最短路径树"""
+        for key, tree in list(self.trees.items()):
+            repaired = self._repair_tree(cg, tree, changes)
+            if repaired is not tree:
+                self.trees[key] = repaired
+                self.counters["tree_repairs"] += 1
+
+        for change in changes:
+            # 在任何模式下权重都没有变小时，只有用到这条边的路线会受影响，直接查反向索引
+            if all(new >= old for old, new in (mode_change(cg, change, s, t) for s, t in self._modes())):
+                candidates = list(self.edge_index.get(change.edge, ()))
+            else:
+                candidates = list(self.routes)
+            for key in candidates:
+                entry = self.routes[key]
+                if self._route_affected(cg, entry, change):
+                    self._drop_route(key)
+                    self.counters["invalidations"] += 1
+
+    def _modes(self):
+        """当前缓存里出现过的 (strategy, transport) 组合"""
+        return {(e.strategy, e.transport) for e in self.routes.values()}
+
+    def _route_affected(self, cg, entry: RouteEntry, change) -> bool:
+        """
+        路线是否可能因为这条边的变化而不再最优 (或代价不对)：
+        - 权重不变 (例如 'dist' 策略下只改了拥挤度): 不受影响
+        - 权重变大: 只有用到这条边的路线受影响
+        - 权重变小: 用 A* 的直线距离下界判断，这条边有没有可能让任意两个关键点之间更近
+        """
+        old_w, new_w = mode_change(cg, change, entry.strategy, entry.transport)
+        if old_w == new_w or abs(old_w - new_w) <= EPS:
+            return False
+        if entry.timed:
+            return True  # 分时段路线的权重不是单一数值，下界判断不成立，保守处理
+        if new_w > old_w:
+            return change.edge in entry.edges
+        if change.edge in entry.edges:
+            return True  # 代价变了，缓存的 cost 不再准确
+
+        arcs = cg.edge_arcs(change.edge)
+        if not arcs:
+            return False
+        a, b = cg.targets[arcs[0]], cg.targets[arcs[-1]]
+        scale = heuristic_scale(cg, entry.strategy, entry.transport)
+        xs, ys = cg.xs, cg.ys
+
+        def lower_bound(x, y):
+            return scale * math.hypot(xs[x] - xs[y], ys[x] - ys[y])
+
+        # 任意两个关键点 p -> q 经过这条边的距离下界，如果都不比路线总代价小，就不可能改善
+        for p in entry.nodes:
+            for q in entry.nodes:
+                if p == q:
+                    continue
+                bound = min(lower_bound(p, a) + new_w + lower_bound(b, q),
+                            lower_bound(p, b) + new_w + lower_bound(a, q))
+                if bound < entry.cost - EPS:
+                    return True
+        return False
+
+    def _repair_tree(self, cg, tree: ShortestPathTree, changes) -> ShortestPathTree:
+        """
+        修复一棵缓存的最短路径树，返回修复后的新树 (没有变化时返回原来的树)
+        复制后再修复: 别的请求 (单段查询、等时圈) 可能正拿着旧树的 dist / prev 在回溯
+        """
+        if all(old == new or abs(old - new) <= EPS
+               for old, new in (mode_change(cg, c, tree.strategy, tree.transport) for c in changes)):
+            return tree
+        dist, prev = list(tree.dist), list(tree.prev)
+        if not repair_tree(cg, dist, prev, tree.strategy, tree.transport, changes):
+            return tree
+        return ShortestPathTree(tree.source, dist, prev, tree.strategy, tree.transport)
+
+    # ------------------------------------------
+    # 路线缓存
+    # ------------------------------------------
+    def _drop_route(self, key):
+        entry = self.routes.pop(key)
+        for e in entry.edges:
+            keys = self.edge_index.get(e)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.edge_index[e]
+
+    def _store_route(self, key, entry: RouteEntry):
+        if key in self.routes:
+            self._drop_route(key)
+        self.routes[key] = entry
+        for e in entry.edges:
+            self.edge_index.setdefault(e, set()).add(key)
+        while len(self.routes) > self.maxsize:
+            oldest = next(iter(self.routes))
+            self._drop_route(oldest)
+            self.counters["evictions"] += 1
+
+    @staticmethod
+    def _path_edges(cg, weights, index_path: List[int]) -> frozenset:
+        """路径 (下标序列) 实际用到的无向边序号 (平行边取权重最小的那条)"""
+        edges = set()
+        targets, offsets, arc_edge = cg.targets, cg.offsets, cg.arc_edge
+        for u, v in zip(index_path, index_path[1:]):
+            best_k = -1
+            for k in range(offsets[u], offsets[u + 1]):
+                if targets[k] == v and (best_k == -1 or weights[k] < weights[best_k]):
+                    best_k = k
+            if best_k != -1:
+                edges.add(arc_edge[best_k])
+        return frozenset(edges)
+
+    # ------------------------------------------
+    # 最短路径树缓存
+    # ------------------------------------------
+    def get_tree(self, graph, source_id: int, strategy: str, transport: str,
+                 build: bool = False) -> Optional[ShortestPathTree]:
+        """
+        取某个起点的一对全最短路径树
+        :param build: 缓存里没有时是否现场计算一棵并放入缓存
+        """
+        with self._lock:
+            self._sync(graph)
+            cg = graph.compile()
+            source = cg.index.get(source_id)
+            if source is None:
+                return None
+            key = (source, strategy, transport)
+            tree = self.trees.get(key)
+            if tree is not None:
+                self.trees.move_to_end(key)
+                self.counters["tree_hits"] += 1
+                return tree
+            self.counters["tree_misses"] += 1
+        if not build:
+            return None
+
+        dist, prev = _dijkstra_core(cg, mode_weights(cg, strategy, transport), source)
+        tree = ShortestPathTree(source, dist, prev, strategy, transport)
+        with self._lock:
+            if self._is_current(graph, cg):
+                self._put_tree(key, tree)
+        return tree
+
+    def put_tree(self, key, tree: ShortestPathTree):
+        with self._lock:
+            self._put_tree(key, tree)
+
+    def _put_tree(self, key, tree: ShortestPathTree):
+        self.trees[key] = tree
+        self.trees.move_to_end(key)
+        while len(self.trees) > self.tree_maxsize:
+            self.trees.popitem(last=False)
+            self.counters["tree_evictions"] += 1
+
+    # ------------------------------------------
+    # 对外入口
+    # ------------------------------------------
+    def find_route(self, graph, start_id: int, end_id: Optional[int] = None,
+                   via_ids: Iterable[int] = (), strategy: str = 'dist',
+                   transport: str = 'walk', algorithm: str = 'dijkstra',
+                   depart_seconds: Optional[float] = None,
+                   planner: Optional[Callable] = None) -> Tuple[List[int], float]:
+        """
+        【带缓存的路线查询】
+        返回值与 dijkstra_search / plan_multi_point_route 相同: (path_ids, total_cost)，不可达时 ([], -1)
+        :param depart_seconds: 出发时刻 (当天第几秒)，只对有分时段拥挤度的 'time' 策略生效
+        :param planner: 缓存未命中时代替 plan_multi_point_route 做多点规划的函数 (参数相同，不含 graph)，
+                        例如把计算交给进程池
+        """
+        via_set = frozenset(via_ids)
+        with self._lock:
+            self._sync(graph)
+            cg = graph.compile()
+
+            # 分时段导航：出发时刻按分钟取整后放进 key，同一分钟出发的请求共享结果
+            timed = depart_seconds is not None and strategy == 'time' and cg.profiles is not None
+            depart_minute = int(depart_seconds // 60) if timed else None
+            key = (start_id, end_id, via_set, strategy, transport, graph.topology_version, depart_minute)
+
+            entry = self.routes.get(key)
+            if entry is not None:
+                self.routes.move_to_end(key)
+                self.counters["hits"] += 1
+                return entry.path_ids, entry.cost
+            self.counters["misses"] += 1
+
+        if via_set:
+            if planner is None:
+                planner = partial(plan_multi_point_route, cg)
+            path_ids, cost = planner(
+                start_id, list(via_ids), strategy, transport, algorithm, end_id=end_id,
+                depart_seconds=depart_minute * 60 if timed else None
+            )
+        elif timed:
+            path_ids, cost = time_dependent_search(
+                cg, start_id, end_id, depart_minute * 60, transport, use_heuristic=(algorithm == 'astar')
+            )
+        else:
+            path_ids, cost = self._single_leg(graph, cg, start_id, end_id, strategy, transport, algorithm)
+
+        if not path_ids:
+            return path_ids, cost  # 不可达的结果不缓存
+
+        weights = mode_weights(cg, strategy, transport)
+        index_path = [cg.index[pid] for pid in path_ids]
+        key_ids = [start_id, *via_set] + ([end_id] if end_id is not None else [])
+        nodes = tuple({cg.index[pid] for pid in key_ids if pid in cg.index})
+        entry = RouteEntry(path_ids, cost, self._path_edges(cg, weights, index_path), nodes,
+                           strategy, transport, timed)
+        with self._lock:
+            # 算的过程中拥挤度又变了: 这条路线是按旧权重算的，变化已经被别的请求同步掉，不能再入缓存
+            if self._is_current(graph, cg):
+                self._store_route(key, entry)
+        return path_ids, cost
+
+    def _single_leg(self, graph, cg, start_id, end_id, strategy, transport, algorithm):
+        """单段查询：优先用缓存的最短路径树，热门起点会被升级为整棵树"""
+        target = cg.index.get(end_id)
+        source = cg.index.get(start_id)
+        if source is None or target is None:
+            return [], -1
+
+        # 有全源表时查表已经足够快，不需要建树
+        if (strategy, transport) not in cg.route_tables:
+            count_key = (source, strategy, transport)
+            with self._lock:
+                self.source_counts[count_key] = self.source_counts.get(count_key, 0) + 1
+                build = self.source_counts[count_key] >= TREE_BUILD_THRESHOLD
+                if len(self.source_counts) > self.maxsize * 4:
+                    self.source_counts.clear()
+
+            tree = self.get_tree(graph, start_id, strategy, transport, build=build)
+            if tree is not None:
+                if tree.dist[target] == float('inf'):
+                    return [], -1
+                return [cg.node_ids[i] for i in _tree_path(tree.prev, target)], tree.dist[target]
+
+        return SEARCH_ALGORITHMS[algorithm](cg, start_id, end_id, strategy, transport)
+
+    def stats(self) -> dict:
+        """命中 / 未命中 / 淘汰 / 失效计数，以及当前条目数"""
+        with self._lock:
+            return self._stats()
+
+    def _stats(self) -> dict:
+        total = self.counters["hits"] + self.counters["misses"]
+        return {
+            **self.counters,
+            "hit_rate": round(self.counters["hits"] / total, 4) if total else 0.0,
+            "routes": len(self.routes),
+            "trees": len(self.trees),
+            "maxsize": self.maxsize,
+            "tree_maxsize": self.tree_maxsize,
+        }
+
+
+# 进程内共享的默认缓存实例
+route_cache = RouteCache()
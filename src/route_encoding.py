@@ -0,0 +1,163 @@
+from typing import List, Sequence, Tuple
+
+# ==========================================
+# 紧凑路线编码 (Compact Route Geometry)
+# ==========================================
+# /navigate 默认把每个节点的 ID、名称、浮点坐标都原样返回，
+# 多点游览路线动辄上千个点，JSON 很大，手机在校园 Wi-Fi 下加载慢。
+# 紧凑模式:
+#   1. 坐标按精度取整后做差分，再用 polyline 算法编码成一个字符串 (或直接返回差分整数)
+#   2. 可选 Douglas-Peucker 抽稀: 在给定像素误差内去掉共线的中间点 (景点永远保留)
+#   3. 只给 type='spot' 的节点带名称，路点 "路点_123" 这种名字不再发送
+
+# 支持的坐标编码方式
+GEOMETRY_FORMATS = ('polyline', 'delta')
+
+# 坐标精度 (小数位数) 上限
+MAX_COORD_PRECISION = 5
+
+
+def simplify(coords: Sequence[Sequence[float]], tolerance: float, keep: Sequence[int] = ()) -> List[int]:
+    """
+    【Douglas-Peucker 抽稀】
+    :param tolerance: 允许的最大偏差 (像素)，<= 0 时不抽稀
+    :param keep:      必须保留的点的下标 (例如景点)，抽稀在相邻两个必保留点之间分段进行
+    :return: 保留下来的点的下标 (升序)，首尾两点总是保留
+    """
+    n = len(coords)
+    if n <= 2 or tolerance <= 0:
+        return list(range(n))
+
+    kept = [False] * n
+    anchors = sorted({0, n - 1, *(i for i in keep if 0 <= i < n)})
+    for i in anchors:
+        kept[i] = True
+
+    tol2 = tolerance * tolerance
+    # 用栈代替递归，长路线不会爆递归深度
+    stack = list(zip(anchors, anchors[1:]))
+    while stack:
+        a, b = stack.pop()
+        if b - a < 2:
+            continue
+        ax, ay = coords[a][0], coords[a][1]
+        dx, dy = coords[b][0] - ax, coords[b][1] - ay
+        length2 = dx * dx + dy * dy
+        worst, worst_d2 = -1, tol2
+        for i in range(a + 1, b):
+            px, py = coords[i][0] - ax, coords[i][1] - ay
+            if length2 > 0:
+                # 点到线段 a-b 的距离平方 (投影落在线段外时取到端点的距离)
+                t = min(1.0, max(0.0, (px * dx + py * dy) / length2))
+                ex, ey = px - t * dx, py - t * dy
+            else:
+                ex, ey = px, py  # 首尾重合 (绕回原地的路线)
+            d2 = ex * ex + ey * ey
+            if d2 > worst_d2:
+                worst, worst_d2 = i, d2
+        if worst != -1:
+            kept[worst] = True
+            stack.append((a, worst))
+            stack.append((worst, b))
+    return [i for i in range(n) if kept[i]]
+
+
+def delta_encode(coords: Sequence[Sequence[float]], precision: int = 0) -> List[int]:
+    """
+    【差分编码】坐标乘以 10^precision 取整，返回 [x0, y0, dx1, dy1, dx2, dy2, ...]
+    相邻路点坐标很接近，差分后基本都是一两位数
+    """
+    scale = 10 ** precision
+    result = []
+    px = py = 0
+    for point in coords:
+        x = round(point[0] * scale)
+        y = round(point[1] * scale)
+        result.append(x - px)
+        result.append(y - py)
+        px, py = x, y
+    return result
+
+
+def delta_decode(values: Sequence[int], precision: int = 0) -> List[Tuple[float, float]]:
+    """delta_encode 的逆运算"""
+    scale = 10 ** precision
+    coords = []
+    x = y = 0
+    for i in range(0, len(values) - 1, 2):
+        x += values[i]
+        y += values[i + 1]
+        coords.append((x / scale, y / scale))
+    return coords
+
+
+def encode_polyline(coords: Sequence[Sequence[float]], precision: int = 0) -> str:
+    """
+    【Polyline 编码】(Google Encoded Polyline 算法，按 x, y 的顺序)
+    每个差分值转成 5 位一组的变长编码，每组映射成一个可打印 ASCII 字符，
+    前端可以直接用现成的 polyline 解码库 (把 precision 传进去)。
+    """
+    chunks = []
+    for value in delta_encode(coords, precision):
+        value = ~(value << 1) if value < 0 else value << 1
+        while value >= 0x20:
+            chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+            value >>= 5
+        chunks.append(chr(value + 63))
+    return "".join(chunks)
+
+
+def decode_polyline(text: str, precision: int = 0) -> List[Tuple[float, float]]:
+    """encode_polyline 的逆运算"""
+    values = []
+    value = shift = 0
+    for ch in text:
+        b = ord(ch) - 63
+        value |= (b & 0x1f) << shift
+        shift += 5
+        if b < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value = shift = 0
+    return delta_decode(values, precision)
+
+
+def compact_route(graph, path_ids: List[int], cost: float, strategy: str, geometry: str = 'polyline',
+                  precision: int = 0, tolerance: float = 0.0) -> dict:
+    """
+    把路径整理成紧凑格式:
+    - path_ids:    完整的节点ID序列 (不受抽稀影响)
+    - spot_names:  [[在 path_ids 中的位置, 名称], ...]，只包含 type='spot' 的节点
+    - geometry:    抽稀后的坐标 (polyline 字符串或差分整数列表)
+    - geometry_ids: 抽稀后保留的点在 path_ids 中的位置 (没有抽稀时省略)
+    """
+    coords = []
+    spot_names = []
+    for pos, pid in enumerate(path_ids):
+        spot = graph.spots.get(pid)
+        if spot is None:
+            coords.append((0, 0))  # 防止报错 (与完整格式一致)
+            continue
+        coords.append((spot.x, spot.y))
+        if spot.type == 'spot':
+            spot_names.append([pos, spot.name])
+
+    # 景点是导航时要报站的点，抽稀时必须保留
+    kept = simplify(coords, tolerance, [pos for pos, _ in spot_names])
+    points = [coords[i] for i in kept]
+    if geometry == 'delta':
+        encoded = delta_encode(points, precision)
+    else:
+        encoded = encode_polyline(points, precision)
+
+    payload = {
+        "path_ids": path_ids,
+        "spot_names": spot_names,
+        "geometry": encoded,
+        "geometry_format": geometry,
+        "precision": precision,
+        "total_cost": round(cost, 1),
+        "cost_unit": "米" if strategy == 'dist' else "秒"
+    }
+    if len(kept) < len(path_ids):
+        payload["geometry_ids"] = kept
+    return payload
@@ -0,0 +1,266 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import weakref
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional, Tuple
+
+from algorithms import batch_routes, k_shortest_paths, plan_multi_point_route
+
+# ==========================================
+# 路线规划进程池 (重计算请求)
+# ==========================================
+# /navigate 是同步接口，在 FastAPI 的线程池里运行。一个 20 个途经点的游览路线要建代价矩阵、
+# 做局部搜索，全程持有 GIL，同一个 worker 里其它请求 (哪怕只是查一下景点列表) 都会跟着变慢。
+#
+# 这里把 "重" 请求交给独立的子进程：
+#   - 途经点很多的多点规划、k 条备选路线、大批量导航
+#   - 子进程从二进制快照 (snapshot.py) mmap 加载地图，多个进程共享同一份页缓存，只读
+#   - 实时拥挤度的变化 (CampusGraph.change_log) 随每个任务一起发过去，子进程打补丁后再算
+#   - 每个请求有时间预算: 局部搜索到点就返回当前最好的解，超过预算的请求返回 504；
+#     截止时刻随任务一起发给子进程，建代价矩阵 / 批量导航 / 局部搜索都会在检查点上自己停下，
+#     返回 504 之后子进程不会继续空算、占着进程池
+# 单段导航这类轻请求照常在当前线程里算 (查表 / 查缓存只要几毫秒，进程间通信反而更慢)。
+
+# 子进程数，设为 0 关闭进程池 (所有请求都在当前线程计算，仍然受时间预算约束)
+ROUTE_POOL_WORKERS = int(os.getenv("ROUTE_POOL_WORKERS", "2"))
+
+# 途经点达到这个数量的多点规划算 "重" 请求
+HEAVY_VIA_COUNT = int(os.getenv("HEAVY_VIA_COUNT", "8"))
+
+# 批量导航达到这么多对起终点算 "重" 请求
+HEAVY_BATCH_PAIRS = int(os.getenv("HEAVY_BATCH_PAIRS", "100"))
+
+# 重请求的时间预算 (秒)
+ROUTE_TIME_BUDGET = float(os.getenv("ROUTE_TIME_BUDGET", "10"))
+
+# 进程间传输、同步拥挤度、两个检查点之间的单次搜索这些不受 deadline 控制的部分，额外再等这么久
+BUDGET_GRACE = 2.0
+
+# 可以交给子进程的任务
+TASKS = {
+    "plan": plan_multi_point_route,
+    "alternatives": k_shortest_paths,
+    "batch": batch_routes,
+}
+# 所有任务都接受 deadline 参数: 有当前最好结果的 (局部搜索、已找到的备选路线) 到点就返回，
+# 没有的 (代价矩阵、批量导航) 抛 TimeoutError
+
+
+class RouteTimeout(Exception):
+    """重请求超过了时间预算"""
+
+
+# ------------------------------------------
+# 子进程
+# ------------------------------------------
+_worker_graph = None
+_worker_sync = None  # 子进程已经应用到的拥挤度版本
+
+
+def _init_worker(snap_path: str, map_path: str, source_sha1: str):
+    """子进程初始化: mmap 加载快照，并按和主进程一样的方式预计算全源表 / 收缩层次 / 骨架图"""
+    global _worker_graph
+    from snapshot import GraphSnapshot, graph_from_snapshot
+    from route_table import build_route_tables
+    from contraction import load_contraction_hierarchies
+    from road_chains import contract_road_chains
+
+    snap = GraphSnapshot(snap_path)
+    if not snap.valid_format or snap.source_sha1 != source_sha1:
+        raise RuntimeError(f"路线进程池的地图快照已被替换: {snap_path}")
+    graph = graph_from_snapshot(snap)
+    build_route_tables(graph)
+    load_contraction_hierarchies(graph, map_path)
+    contract_road_chains(graph)
+    _worker_graph = graph
+
+
+def _warm_up() -> int:
+    return os.getpid()
+
+
+def _run_task(sync_version: int, overrides: Dict[int, Tuple[float, float]], name: str, args, kwargs):
+    """在子进程里执行一个任务 (先把拥挤度同步到和主进程一致)"""
+    global _worker_sync
+    if sync_version != _worker_sync:
+        if overrides:
+            _worker_graph.update_edges([(k, d, c) for k, (d, c) in overrides.items()])
+        _worker_sync = sync_version
+    return TASKS[name](_worker_graph, *args, **kwargs)
+
+
+# ------------------------------------------
+# 主进程
+# ------------------------------------------
+class RoutePool:
+    """
+    【路线进程池】
+    每张地图 (热更新后的新地图对象) 对应一组子进程；
+    _overrides 记录从快照之后所有改过的道路的最新 (距离, 拥挤度)，子进程据此打补丁。
+    """
+
+    def __init__(self, workers: int = ROUTE_POOL_WORKERS):
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._graph_ref = None
+        self._pending = None   # 正在后台重启的地图
+        self._map_path = None
+        self._tmpdir = None
+        self._synced_version = 0
+        self._overrides: Dict[int, Tuple[float, float]] = {}
+        self.counters = {"pooled": 0, "inline": 0, "timeouts": 0, "restarts": 0}
+
+    def active(self, graph) -> bool:
+        """这张地图的重请求是否会交给子进程"""
+        return self._executor is not None and self._graph_ref is not None and self._graph_ref() is graph
+
+    def start(self, graph, map_path: str, reuse_snapshot: bool = True, restarting: bool = False):
+        """
+        为 graph 启动一组子进程 (旧的一组在手头任务完成后退出)
+        地图本身就是从快照加载的就直接共用那个文件，否则写一份临时快照。
+        :param restarting: 由 _restart 在后台调用；期间地图被热更新换掉的话就放弃
+        """
+        if self.workers <= 0:
+            return
+        from snapshot import GraphSnapshot, save_snapshot
+
+        tmpdir = None
+        snap = graph.snapshot if reuse_snapshot else None
+        if snap is not None:
+            snap_path = snap.path
+            base_version = 1  # 快照加载的地图版本号从 1 开始
+        else:
+            # 先记版本号再写快照: 写的过程中拥挤度又变了也没关系，子进程会按覆盖表再设一遍
+            base_version = graph.version
+            tmpdir = tempfile.mkdtemp(prefix="route_pool_")
+            snap_path = save_snapshot(graph, map_path, os.path.join(tmpdir, "graph.snapshot"))
+            snap = GraphSnapshot(snap_path)
+
+        executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),  # 不 fork 带着线程的服务进程
+            initializer=_init_worker,
+            initargs=(snap_path, map_path, snap.source_sha1),
+        )
+        # 提前把子进程拉起来 (加载快照需要一点时间，不要让第一个请求等)
+        for future in [executor.submit(_warm_up) for _ in range(self.workers)]:
+            future.result()
+
+        with self._lock:
+            if restarting and (self._pending is None or self._pending() is not graph):
+                old_executor, old_tmpdir = executor, tmpdir  # 已经过时，直接丢掉新启动的这组
+                executor = None
+            else:
+                old_executor, old_tmpdir = self._executor, self._tmpdir
+                self._pending = None
+                self._executor = executor
+                self._graph_ref = weakref.ref(graph)
+                self._map_path = map_path
+                self._tmpdir = tmpdir
+                self._synced_version = base_version
+                self._overrides = {}
+        self._dispose(old_executor, old_tmpdir)
+        if executor is not None:
+            print(f"⚙️ 路线进程池已启动: {self.workers} 个子进程，快照 {snap_path}")
+
+    def stop(self):
+        with self._lock:
+            old_executor, old_tmpdir = self._executor, self._tmpdir
+            self._executor = self._graph_ref = self._tmpdir = self._pending = None
+        self._dispose(old_executor, old_tmpdir)
+
+    @staticmethod
+    def _dispose(executor, tmpdir):
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        if tmpdir is not None:
+            shutil.rmtree(tmpdir, ignore_errors=True)  # 子进程已经 mmap 的内容不受影响
+
+    def _sync(self, graph) -> bool:
+        """把主进程的拥挤度变化并进 _overrides；change_log 已经不完整时返回 False"""
+        version = graph.version  # 只读一次: 日志总是先于版本号写入，这个版本之前的日志一定齐全
+        if version == self._synced_version:
+            return True
+        entries = [(v, changes) for v, changes in list(graph.change_log)
+                   if self._synced_version < v <= version]
+        if not entries or entries[0][0] != self._synced_version + 1 or entries[-1][0] != version:
+            return False
+        for _, changes in entries:
+            for change in changes:
+                self._overrides[change.edge] = (change.new_distance, change.new_crowding)
+        self._synced_version = version
+        return True
+
+    def run(self, graph, name: str, *args, **kwargs):
+        """
+        执行一个重任务，返回值与 algorithms 里对应的函数相同
+        进程池没启动、地图已经被热更新换掉、或者子进程崩溃时，在当前线程里算
+        :raises RouteTimeout: 超过时间预算
+        """
+        deadline = time.time() + ROUTE_TIME_BUDGET
+        kwargs["deadline"] = deadline
+
+        with self._lock:
+            active = self.active(graph)
+            synced = active and self._sync(graph)
+            if synced:
+                executor = self._executor
+                task = (self._synced_version, dict(self._overrides))
+
+        if not synced:
+            if active:
+                # 拥挤度变化太多，change_log 接不上了: 用当前地图重新生成快照
+                self._restart(graph)
+            return self._run_inline(graph, name, args, kwargs)
+
+        try:
+            future = executor.submit(_run_task, *task, name, args, kwargs)
+            self.counters["pooled"] += 1
+            return future.result(timeout=max(0.0, deadline - time.time()) + BUDGET_GRACE)
+        except (FutureTimeout, TimeoutError):
+            # 等待超时，或者子进程自己在检查点上发现到点了
+            future.cancel()
+            self.counters["timeouts"] += 1
+            raise RouteTimeout(f"超过 {ROUTE_TIME_BUDGET:g} 秒的时间预算")
+        except BrokenProcessPool:
+            print("❌ 路线进程池崩溃，本次在当前线程计算并重启进程池")
+            self._restart(graph)
+            return self._run_inline(graph, name, args, kwargs)
+
+    def _run_inline(self, graph, name: str, args, kwargs):
+        """在当前线程里执行任务，同样受时间预算约束"""
+        self.counters["inline"] += 1
+        try:
+            return TASKS[name](graph, *args, **kwargs)
+        except TimeoutError:
+            self.counters["timeouts"] += 1
+            raise RouteTimeout(f"超过 {ROUTE_TIME_BUDGET:g} 秒的时间预算")
+
+    def _restart(self, graph):
+        """在后台线程里用一份新的临时快照重启进程池 (不阻塞当前请求)"""
+        self.counters["restarts"] += 1
+        with self._lock:
+            if not self.active(graph):
+                return
+            self._graph_ref = None  # 重启完成前，这张地图的请求都在当前线程计算
+            self._pending = weakref.ref(graph)
+            map_path = self._map_path
+        threading.Thread(target=self._safe_start, args=(graph, map_path), daemon=True).start()
+
+    def _safe_start(self, graph, map_path):
+        try:
+            self.start(graph, map_path, reuse_snapshot=False, restarting=True)
+        except Exception as e:
+            print(f"❌ 路线进程池重启失败，重请求将在当前线程计算: {e}")
+
+    def stats(self) -> dict:
+        return {**self.counters, "workers": self.workers if self._executor is not None else 0}
+
+
+route_pool = RoutePool()
@@ -0,0 +1,128 @@
+import os
+from array import array
+from typing import Dict, List, Tuple
+
+from algorithms import _dijkstra_core, mode_weights
+
+# ==========================================
+# 全源最短路表 (All-Pairs Route Table)
+# ==========================================
+# 校园地图规模很小且基本不变，启动时对每种 (strategy, transport) 组合
+# 各做 n 次 "一对全" Dijkstra，把距离和下一跳存成表。
+# 之后的 /navigate 单段查询 = 查表 + 沿下一跳展开路径，不再跑搜索。
+#
+# 表挂在 CompiledGraph 上 (cg.route_tables)，地图一旦变化就会重新编译出
+# 新的 CompiledGraph，旧表自然失效，查询自动回退到 Dijkstra。
+# 只是拥挤度变了时 'dist' 表原样沿用，'time' 表由 derived_rebuild 在后台补建。
+
+# 节点数超过这个值就不建表 (内存 O(n²)，建表时间 O(n · m log n))
+# 设为 0 可以关闭此功能
+ROUTE_TABLE_MAX_NODES = int(os.getenv("ROUTE_TABLE_MAX_NODES", "1000"))
+
+# 需要预计算的导航模式组合
+ROUTE_MODES = [
+    ('dist', 'walk'),
+    ('dist', 'bike'),
+    ('time', 'walk'),
+    ('time', 'bike'),
+]
+
+
+class RouteTable:
+    """
+    【单一模式的全源最短路表】
+    - dist[s][t]:     从下标 s 到下标 t 的最小消耗 (不可达为 inf)
+    - next_hop[s][t]: 从 s 出发去 t，第一步应该走到的节点下标 (-1 表示不可达)
+    """
+
+    def __init__(self, cg, strategy: str, transport: str):
+        self.strategy = strategy
+        self.transport = transport
+        self.version = cg.version
+
+        weights = mode_weights(cg, strategy, transport)
+        n = cg.num_nodes
+        self.dist: List[array] = []
+        self.next_hop: List[array] = []
+
+        for s in range(n):
+            dist, prev = _dijkstra_core(cg, weights, s)
+            self.dist.append(array('d', dist))
+            self.next_hop.append(self._next_hop_row(s, prev))
+
+    @staticmethod
+    def _next_hop_row(source: int, prev: List[int]) -> array:
+        """
+        根据最短路径树的前驱数组，求出 "从 source 出发第一步走哪" 这一行
+        每个节点沿前驱链往上找，遇到已知结果就停，整体 O(n)
+        """
+        n = len(prev)
+        row = array('i', [-1]) * n
+        row[source] = source
+        for t in range(n):
+            if row[t] != -1 or prev[t] == -1:
+                continue
+            # 往上爬，直到碰到 source 的直接孩子或已经算过的节点
+            chain = []
+            u = t
+            while row[u] == -1 and prev[u] != -1 and prev[u] != source:
+                chain.append(u)
+                u = prev[u]
+            if row[u] == -1:
+                if prev[u] != source:
+                    continue  # 理论上不会发生：前驱链断了
+                row[u] = u
+            hop = row[u]
+            for node in chain:
+                row[node] = hop
+        return row
+
+    def cost(self, s: int, t: int) -> float:
+        """查表：下标 s 到下标 t 的最小消耗"""
+        return self.dist[s][t]
+
+    def path(self, s: int, t: int) -> List[int]:
+        """沿下一跳展开路径，返回下标列表 (不可达返回空列表)"""
+        if self.next_hop[s][t] == -1:
+            return []
+        path = [s]
+        u = s
+        while u != t:
+            u = self.next_hop[u][t]
+            path.append(u)
+        return path
+
+
+def build_route_tables(graph, max_nodes: int = ROUTE_TABLE_MAX_NODES) -> Dict[Tuple[str, str], RouteTable]:
+    """
+    【建表入口】
+    为当前版本的地图预计算所有导航模式的全源表，并挂到编译后的图上。
+    权重完全相同的模式 (例如不同交通方式下的 'dist') 共用同一张表；
+    编译图上已经有的表 (打补丁时沿用下来的) 不会重建。
+    节点数超过 max_nodes 时不建表，返回空字典。
+    """
+    cg = graph.compile()
+    if cg.num_nodes == 0 or cg.num_nodes > max_nodes:
+        cg.route_tables = {}
+        return cg.route_tables
+
+    # 建在新字典里，全部建好后一次替换 (别的线程可能正在查旧的表)
+    tables = dict(cg.route_tables)
+    built: List[Tuple[array, RouteTable]] = [
+        (mode_weights(cg, strategy, transport), table) for (strategy, transport), table in tables.items()
+    ]
+    count = 0
+    for strategy, transport in ROUTE_MODES:
+        if (strategy, transport) in tables:
+            continue
+        weights = mode_weights(cg, strategy, transport)
+        table = next((t for w, t in built if w == weights), None)
+        if table is None:
+            table = RouteTable(cg, strategy, transport)
+            built.append((weights, table))
+            count += 1
+        tables[(strategy, transport)] = table
+    cg.route_tables = tables
+
+    print(f"✅ 全源路径表构建完成: {cg.num_nodes} 个节点, 新建 {count} 张表")
+    return cg.route_tables
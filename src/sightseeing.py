@@ -0,0 +1,311 @@
+import os
+import random
+import time
+from array import array
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from algorithms import build_cost_matrix
+from tour import route_cost, improve_route
+
+# ==========================================
+# 限时游览推荐 (定向越野问题 Orienteering)
+# ==========================================
+# "我只有 60 分钟，怎么逛最值": 从起点出发，在时间预算内挑一组景点去看，
+# 让这些景点的吸引力 (日记评分 / 浏览量聚合出来的分数) 之和最大。
+# 和 plan_multi_point_route 不同，这里要同时决定 "去哪些" 和 "按什么顺序去"，是 NP 难问题：
+#   1. 景点两两之间的代价矩阵预先算好挂在编译图上 (只有 type='spot' 的节点，规模很小)
+#   2. 贪心插入: 每次把 "吸引力 / 增加的耗时" 最高、插进去仍不超预算的景点插到最便宜的位置
+#   3. 局部搜索: 2-opt / Or-opt 缩短路线，省出来的时间继续插入；再尝试用没去的高分景点替换低分景点
+#   4. 还有时间就随机去掉几个景点重新插入 (破坏 - 重建)，跳出局部最优
+# 求解过程随时可以停 (anytime)，到截止时刻就返回目前最好的可行解。
+#
+# 拥挤度变化后 'time' 矩阵由 derived_rebuild 在后台重建，请求路径上从不现场重算整张矩阵：
+# 重建完成前先用旧矩阵挑景点、排顺序，最后按当前权重核算真实耗时，超出预算就去掉性价比最低的景点。
+
+# 景点数超过这个值就不预计算景点代价矩阵 (内存 O(景点数²)，预计算 O(景点数) 次搜索)
+SPOT_MATRIX_MAX_SPOTS = int(os.getenv("SPOT_MATRIX_MAX_SPOTS", "300"))
+
+# 求解的时间上限 (秒)
+TOUR_SOLVE_SECONDS = float(os.getenv("TOUR_SOLVE_SECONDS", "1.0"))
+
+# 游览推荐支持的交通方式 (启动时为每一种预计算 'time' 矩阵)
+TOUR_TRANSPORTS = ('walk', 'bike')
+
+# 扰动阶段连续这么多次没有改进就提前结束 (小问题不必把时间上限用完)
+PERTURB_PATIENCE = 200
+
+EPS = 1e-9
+
+
+class SpotMatrix:
+    """
+    【景点代价矩阵】
+    nodes[r] 是第 r 行对应的节点下标，cost[r][c] 是 nodes[r] -> nodes[c] 的最小消耗
+    """
+
+    def __init__(self, nodes: List[int], cost: List[array]):
+        self.nodes = nodes
+        self.cost = cost
+        self.row: Dict[int, int] = {i: r for r, i in enumerate(nodes)}
+
+
+def build_spot_matrix(graph, cg, strategy: str, transport: str) -> Optional[SpotMatrix]:
+    """在编译图 cg 上计算景点代价矩阵 (不缓存)，景点太多时返回 None"""
+    nodes = [cg.index[r["id"]] for r in graph.spot_records() if r["type"] == 'spot' and r["id"] in cg.index]
+    if not nodes or len(nodes) > SPOT_MATRIX_MAX_SPOTS:
+        return None
+    # 全源表 / 骨架图由 build_cost_matrix 自动选用
+    cost, _ = build_cost_matrix(cg, nodes, strategy, transport)
+    return SpotMatrix(nodes, [array('d', row) for row in cost])
+
+
+def spot_matrix(graph, strategy: str = 'time', transport: str = 'walk') -> Optional[SpotMatrix]:
+    """
+    获取 (并缓存) 当前版本地图的景点代价矩阵，景点太多时返回 None
+    和全源表一样挂在编译图上。拥挤度变化后 'time' 矩阵先沿用旧的 (记在 cg.stale 里，等后台重建)，
+    只有从来没算过的组合才在这里现场计算。
+    """
+    cg = graph.compile()
+    key = (strategy, transport)
+    matrix = cg.spot_matrices.get(key)
+    if matrix is None:
+        matrix = build_spot_matrix(graph, cg, strategy, transport)
+        if matrix is not None:
+            cg.spot_matrices = {**cg.spot_matrices, key: matrix}
+    return matrix
+
+
+def warm_spot_matrices(graph):
+    """启动 / 热更新时为所有支持的交通方式预计算 'time' 矩阵，不让第一个请求现场算"""
+    for transport in TOUR_TRANSPORTS:
+        spot_matrix(graph, 'time', transport)
+
+
+# ------------------------------------------
+# 求解 (纯组合优化，下标 0 是起点，1..k 是候选景点)
+# ------------------------------------------
+def _cheapest_insertion(matrix, order: List[int], end: Optional[int], node: int) -> Tuple[float, int]:
+    """把 node 插进 order 的最便宜位置，返回 (增加的代价, 位置)"""
+    best_delta, best_pos = float('inf'), -1
+    prev = 0
+    for pos in range(len(order) + 1):
+        nxt = order[pos] if pos < len(order) else end
+        if nxt is None:
+            delta = matrix[prev][node]
+        else:
+            delta = matrix[prev][node] + matrix[node][nxt] - matrix[prev][nxt]
+        if delta < best_delta:
+            best_delta, best_pos = delta, pos
+        if pos < len(order):
+            prev = order[pos]
+    return best_delta, best_pos
+
+
+def greedy_insertion(matrix, prizes: Sequence[float], budget: float, order: List[int],
+                     end: Optional[int] = None, deadline: Optional[float] = None) -> List[int]:
+    """
+    【贪心插入】
+    反复把 "吸引力 / 增加的代价" 最高、插入后总代价不超过 budget 的景点插进路线，直到插不进去为止
+    """
+    order = list(order)
+    cost = route_cost(matrix, order, end)
+    remaining = {j for j in range(1, len(prizes)) if prizes[j] > 0} - set(order)
+    while remaining:
+        if deadline is not None and time.time() > deadline:
+            break
+        best = None
+        for j in remaining:
+            delta, pos = _cheapest_insertion(matrix, order, end, j)
+            if cost + delta > budget + EPS:
+                continue
+            ratio = prizes[j] / max(delta, EPS)
+            if best is None or ratio > best[0]:
+                best = (ratio, j, pos, delta)
+        if best is None:
+            break
+        _, j, pos, delta = best
+        order.insert(pos, j)
+        cost += delta
+        remaining.discard(j)
+    return order
+
+
+def _swap_step(matrix, prizes: Sequence[float], budget: float, order: List[int],
+               end: Optional[int]) -> Optional[List[int]]:
+    """
+    【替换】把路线上的一个景点换成一个没去的、吸引力更高的景点 (插到最便宜的位置)
+    找到第一个仍在预算内的替换就返回新路线，没有可行的替换返回 None
+    """
+    visited = set(order)
+    unvisited = sorted((j for j in range(1, len(prizes)) if prizes[j] > 0 and j not in visited),
+                       key=lambda j: prizes[j], reverse=True)
+    for i in sorted(range(len(order)), key=lambda i: prizes[order[i]]):
+        rest = order[:i] + order[i + 1:]
+        rest_cost = route_cost(matrix, rest, end)
+        for j in unvisited:
+            if prizes[j] <= prizes[order[i]]:
+                break
+            delta, pos = _cheapest_insertion(matrix, rest, end, j)
+            if rest_cost + delta <= budget + EPS:
+                return rest[:pos] + [j] + rest[pos:]
+    return None
+
+
+def _local_search(matrix, prizes: Sequence[float], budget: float, order: List[int],
+                  end: Optional[int], deadline: Optional[float]) -> List[int]:
+    """缩短路线 -> 插入新景点 -> 替换低分景点，反复进行直到没有改进"""
+    def score(order):
+        return sum(prizes[j] for j in order), -route_cost(matrix, order, end)
+
+    order = greedy_insertion(matrix, prizes, budget, order, end, deadline)
+    best, best_score = order, score(order)
+    while deadline is None or time.time() < deadline:
+        # 1. 缩短路线，省下来的时间继续插入新景点
+        if len(order) > 1:
+            order = improve_route(matrix, order, end, deadline)
+        order = greedy_insertion(matrix, prizes, budget, order, end, deadline)
+        current = score(order)
+        if current > best_score:
+            best, best_score = order, current
+            continue
+        # 2. 插不进去了，尝试用高分景点替换低分景点
+        swapped = _swap_step(matrix, prizes, budget, order, end)
+        if swapped is None:
+            break
+        order = swapped
+        if score(order) > best_score:
+            best, best_score = order, score(order)
+    return best
+
+
+def solve_orienteering(matrix, prizes: Sequence[float], budget: float, end: Optional[int] = None,
+                       deadline: Optional[float] = None) -> List[int]:
+    """
+    【求解入口】
+    贪心插入 + 局部搜索得到初始解，剩下的时间做 "破坏 - 重建" 扰动:
+    随机去掉路线上的几个景点，先在不含它们的情况下重建路线，再按真实吸引力补插，更好就接受。
+    连续 PERTURB_PATIENCE 次没有改进 (或到了截止时刻) 就结束。
+    :param matrix: 代价矩阵，下标 0 是起点，1..k 是候选景点 (到达景点的代价里已经含停留时间)
+    :param prizes: 每个下标的吸引力 (prizes[0] 不用)
+    :param end: 终点下标 (回到起点时为 0)，None 表示看完最后一个景点即结束
+    :param deadline: 截止时刻 (time.time())，到点后返回目前最好的可行解
+    :return: 要去的景点的访问顺序 (矩阵下标)
+    """
+    def score(order):
+        return sum(prizes[j] for j in order), -route_cost(matrix, order, end)
+
+    best = _local_search(matrix, prizes, budget, [], end, deadline)
+    best_score = score(best)
+    rng = random.Random(0)  # 固定种子: 同样的输入给出同样的推荐
+    stale = 0
+    while best and stale < PERTURB_PATIENCE and (deadline is None or time.time() < deadline):
+        order = list(best)
+        removed = set()
+        for _ in range(rng.randint(1, max(1, len(order) // 3))):
+            removed.add(order.pop(rng.randrange(len(order))))
+        # 去掉的景点这一轮先不许插回来，逼着路线换一批景点，最后再按真实吸引力补插
+        tabu = [0.0 if j in removed else p for j, p in enumerate(prizes)]
+        order = _local_search(matrix, tabu, budget, order, end, deadline)
+        order = _local_search(matrix, prizes, budget, order, end, deadline)
+        current = score(order)
+        if current > best_score:
+            best, best_score = order, current
+            stale = 0
+        else:
+            stale += 1
+    return best
+
+
+def plan_sightseeing_tour(graph, start_id: int, appeal: Dict[int, float], budget: float,
+                          transport: str = 'walk', stay: float = 0.0, return_to_start: bool = False,
+                          time_limit: float = TOUR_SOLVE_SECONDS, stats: Dict = None):
+    """
+    【限时游览规划】
+    :param appeal: {景点ID: 吸引力}，没有出现或吸引力为 0 的景点不会被选中
+    :param budget: 时间预算 (秒)，包括在每个景点停留的 stay 秒
+    :param time_limit: 从调用开始算的求解时间上限 (秒)，到点返回当前最好的方案
+    :return: (要去的景点ID列表, 完整路径ID列表, 按当前权重核算的总耗时)；地图没有景点代价矩阵时返回 None
+    """
+    deadline = time.time() + time_limit
+    matrix = spot_matrix(graph, 'time', transport)
+    if matrix is None:
+        return None
+    cg = graph.compile()
+    source = cg.index.get(start_id)
+    if source is None:
+        return [], [], -1
+
+    inf = float('inf')
+    candidates = [r for r, i in enumerate(matrix.nodes)
+                  if i != source and appeal.get(cg.node_ids[i], 0) > 0]
+
+    # 起点那一行: 起点本身是景点时直接取矩阵，否则做一次一对多搜索 (路网无向，去和回代价相同)
+    if source in matrix.row:
+        start_row = matrix.cost[matrix.row[source]]
+        from_start = [start_row[r] for r in candidates]
+    else:
+        nodes = [source] + [matrix.nodes[r] for r in candidates]
+        first, _ = build_cost_matrix(cg, nodes, 'time', transport, num_sources=1, stats=stats)
+        from_start = first[0][1:]
+
+    # 起点去不了的景点不参与求解
+    reachable = [(r, c) for r, c in zip(candidates, from_start) if c != inf]
+    candidates = [r for r, _ in reachable]
+    k = len(candidates)
+    sub = [[0.0] + [c + stay for _, c in reachable]]
+    for r, back in reachable:
+        row = matrix.cost[r]
+        sub.append([back] + [row[s] + stay if s != r else 0.0 for s in candidates])
+    prizes = [0.0] + [appeal[cg.node_ids[matrix.nodes[r]]] for r in candidates]
+
+    end = 0 if return_to_start else None
+    order = solve_orienteering(sub, prizes, budget, end, deadline) if k else []
+
+    # 按访问顺序把每一段路径展开，同时得到这些点之间按当前权重的真实耗时
+    sequence = [source] + [matrix.nodes[candidates[j - 1]] for j in order]
+    if return_to_start:
+        sequence.append(source)
+    if len(sequence) == 1:
+        return [], [start_id], 0.0
+    actual, leg = build_cost_matrix(cg, sequence, 'time', transport, num_sources=len(sequence) - 1,
+                                    stats=stats)
+    end_pos = len(sequence) - 1 if return_to_start else None
+    kept = _trim_to_budget(actual, [prizes[j] for j in order], budget, stay, end_pos)
+
+    visit_ids = [cg.node_ids[sequence[p]] for p in kept]
+    stops = [0] + kept + ([end_pos] if end_pos is not None else [])
+    path = [start_id]
+    for a, b in zip(stops, stops[1:]):
+        path.extend(cg.node_ids[x] for x in leg(a, b)[1:])
+    return visit_ids, path, _visit_cost(actual, kept, stay, end_pos)
+
+
+def _visit_cost(actual, kept: List[int], stay: float, end_pos: Optional[int]) -> float:
+    """按序号 kept 依次访问 (每处停留 stay) 的总耗时，actual[i][j] 只在 i < j 时有效"""
+    total = 0.0
+    prev = 0
+    for p in kept:
+        total += actual[prev][p] + stay
+        prev = p
+    if end_pos is not None:
+        total += actual[prev][end_pos]
+    return total
+
+
+def _trim_to_budget(actual, prizes: List[float], budget: float, stay: float,
+                    end_pos: Optional[int]) -> List[int]:
+    """
+    按真实耗时核算，超出预算就反复去掉 "吸引力 / 省下的时间" 最低的景点 (保持原来的访问顺序)
+    只有景点矩阵还没按新拥挤度重建完时才会真的去掉景点
+    :param prizes: prizes[p - 1] 是第 p 个访问点的吸引力
+    :return: 保留下来的访问点序号 (1..len(prizes))
+    """
+    kept = list(range(1, len(prizes) + 1))
+    spent = _visit_cost(actual, kept, stay, end_pos)
+    while kept and spent > budget + EPS:
+        def ratio(p):
+            saved = spent - _visit_cost(actual, [q for q in kept if q != p], stay, end_pos)
+            return prizes[p - 1] / max(saved, EPS)
+        kept.remove(min(kept, key=ratio))
+        spent = _visit_cost(actual, kept, stay, end_pos)
+    return kept
@@ -0,0 +1,382 @@
+import os
+import sys
+import mmap
+import struct
+from array import array
+from collections.abc import MutableMapping, Sequence
+from typing import Dict, List, Optional
+
+# 作为脚本运行时 (python src/snapshot.py) 也能找到同目录下的模块
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from compiled_graph import CompiledGraph
+from contraction import file_sha1
+from models import CampusGraph, Spot, Edge
+
+# ==========================================
+# 二进制地图快照 (Binary Graph Snapshot)
+# ==========================================
+# load_graph_from_json 每次启动都要解析 JSON、为每条记录校验一个 SQLModel 对象，
+# 大地图上要好几秒，而且每个 uvicorn worker 都要重复一遍。
+#
+# 这里把 campus_map.json 离线编译成一个二进制文件 (campus_map.snapshot)：
+#   节点数组 + CSR 边数组 + 字符串表 (名称 / 类型 / 介绍 / 道路类型)
+# 启动时用 mmap 映射进来，数组直接是文件内容的 memoryview (零拷贝，多个 worker 共享页缓存)，
+# Spot / Edge 对象只在真正被访问时才创建。
+# 快照记录了源 JSON 的指纹，地图改过之后自动回退到 JSON 加载。
+
+SNAPSHOT_MAGIC = b"CGSNAP\0\0"
+SNAPSHOT_FORMAT_VERSION = 2
+
+# 文件头: 魔数, 格式版本, 字节序标记, 时段长度(分钟), 时段数,
+#         节点数, 原始边数, 有向边数, 字符串数, 字符串区字节数, 源文件 sha1
+HEADER = struct.Struct("<8sIIIIqqqqq40s")
+BYTE_ORDER_MARK = 0x01020304  # 按本机字节序写入，读出来不一样说明换了机器架构
+
+
+def get_snapshot_path(map_path: str) -> str:
+    """campus_map.json -> campus_map.snapshot"""
+    root, _ = os.path.splitext(map_path)
+    return root + ".snapshot"
+
+
+def _align(n: int) -> int:
+    """每一段数据都按 8 字节对齐"""
+    return (n + 7) & ~7
+
+
+# 各段的 (名字, 类型码, 长度)，写入和读取共用这份布局，保证顺序一致
+def _layout(n: int, e: int, m: int, s: int, blob: int, nb: int):
+    return [
+        ("node_ids", 'q', n),
+        ("xs", 'd', n),
+        ("ys", 'd', n),
+        ("name_idx", 'i', n),
+        ("type_idx", 'i', n),
+        ("desc_idx", 'i', n),
+        ("str_offsets", 'q', s + 1),
+        ("str_blob", 'B', blob),
+        ("edge_u", 'q', e),
+        ("edge_v", 'q', e),
+        ("edge_distance", 'd', e),
+        ("edge_crowding", 'd', e),
+        ("edge_type", 'i', e),
+        ("offsets", 'i', n + 1),
+        ("targets", 'i', m),
+        ("distance", 'd', m),
+        ("crowding", 'd', m),
+        ("arc_edge", 'i', m),
+        ("bikeable", 'b', m),
+        ("profiles", 'd', nb * m),   # 按时段排列: 第 b 个时段是 [b*m, (b+1)*m)
+    ]
+
+
+def save_snapshot(graph: CampusGraph, map_path: str, out_path: Optional[str] = None) -> str:
+    """
+    把 (从 JSON 加载的) 地图写成二进制快照，返回输出文件路径
+    先写临时文件再原子替换，正在映射旧快照的进程不受影响。
+    """
+    out_path = out_path or get_snapshot_path(map_path)
+    cg = graph.compile()
+    n, m = cg.num_nodes, cg.num_arcs
+
+    # 1. 字符串表 (相同的字符串只存一份，None 记为 -1)
+    strings: List[bytes] = []
+    string_index: Dict[str, int] = {}
+
+    def intern(text: Optional[str]) -> int:
+        if text is None:
+            return -1
+        idx = string_index.get(text)
+        if idx is None:
+            idx = string_index[text] = len(strings)
+            strings.append(text.encode('utf-8'))
+        return idx
+
+    name_idx, type_idx, desc_idx = array('i'), array('i'), array('i')
+    for sid in cg.node_ids:
+        spot = graph.spots[sid]
+        name_idx.append(intern(spot.name))
+        type_idx.append(intern(spot.type))
+        desc_idx.append(intern(spot.desc))
+
+    # 2. 原始无向边 (保留顺序，道路序号和 JSON 加载时完全一致)
+    edge_u, edge_v = array('q'), array('q')
+    edge_distance, edge_crowding = array('d'), array('d')
+    edge_type = array('i')
+    for edge in graph.edges:
+        edge_u.append(edge.u)
+        edge_v.append(edge.v)
+        edge_distance.append(edge.distance)
+        edge_crowding.append(edge.crowding)
+        edge_type.append(intern(edge.type))
+
+    str_offsets = array('q', [0])
+    for b in strings:
+        str_offsets.append(str_offsets[-1] + len(b))
+    blob = b"".join(strings)
+
+    # 3. 分时段拥挤度 (每个时段一段，NaN 表示沿用基础拥挤度)
+    nb = cg.num_buckets
+    profiles = array('d')
+    for b in range(nb):
+        profiles.extend(cg.profiles[b])
+
+    sections = {
+        "node_ids": cg.node_ids, "xs": cg.xs, "ys": cg.ys,
+        "name_idx": name_idx, "type_idx": type_idx, "desc_idx": desc_idx,
+        "str_offsets": str_offsets, "str_blob": blob,
+        "edge_u": edge_u, "edge_v": edge_v,
+        "edge_distance": edge_distance, "edge_crowding": edge_crowding, "edge_type": edge_type,
+        "offsets": cg.offsets, "targets": cg.targets,
+        "distance": cg.distance, "crowding": cg.crowding, "arc_edge": cg.arc_edge,
+        "bikeable": cg.bikeable if cg.bikeable is not None else array('b', [1]) * m,
+        "profiles": profiles,
+    }
+
+    header = HEADER.pack(
+        SNAPSHOT_MAGIC, SNAPSHOT_FORMAT_VERSION, BYTE_ORDER_MARK, graph.bucket_minutes, nb,
+        n, len(graph.edges), m, len(strings), len(blob), file_sha1(map_path).encode('ascii')
+    )
+
+    tmp_path = out_path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        pos = HEADER.size
+        for name, typecode, count in _layout(n, len(graph.edges), m, len(strings), len(blob), nb):
+            data = sections[name]
+            raw = data if isinstance(data, bytes) else array(typecode, data).tobytes()
+            assert len(raw) == count * array(typecode).itemsize, name
+            pad = _align(pos) - pos
+            f.write(b"\0" * pad)
+            f.write(raw)
+            pos += pad + len(raw)
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+class SnapshotSpots(MutableMapping):
+    """
+    【按需创建的景点字典】
+    行为和 CampusGraph.spots 的普通字典一样 ({ID: Spot})，
+    但 Spot 对象第一次被访问时才从快照里读出来创建。
+    """
+
+    def __init__(self, snapshot: "GraphSnapshot"):
+        self._snap = snapshot
+        self._cache: Dict[int, Spot] = {}
+        self._extra: Dict[int, Spot] = {}  # 快照之后新加的景点
+
+    def __getitem__(self, sid: int) -> Spot:
+        spot = self._cache.get(sid)
+        if spot is None:
+            spot = self._extra.get(sid)
+            if spot is None:
+                i = self._snap.index[sid]  # 不存在时抛 KeyError，和字典一致
+                spot = self._cache[sid] = self._snap.make_spot(i)
+        return spot
+
+    def __contains__(self, sid) -> bool:
+        return sid in self._snap.index or sid in self._extra
+
+    def __setitem__(self, sid: int, spot: Spot):
+        if sid in self._snap.index:
+            self._cache[sid] = spot
+        else:
+            self._extra[sid] = spot
+
+    def __delitem__(self, sid: int):
+        raise TypeError("快照地图不支持删除景点")
+
+    def __iter__(self):
+        yield from self._snap.node_ids
+        yield from self._extra
+
+    def __len__(self) -> int:
+        return len(self._snap.node_ids) + len(self._extra)
+
+    def records(self):
+        """
+        和 vars(spot) 相同的字典，直接读快照的坐标数组和字符串表，不创建 Spot 对象
+        (启动时生成 /graph、建名称索引、选地标都只需要这些字段)；已经被改写过的景点以改写后的为准
+        """
+        snap = self._snap
+        strings: Dict[int, Optional[str]] = {}  # 类型 / 名称大量重复，每个字符串只解码一次
+        for i, sid in enumerate(snap.node_ids):
+            spot = self._cache.get(sid)
+            if spot is not None:
+                yield vars(spot)
+                continue
+            fields = []
+            for idx in (snap.name_idx[i], snap.type_idx[i], snap.desc_idx[i]):
+                if idx not in strings:
+                    strings[idx] = snap.string(idx)
+                fields.append(strings[idx])
+            name, type_, desc = fields
+            yield {"id": sid, "name": name, "type": type_, "x": snap.xs[i], "y": snap.ys[i], "desc": desc}
+        for spot in self._extra.values():
+            yield vars(spot)
+
+
+class SnapshotEdges(Sequence):
+    """【按需创建的道路列表】和 CampusGraph.edges 一样按序号访问，Edge 对象第一次访问时才创建"""
+
+    def __init__(self, snapshot: "GraphSnapshot"):
+        self._snap = snapshot
+        self._items: List[Optional[Edge]] = [None] * snapshot.num_edges
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            return [self[i] for i in range(*k.indices(len(self)))]
+        edge = self._items[k]
+        if edge is None:
+            edge = self._items[k] = self._snap.make_edge(k)
+        return edge
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def rows(self):
+        """每条道路的 (u, v, distance)，没被访问 / 修改过的直接读快照数组，不创建 Edge 对象"""
+        snap = self._snap
+        for k, edge in enumerate(self._items):
+            if edge is not None:
+                yield edge.u, edge.v, edge.distance
+            else:
+                yield snap.edge_u[k], snap.edge_v[k], snap.edge_distance[k]
+
+    def append(self, edge: Edge):
+        self._items.append(edge)
+
+    def __setitem__(self, k, edge: Edge):
+        self._items[k] = edge
+
+    def copy(self) -> "SnapshotEdges":
+        """浅拷贝 (已经创建的 Edge 对象共用，快照本身共用)，供 CampusGraph.update_edges 写时复制"""
+        edges = SnapshotEdges.__new__(SnapshotEdges)
+        edges._snap = self._snap
+        edges._items = list(self._items)
+        return edges
+
+
+class GraphSnapshot:
+    """
+    【映射进内存的快照文件】
+    每一段数据都是 mmap 上的 memoryview，不复制、不解析。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mm)
+
+        (magic, fmt, bom, self.bucket_minutes, self.num_buckets, n, e, m, s, blob,
+         sha1) = HEADER.unpack_from(view, 0)
+        self.valid_format = (magic == SNAPSHOT_MAGIC and fmt == SNAPSHOT_FORMAT_VERSION
+                             and bom == BYTE_ORDER_MARK)
+        self.source_sha1 = sha1.decode('ascii', 'replace')
+        self.num_edges = e
+        if not self.valid_format:
+            return
+
+        pos = HEADER.size
+        for name, typecode, count in _layout(n, e, m, s, blob, self.num_buckets):
+            pos = _align(pos)
+            size = count * array(typecode).itemsize
+            section = view[pos:pos + size]
+            setattr(self, name, section if typecode == 'B' else section.cast(typecode))
+            pos += size
+
+        self.index: Dict[int, int] = {}  # 由 compiled() 填充
+
+    def string(self, idx: int) -> Optional[str]:
+        """字符串表第 idx 项 (-1 表示 None)"""
+        if idx < 0:
+            return None
+        return bytes(self.str_blob[self.str_offsets[idx]:self.str_offsets[idx + 1]]).decode('utf-8')
+
+    def make_spot(self, i: int) -> Spot:
+        return Spot(
+            id=self.node_ids[i],
+            name=self.string(self.name_idx[i]),
+            type=self.string(self.type_idx[i]),
+            x=self.xs[i],
+            y=self.ys[i],
+            desc=self.string(self.desc_idx[i])
+        )
+
+    def make_edge(self, k: int) -> Edge:
+        profile = None
+        if self.num_buckets:
+            arcs = self.compiled_graph.edge_arcs(k)
+            if arcs:
+                values = [self.compiled_graph.profiles[b][arcs[0]] for b in range(self.num_buckets)]
+                if values[0] == values[0]:  # NaN 表示这条路没有分时段数据
+                    profile = values
+        return Edge(
+            u=self.edge_u[k],
+            v=self.edge_v[k],
+            distance=self.edge_distance[k],
+            crowding=self.edge_crowding[k],
+            type=self.string(self.edge_type[k]),
+            crowding_profile=profile
+        )
+
+    def compiled(self, version: int) -> CompiledGraph:
+        """直接用快照里的数组构造 CSR 编译图 (零拷贝)"""
+        m = len(self.targets)
+        profiles = None
+        if self.num_buckets:
+            profiles = [self.profiles[b * m:(b + 1) * m] for b in range(self.num_buckets)]
+        cg = CompiledGraph(self.node_ids, self.xs, self.ys, self.offsets, self.targets,
+                           self.distance, self.crowding, self.arc_edge, version,
+                           profiles, self.bucket_minutes, self.bikeable)
+        self.index = cg.index
+        self.compiled_graph = cg
+        return cg
+
+
+def load_graph_from_snapshot(map_path: str) -> Optional[CampusGraph]:
+    """
+    加载 map_path 对应的二进制快照
+    快照不存在、格式不对或者源 JSON 已经改过 (指纹不一致) 时返回 None，由调用方回退到 JSON。
+    """
+    snap_path = get_snapshot_path(map_path)
+    if not os.path.exists(snap_path) or not os.path.exists(map_path):
+        return None
+    try:
+        snap = GraphSnapshot(snap_path)
+    except (OSError, ValueError, struct.error) as e:
+        print(f"⚠️ 地图快照无法读取，改为加载 JSON: {e}")
+        return None
+    if not snap.valid_format or snap.source_sha1 != file_sha1(map_path):
+        print(f"⚠️ 地图快照已过期，改为加载 JSON (请重新运行 snapshot.py): {snap_path}")
+        return None
+    return graph_from_snapshot(snap)
+
+
+def graph_from_snapshot(snap: GraphSnapshot) -> CampusGraph:
+    """用已经映射好的快照构造 CampusGraph (不检查源文件指纹，路线进程池的子进程直接用这个)"""
+    graph = CampusGraph()
+    graph.bucket_minutes = snap.bucket_minutes
+    graph.version = graph.topology_version = 1
+    graph._compiled = snap.compiled(graph.version)
+    graph.snapshot = snap
+    graph.spots = SnapshotSpots(snap)
+    graph.edges = SnapshotEdges(snap)
+    print(f"✅ 地图快照加载成功: {len(graph.spots)} 个节点, {len(graph.edges)} 条边")
+    return graph
+
+
+if __name__ == "__main__":
+    import time
+    from utils import load_graph_from_json, get_data_path
+
+    # 用法: python src/snapshot.py [地图文件路径]
+    map_path = sys.argv[1] if len(sys.argv) > 1 else get_data_path()
+    graph = load_graph_from_json(map_path)
+
+    start = time.time()
+    out = save_snapshot(graph, map_path)
+    print(f"🎉 地图快照编译完成，用时 {time.time() - start:.1f} 秒，已保存至: {out}")
@@ -0,0 +1,204 @@
+import heapq
+import math
+from array import array
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+# ==========================================
+# 空间索引 (KD-Tree)
+# ==========================================
+# 把地图上的像素坐标映射回图上的节点 / 道路：
+#   - 最近的 k 个节点、某个半径内的所有节点
+#   - 把前端在 map.png 上的任意点击 "吸附" 到最近的节点或道路上
+# 查询复杂度 O(log n)，10 万节点以上的大地图也不需要全表扫描。
+#
+# 索引挂在 CompiledGraph 上 (cg.spatial)，和其它派生数据一样，
+# 地图结构变化重新编译后自动失效。
+
+
+class KDTree:
+    """
+    【二维 KD-Tree (静态)】
+    树用几个平行数组表示，节点 t 存放点 point[t]，按 axis[t] (0=x, 1=y) 切分，
+    左右孩子是 left[t] / right[t] (-1 表示没有)。
+    """
+
+    def __init__(self, xs: Sequence[float], ys: Sequence[float]):
+        self.xs = xs
+        self.ys = ys
+        n = len(xs)
+        self.point = array('i', [0]) * n
+        self.axis = array('b', [0]) * n
+        self.left = array('i', [-1]) * n
+        self.right = array('i', [-1]) * n
+        self.root = -1
+        self._size = 0
+        if n:
+            self.root = self._build(list(range(n)), 0)
+
+    def _build(self, items: List[int], depth: int) -> int:
+        """按中位数递归切分，树高 O(log n)"""
+        axis = depth & 1
+        coords = self.xs if axis == 0 else self.ys
+        items.sort(key=coords.__getitem__)
+        mid = len(items) // 2
+
+        t = self._size
+        self._size += 1
+        self.point[t] = items[mid]
+        self.axis[t] = axis
+        if mid > 0:
+            self.left[t] = self._build(items[:mid], depth + 1)
+        if mid + 1 < len(items):
+            self.right[t] = self._build(items[mid + 1:], depth + 1)
+        return t
+
+    def nearest(self, x: float, y: float, k: int = 1) -> List[Tuple[int, float]]:
+        """
+        【k 近邻】
+        :return: [(点下标, 欧氏距离), ...]，按距离从近到远
+        """
+        if self.root == -1 or k <= 0:
+            return []
+        best: List[Tuple[float, int]] = []  # 大顶堆 (存负的平方距离)，只保留 k 个
+        xs, ys = self.xs, self.ys
+        stack = [(self.root, 0.0)]
+        while stack:
+            t, bound = stack.pop()
+            # bound 是查询点到这棵子树所在半平面的距离平方，已经比第 k 近还远就跳过
+            if len(best) == k and bound >= -best[0][0]:
+                continue
+            p = self.point[t]
+            dx = xs[p] - x
+            dy = ys[p] - y
+            d2 = dx * dx + dy * dy
+            if len(best) < k:
+                heapq.heappush(best, (-d2, p))
+            elif d2 < -best[0][0]:
+                heapq.heapreplace(best, (-d2, p))
+
+            diff = dx if self.axis[t] == 0 else dy
+            near, far = (self.left[t], self.right[t]) if diff > 0 else (self.right[t], self.left[t])
+            # 近侧子树后入栈先处理，远侧子树等出栈时再判断要不要看
+            if far != -1:
+                stack.append((far, diff * diff))
+            if near != -1:
+                stack.append((near, bound))
+        return [(p, math.sqrt(-d2)) for d2, p in sorted(best, reverse=True)]
+
+    def within(self, x: float, y: float, radius: float) -> List[Tuple[int, float]]:
+        """
+        【半径查询】
+        :return: 距离不超过 radius 的所有点 [(点下标, 欧氏距离), ...]，按距离从近到远
+        """
+        if self.root == -1 or radius < 0:
+            return []
+        r2 = radius * radius
+        found = []
+        xs, ys = self.xs, self.ys
+        stack = [self.root]
+        while stack:
+            t = stack.pop()
+            p = self.point[t]
+            dx = xs[p] - x
+            dy = ys[p] - y
+            d2 = dx * dx + dy * dy
+            if d2 <= r2:
+                found.append((p, math.sqrt(d2)))
+            diff = dx if self.axis[t] == 0 else dy
+            # 查询圆和切分线的哪一侧相交就进哪一侧
+            if diff >= -radius and self.left[t] != -1:
+                stack.append(self.left[t])
+            if diff <= radius and self.right[t] != -1:
+                stack.append(self.right[t])
+        found.sort(key=lambda item: item[1])
+        return found
+
+
+class SnapResult(NamedTuple):
+    """
+    一次点击吸附的结果
+    - node:     路线规划用的节点下标 (吸附到道路中间时取离吸附点更近的那一端)
+    - u, v:     如果吸附到了道路中间，是这条路两端的节点下标；吸附到节点上时都是 node
+    - fraction: 吸附点在 u -> v 上的位置比例 (0 在 u，1 在 v)
+    - x, y:     吸附后的坐标
+    - distance: 点击位置到吸附点的像素距离
+    """
+    node: int
+    u: int
+    v: int
+    fraction: float
+    x: float
+    y: float
+    distance: float
+
+
+class SpatialIndex:
+    """
+    【地图空间索引】
+    - 节点: 直接在节点坐标上建 KD-Tree
+    - 道路: 在每条路的中点上建 KD-Tree，并记录最长的半条路长度 max_half。
+            点到线段的距离 >= 点到中点的距离 - 半条路长，所以只需检查
+            中点落在 (当前最优距离 + max_half) 范围内的道路。
+    """
+
+    def __init__(self, cg):
+        self.cg = cg
+        self.nodes = KDTree(cg.xs, cg.ys)
+
+        # 每条无向路只取一条有向边 (u < v)
+        self.edge_u = array('i')
+        self.edge_v = array('i')
+        mid_x = array('d')
+        mid_y = array('d')
+        max_half = 0.0
+        for u in range(cg.num_nodes):
+            for k in range(cg.offsets[u], cg.offsets[u + 1]):
+                v = cg.targets[k]
+                if u >= v:
+                    continue
+                self.edge_u.append(u)
+                self.edge_v.append(v)
+                mid_x.append((cg.xs[u] + cg.xs[v]) / 2)
+                mid_y.append((cg.ys[u] + cg.ys[v]) / 2)
+                max_half = max(max_half, math.hypot(cg.xs[v] - cg.xs[u], cg.ys[v] - cg.ys[u]) / 2)
+        self.edges = KDTree(mid_x, mid_y)
+        self.max_half = max_half
+
+    def nearest_nodes(self, x: float, y: float, k: int = 1) -> List[Tuple[int, float]]:
+        """最近的 k 个节点 [(节点下标, 距离), ...]"""
+        return self.nodes.nearest(x, y, k)
+
+    def nodes_within(self, x: float, y: float, radius: float) -> List[Tuple[int, float]]:
+        """半径 radius 内的所有节点 [(节点下标, 距离), ...]"""
+        return self.nodes.within(x, y, radius)
+
+    def _project(self, e: int, x: float, y: float) -> Tuple[float, float, float, float]:
+        """点 (x, y) 投影到第 e 条路上: 返回 (比例, 投影x, 投影y, 距离)"""
+        xs, ys = self.cg.xs, self.cg.ys
+        u, v = self.edge_u[e], self.edge_v[e]
+        ax, ay = xs[u], ys[u]
+        dx, dy = xs[v] - ax, ys[v] - ay
+        length2 = dx * dx + dy * dy
+        t = 0.0
+        if length2 > 0:
+            t = min(1.0, max(0.0, ((x - ax) * dx + (y - ay) * dy) / length2))
+        px, py = ax + t * dx, ay + t * dy
+        return t, px, py, math.hypot(x - px, y - py)
+
+    def snap(self, x: float, y: float) -> Optional[SnapResult]:
+        """
+        【点击吸附】
+        找离 (x, y) 最近的节点或道路上的点，地图为空时返回 None
+        """
+        found = self.nodes.nearest(x, y, 1)
+        if not found:
+            return None
+        node, best = found[0]
+        result = SnapResult(node, node, node, 0.0, self.cg.xs[node], self.cg.ys[node], best)
+
+        for e, _ in self.edges.within(x, y, best + self.max_half):
+            t, px, py, d = self._project(e, x, y)
+            if d < result.distance:
+                u, v = self.edge_u[e], self.edge_v[e]
+                result = SnapResult(u if t <= 0.5 else v, u, v, t, px, py, d)
+        return result
@@ -0,0 +1,141 @@
+import bisect
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Set, Tuple
+
+from thefuzz import fuzz
+
+# 拼音支持是可选的：安装了 pypinyin 就能用 "tsg" / "tushuguan" 搜到 "图书馆"
+try:
+    from pypinyin import lazy_pinyin, Style
+except ImportError:
+    lazy_pinyin = None
+
+# ==========================================
+# 景点名称索引 (模糊搜索)
+# ==========================================
+# /spots/search 是输入框联想用的，每敲一个字就请求一次。
+# 原来每次请求都对所有景点名跑一遍 thefuzz，耗时和景点数成正比。
+# 现在加载地图时建好索引：
+#   1. 字符 n-gram 倒排表 (单字 + 相邻两字)，中文名不需要分词
+#   2. 拼音全拼 / 首字母 (可选)，同样进 n-gram 表，并支持前缀匹配
+#   3. 排好序的名称列表，二分查找做前缀匹配
+# 查询时先用索引挑出少量候选，再只对候选做编辑距离打分；热门查询直接走 LRU 缓存。
+
+# 进入编辑距离打分的候选数上限
+SEARCH_CANDIDATE_LIMIT = 50
+
+# 匹配度超过这个分数才返回 (和原来的 thefuzz 分数一致)
+SEARCH_MIN_SCORE = 40
+
+# 查询结果 LRU 缓存大小
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "512"))
+
+
+def normalize(text: str) -> str:
+    """统一成小写、去掉空白，让 "Library " 和 "library" 命中同一批 n-gram"""
+    return "".join(text.lower().split())
+
+
+def ngrams(text: str) -> Set[str]:
+    """单字 + 相邻两字"""
+    grams = set(text)
+    grams.update(text[i:i + 2] for i in range(len(text) - 1))
+    return grams
+
+
+class SpotNameIndex:
+    """
+    【景点名称索引】只收录 type='spot' 的景点 (路点没有有意义的名字)
+    每个景点可能有多个搜索键: 名称本身、拼音全拼、拼音首字母
+    """
+
+    def __init__(self, records, cache_size: int = SEARCH_CACHE_SIZE):
+        """:param records: 节点字段字典 (CampusGraph.spot_records)，只用到 id / name / type"""
+        self.names: Dict[int, str] = {}                 # 景点ID -> 名称
+        self.keys: Dict[int, List[str]] = {}            # 景点ID -> 所有搜索键
+        self.grams: Dict[str, Set[int]] = {}            # n-gram -> 景点ID集合
+        self.sorted_keys: List[Tuple[str, int]] = []    # (搜索键, 景点ID)，前缀匹配用
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[tuple, list]" = OrderedDict()
+        # FastAPI 在线程池里并发执行同步接口，LRU 的 "查找 + 移到末尾 / 淘汰" 必须在锁内完成；
+        # 打分本身只读索引，在锁外进行
+        self._lock = threading.Lock()
+
+        # 同名景点只保留最后一个 (与原来 {name: id} 字典的行为一致)
+        by_name = {r["name"]: r["id"] for r in records if r["type"] == 'spot'}
+        for name, sid in by_name.items():
+            keys = [normalize(name)]
+            if lazy_pinyin is not None:
+                keys.append("".join(lazy_pinyin(name)))
+                keys.append("".join(lazy_pinyin(name, style=Style.FIRST_LETTER)))
+            self.names[sid] = name
+            self.keys[sid] = keys
+            for key in keys:
+                self.sorted_keys.append((key, sid))
+                for gram in ngrams(key):
+                    self.grams.setdefault(gram, set()).add(sid)
+        self.sorted_keys.sort()
+
+    def _prefix_matches(self, query: str) -> Set[int]:
+        """所有以 query 开头的搜索键 (二分查找，O(log n + 命中数))"""
+        found = set()
+        i = bisect.bisect_left(self.sorted_keys, (query, -1))
+        while i < len(self.sorted_keys) and self.sorted_keys[i][0].startswith(query):
+            found.add(self.sorted_keys[i][1])
+            i += 1
+        return found
+
+    def candidates(self, query: str) -> List[int]:
+        """
+        【候选剪枝】
+        前缀命中的全部保留；其余按共享 n-gram 的个数排序，只留前 SEARCH_CANDIDATE_LIMIT 个
+        """
+        prefix = self._prefix_matches(query)
+        overlap: Dict[int, int] = {}
+        for gram in ngrams(query):
+            for sid in self.grams.get(gram, ()):
+                # 两字 n-gram 比单字更有区分度，权重更高
+                overlap[sid] = overlap.get(sid, 0) + len(gram)
+        ranked = sorted((sid for sid in overlap if sid not in prefix),
+                        key=lambda sid: -overlap[sid])
+        return list(prefix) + ranked[:max(0, SEARCH_CANDIDATE_LIMIT - len(prefix))]
+
+    def search(self, query: str, limit: int = 5) -> List[Tuple[int, str, int]]:
+        """
+        :return: [(景点ID, 名称, 匹配度 0~100), ...]，按匹配度从高到低
+        """
+        raw = query.strip()
+        query = normalize(raw)
+        if not query or limit <= 0:
+            return []
+        key = (raw, limit)
+        with self._lock:
+            hit = self._cache.get(key)
+            if hit is not None:
+                self._cache.move_to_end(key)
+                return hit
+
+        scored = []
+        latin = query.isascii()
+        for sid in self.candidates(query):
+            name = self.names[sid]
+            score = fuzz.WRatio(raw, name)
+            # 拼音键只在用拉丁字母搜索时参与打分
+            for extra in (self.keys[sid][1:] if latin else ()):
+                if extra.startswith(query):
+                    score = max(score, 90)
+                else:
+                    score = max(score, fuzz.WRatio(query, extra))
+            if score > SEARCH_MIN_SCORE:
+                scored.append((sid, name, score))
+        scored.sort(key=lambda item: -item[2])
+        result = scored[:limit]
+
+        with self._lock:
+            self._cache[key] = result
+            self._cache.move_to_end(key)
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return result
@@ -0,0 +1,170 @@
+import time
+from typing import List, Optional, Sequence, Tuple
+
+# ==========================================
+# 多点游览顺序求解 (基于代价矩阵)
+# ==========================================
+# 输入是一个 (k+1)×(k+1) 或 (k+2)×(k+2) 的代价矩阵：
+#   下标 0 是起点，1..k 是途经点，如果指定了终点，最后一个下标是终点。
+# 输出是途经点的访问顺序。这里只做纯组合优化，不涉及图搜索，
+# 路径的真正展开由 algorithms.plan_multi_point_route 负责。
+
+# 途经点不超过这个数量时用 Held-Karp 精确求解 (O(2^k · k²))
+HELD_KARP_MAX = 10
+
+# 局部搜索最多改进的轮数，防止极端情况下跑太久
+LOCAL_SEARCH_MAX_ROUNDS = 50
+
+
+def route_cost(matrix: Sequence[Sequence[float]], order: List[int], end: Optional[int]) -> float:
+    """计算 起点 -> order -> (终点) 的总代价"""
+    total = 0.0
+    prev = 0
+    for node in order:
+        total += matrix[prev][node]
+        prev = node
+    if end is not None:
+        total += matrix[prev][end]
+    return total
+
+
+def held_karp(matrix: Sequence[Sequence[float]], k: int, end: Optional[int] = None) -> List[int]:
+    """
+    【Held-Karp 动态规划：精确解】
+    dp[mask][j] = 从起点出发，恰好访问 mask 中的途经点，最后停在 j 的最小代价
+    :param k: 途经点数量 (矩阵下标 1..k)
+    :param end: 终点下标；None 表示游览完最后一个途经点即结束
+    :return: 途经点的最优访问顺序 (矩阵下标)
+    """
+    if k == 0:
+        return []
+    inf = float('inf')
+    full = (1 << k) - 1
+    dp = [[inf] * k for _ in range(1 << k)]
+    parent = [[-1] * k for _ in range(1 << k)]
+    for j in range(k):
+        dp[1 << j][j] = matrix[0][j + 1]
+
+    for mask in range(1, full + 1):
+        row = dp[mask]
+        for j in range(k):
+            cost = row[j]
+            if cost == inf:
+                continue
+            from_row = matrix[j + 1]
+            for nxt in range(k):
+                bit = 1 << nxt
+                if mask & bit:
+                    continue
+                new_cost = cost + from_row[nxt + 1]
+                new_mask = mask | bit
+                if new_cost < dp[new_mask][nxt]:
+                    dp[new_mask][nxt] = new_cost
+                    parent[new_mask][nxt] = j
+
+    # 选最后停留的途经点 (有终点时还要加上去终点的代价)
+    best = inf
+    last = -1
+    for j in range(k):
+        cost = dp[full][j]
+        if end is not None:
+            cost += matrix[j + 1][end]
+        if cost < best:
+            best = cost
+            last = j
+
+    # 沿 parent 反推访问顺序
+    order = []
+    mask = full
+    while last != -1:
+        order.append(last + 1)
+        prev = parent[mask][last]
+        mask ^= 1 << last
+        last = prev
+    return order[::-1]
+
+
+def nearest_neighbor(matrix: Sequence[Sequence[float]], k: int) -> List[int]:
+    """【最近邻贪心】每次去离当前位置最近的未访问途经点，作为局部搜索的初始解"""
+    remaining = set(range(1, k + 1))
+    order = []
+    current = 0
+    while remaining:
+        nxt = min(remaining, key=lambda j: matrix[current][j])
+        order.append(nxt)
+        remaining.remove(nxt)
+        current = nxt
+    return order
+
+
+def _or_opt_step(matrix: Sequence[Sequence[float]], order: List[int], order_cost: float,
+                 end: Optional[int]) -> Optional[Tuple[List[int], float]]:
+    """找到第一个能缩短路线的 Or-opt 移动，返回 (新顺序, 新代价)；没有改进返回 None"""
+    n = len(order)
+    for length in (1, 2, 3):
+        for i in range(n - length + 1):
+            segment = order[i:i + length]
+            rest = order[:i] + order[i + length:]
+            for pos in range(len(rest) + 1):
+                if pos == i:
+                    continue
+                candidate = rest[:pos] + segment + rest[pos:]
+                cost = route_cost(matrix, candidate, end)
+                if cost < order_cost - 1e-9:
+                    return candidate, cost
+    return None
+
+
+def improve_route(matrix: Sequence[Sequence[float]], order: List[int], end: Optional[int] = None,
+                  deadline: Optional[float] = None) -> List[int]:
+    """
+    【局部搜索：2-opt + Or-opt】
+    - 2-opt:  把一段途经点整体翻转
+    - Or-opt: 把长度 1~3 的一小段挪到别的位置
+    反复做，直到一轮下来没有任何改进 (或达到轮数上限)。
+    起点固定在最前面，终点 (如果有) 固定在最后面，不参与调整。
+    :param deadline: 截止时刻 (time.time())，到点后直接返回当前最好的顺序
+    """
+    best = list(order)
+    best_cost = route_cost(matrix, best, end)
+    n = len(best)
+
+    for _ in range(LOCAL_SEARCH_MAX_ROUNDS):
+        improved = False
+
+        # 2-opt (途经点多时一轮就要很久，每换一个 i 检查一次截止时刻)
+        for i in range(n - 1):
+            if deadline is not None and time.time() > deadline:
+                return best
+            for j in range(i + 1, n):
+                candidate = best[:i] + best[i:j + 1][::-1] + best[j + 1:]
+                cost = route_cost(matrix, candidate, end)
+                if cost < best_cost - 1e-9:
+                    best, best_cost = candidate, cost
+                    improved = True
+
+        if deadline is not None and time.time() > deadline:
+            break
+
+        # Or-opt: 每接受一次移动就从头重新扫描 (段的下标是相对移动前的路线算的)
+        while deadline is None or time.time() <= deadline:
+            move = _or_opt_step(matrix, best, best_cost, end)
+            if move is None:
+                break
+            best, best_cost = move
+            improved = True
+
+        if not improved or (deadline is not None and time.time() > deadline):
+            break
+    return best
+
+
+def solve_visit_order(matrix: Sequence[Sequence[float]], k: int, end: Optional[int] = None,
+                      deadline: Optional[float] = None) -> List[int]:
+    """
+    【求解入口】
+    途经点少时用 Held-Karp 精确求解；多了就用最近邻 + 局部搜索 (给了 deadline 时到点就停)。
+    """
+    if k <= HELD_KARP_MAX:
+        return held_karp(matrix, k, end)
+    return improve_route(matrix, nearest_neighbor(matrix, k), end, deadline)
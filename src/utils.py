@@ -1,6 +1,7 @@
 import json
 import os
 from models import CampusGraph, Spot, Edge
+from snapshot import load_graph_from_snapshot
 
 def load_graph_from_json(filepath):
     """
@@ -31,18 +32,42 @@ def load_graph_from_json(filepath):
         graph.add_spot(spot)
         
     # 2. 加载边 (edges)
+    # 可选的分时段拥挤度: 顶层 "crowding_bucket_minutes" 指定每段多少分钟 (默认 60)，
+    # 每条边的 "crowding_profile" 是一天中各时段的拥挤度列表
+    graph.bucket_minutes = data.get('crowding_bucket_minutes', 60)
+    num_buckets = 24 * 60 // graph.bucket_minutes
     for item in data.get('edges', []):
+        profile = item.get('crowding_profile')
+        if profile is not None and len(profile) != num_buckets:
+            print(f"⚠️ 警告: 道路 {item['u']}-{item['v']} 的分时段拥挤度应有 {num_buckets} 个值，已忽略")
+            profile = None
         edge = Edge(
             u=item['u'],
             v=item['v'],
             distance=item['distance'],   # 新工具生成的 key 是 "distance"
-            crowding=item.get('crowding', 1.0)
+            crowding=item.get('crowding', 1.0),
+            crowding_profile=profile,
+            type=item.get('type')          # 'walk' / 'bike'，没有则不限制交通方式
         )
         graph.add_edge(edge)
                         
+    # 3. 建立空间索引 (按坐标找最近节点 / 点击吸附)
+    graph.spatial_index()
+
     print(f"✅ 地图加载成功: {len(graph.spots)} 个节点, {len(data.get('edges', []))} 条边")
     return graph
 
+def load_graph(filepath):
+    """
+    加载地图的推荐入口：
+    如果旁边有最新的二进制快照 (snapshot.py 生成)，直接 mmap 映射，几乎不花时间；
+    快照不存在或已经过期时，自动回退到 load_graph_from_json。
+    """
+    graph = load_graph_from_snapshot(filepath)
+    if graph is None:
+        graph = load_graph_from_json(filepath)
+    return graph
+
 def get_data_path():
     """获取 campus_map.json 的绝对路径"""
     current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -0,0 +1,217 @@
+import argparse
+import gc
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+# 这个脚本不需要启动服务，直接导入 src 下的模块在进程内测
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from algorithms import dijkstra_search, plan_multi_point_route
+from generate_data import generate_nodes, generate_edges
+from utils import load_graph_from_json
+
+# ==========================================
+# 路径规划性能基准 (离线)
+# ==========================================
+# 用 generate_data.py 生成不同规模的地图 (默认 100 ~ 10 万节点，--sizes 可以加到 100 万)，
+# 对每张图测:
+#   1. 加载 + 编译地图的时间和内存峰值
+#   2. dijkstra_search 单点导航 (不预建全源表，测的是算法本身)
+#   3. plan_multi_point_route 多点规划，途经点 k = 2 ~ 20
+#   4. /navigate 接口 (进程内 TestClient，走和线上一样的 prepare_graph 预计算)
+# 每一项记录 p50 / p99 延迟、平均确定节点数 (settled) 和内存峰值 (tracemalloc)，
+# 结果保存成 JSON，不同版本的结果可以直接对比，看有没有性能退化。
+#
+# 用法: python tests/benchmark.py [--sizes 100,1000,10000] [--queries 50] [--seed 42] [--out 结果.json]
+
+DEFAULT_SIZES = [100, 1000, 10000, 100000]
+VIA_COUNTS = [2, 5, 10, 20]
+OUTPUT_DIR = os.path.join("data", "benchmarks")
+
+
+def percentile(values, p: float) -> float:
+    """最近秩法求百分位数 (p 取 0~100)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def summarize(latencies, settled=None, peak_bytes=None) -> dict:
+    """把一组延迟 (秒) 整理成报告里的一项 (毫秒)"""
+    result = {
+        "runs": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+    }
+    if settled:
+        result["settled_avg"] = round(sum(settled) / len(settled), 1)
+    if peak_bytes is not None:
+        result["peak_mem_mb"] = round(peak_bytes / 1024 / 1024, 2)
+    return result
+
+
+def measure(fn, cases, memory_samples: int = 5):
+    """
+    依次对每个 case 调用 fn(case) -> stats 字典，返回 (延迟列表, settled 列表, 内存峰值)
+    计时时不开 tracemalloc (它会让分配变慢好几倍)，内存峰值另外用前几个 case 单独测
+    """
+    latencies, settled = [], []
+    for case in cases:
+        gc.disable()
+        start = time.perf_counter()
+        stats = fn(case)
+        latencies.append(time.perf_counter() - start)
+        gc.enable()
+        if stats and 'settled' in stats:
+            settled.append(stats['settled'])
+
+    tracemalloc.start()
+    for case in cases[:memory_samples]:
+        fn(case)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return latencies, settled, peak
+
+
+def write_map(num_nodes: int, seed: int, path: str):
+    """生成一张地图并写成 campus_map.json 的格式"""
+    rng = random.Random(seed)
+    nodes = generate_nodes(num_nodes, rng)
+    edges = generate_edges(nodes, rng)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps({"spots": nodes, "edges": edges}, ensure_ascii=False))
+    return nodes
+
+
+def bench_size(num_nodes: int, queries: int, seed: int, workdir: str, with_api: bool) -> dict:
+    print(f"\n📐 ===== {num_nodes} 个节点 =====")
+    map_path = os.path.join(workdir, f"bench_{num_nodes}.json")
+    nodes = write_map(num_nodes, seed, map_path)
+    ids = [n['id'] for n in nodes]
+    spot_ids = [n['id'] for n in nodes if n['type'] == 'spot']
+    rng = random.Random(seed + 1)
+    report = {"nodes": num_nodes}
+
+    # 1. 加载 + 编译
+    tracemalloc.start()
+    start = time.perf_counter()
+    graph = load_graph_from_json(map_path)
+    graph.compile()
+    load_time = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    report["edges"] = len(graph.edges)
+    report["load"] = {"seconds": round(load_time, 3), "peak_mem_mb": round(peak / 1024 / 1024, 2)}
+    print(f"   📦 加载: {load_time:.2f} 秒，内存峰值 {report['load']['peak_mem_mb']} MB")
+
+    # 2. 单点导航 (graph 没有建全源表，每次都真的跑 Dijkstra)
+    pairs = [tuple(rng.sample(ids, 2)) for _ in range(queries)]
+
+    def run_dijkstra(pair):
+        stats = {}
+        dijkstra_search(graph, pair[0], pair[1], 'dist', 'walk', stats)
+        return stats
+
+    report["dijkstra_search"] = summarize(*measure(run_dijkstra, pairs))
+    print(f"   🧭 dijkstra_search: {report['dijkstra_search']}")
+
+    # 3. 多点规划
+    report["plan_multi_point_route"] = {}
+    tours = max(1, queries // 5)
+    for k in VIA_COUNTS:
+        pool = spot_ids if len(spot_ids) > k else ids
+        cases = [(rng.choice(ids), rng.sample(pool, k)) for _ in range(tours)]
+
+        def run_tour(case):
+            stats = {}
+            plan_multi_point_route(graph, case[0], case[1], 'dist', 'walk', stats=stats)
+            return stats
+
+        report["plan_multi_point_route"][f"k={k}"] = summarize(*measure(run_tour, cases))
+        print(f"   🔗 plan_multi_point_route k={k}: {report['plan_multi_point_route'][f'k={k}']}")
+
+    # 4. /navigate 接口
+    if with_api:
+        report["navigate"] = bench_navigate(map_path, ids, queries, rng)
+    return report
+
+
+def bench_navigate(map_path: str, ids, queries: int, rng: random.Random) -> dict:
+    """进程内调用 /navigate (不经过网络)，图的预计算和线上启动时一样"""
+    import api
+    from route_cache import route_cache
+    from fastapi.testclient import TestClient
+
+    api.global_graph = api.prepare_graph(map_path)
+    route_cache.clear()
+    client = TestClient(api.app)  # 不用 with，不触发 lifespan (不连数据库、不加载正式地图)
+
+    def run_navigate(body):
+        res = client.post("/navigate", json=body)
+        if res.status_code != 200:
+            raise RuntimeError(f"/navigate 返回 {res.status_code}: {res.text}")
+        return None
+
+    result = {}
+    single = [{"start_id": a, "end_id": b} for a, b in (rng.sample(ids, 2) for _ in range(queries))]
+    result["single"] = summarize(*measure(run_navigate, single))
+    print(f"   🌐 /navigate 单点: {result['single']}")
+
+    tours = [{"start_id": rng.choice(ids), "via_ids": rng.sample(ids, 10)}
+             for _ in range(max(1, queries // 5))]
+    result["via_10"] = summarize(*measure(run_navigate, tours))
+    print(f"   🌐 /navigate 途经 10 点: {result['via_10']}")
+    api.global_graph = None
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="路径规划性能基准")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="地图节点数，逗号分隔 (例如 100,1000,1000000)")
+    parser.add_argument("--queries", type=int, default=50, help="每种查询跑多少次")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子 (地图和查询都由它决定)")
+    parser.add_argument("--no-api", action="store_true", help="不测 /navigate 接口")
+    parser.add_argument("--out", default=None, help="结果 JSON 路径 (默认 data/benchmarks/bench_<时间>.json)")
+    args = parser.parse_args()
+
+    with_api = not args.no_api
+    if with_api:
+        try:
+            import api  # noqa: F401  需要和启动服务一样的 .env 配置 (SECRET_KEY 等)
+        except Exception as e:
+            print(f"⚠️ 无法导入 api 模块，跳过 /navigate 测试: {e}")
+            with_api = False
+
+    results = {
+        "created_at": datetime.now().isoformat(timespec='seconds'),
+        "python": sys.version.split()[0],
+        "seed": args.seed,
+        "queries": args.queries,
+        "sizes": [],
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in (int(s) for s in args.sizes.split(",") if s.strip()):
+            results["sizes"].append(bench_size(size, args.queries, args.seed, workdir, with_api))
+
+    out_path = args.out or os.path.join(OUTPUT_DIR, f"bench_{datetime.now():%Y%m%d-%H%M%S}.json")
+    out_dir = os.path.dirname(out_path)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    with open(out_path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\n🎉 基准测试完成，结果已保存至: {out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -46,6 +46,67 @@ def main():
         else:
             print(f"   ❌ 失败: {res.text}")
 
+        # ==========================================
+        # 场景 3: 不同搜索算法结果一致 (Dijkstra / A* / 双向)
+        # ==========================================
+        print("\n🧭 [测试 3] 搜索算法对比: 西门(1) -> 学生食堂(44)")
+        costs = {}
+        for algo in ["dijkstra", "astar", "bidirectional"]:
+            res = requests.post(f"{BASE_URL}/navigate", json={**payload, "algorithm": algo})
+            if res.status_code == 200:
+                costs[algo] = res.json()['total_cost']
+                print(f"   ✅ {algo}: {costs[algo]}")
+            else:
+                print(f"   ❌ {algo} 失败: {res.text}")
+        if len(set(costs.values())) == 1:
+            print("   ✅ 三种算法的最短距离一致")
+        else:
+            print(f"   ❌ 结果不一致: {costs}")
+
+        # ==========================================
+        # 场景 4: 紧凑格式 (polyline 坐标 + 只带景点名称)
+        # ==========================================
+        print("\n📦 [测试 4] 紧凑格式: 西门(1) -> 学生食堂(44)")
+        full = requests.post(f"{BASE_URL}/navigate", json=payload)
+        compact = requests.post(f"{BASE_URL}/navigate", json={**payload, "compact": True})
+        if full.status_code == 200 and compact.status_code == 200:
+            data = compact.json()
+            print(f"   ✅ 响应大小: {len(full.content)} -> {len(compact.content)} 字节")
+            print(f"   🏷️ 景点: {data['spot_names']}")
+            print(f"   🧵 坐标: {data['geometry']}")
+        else:
+            print(f"   ❌ 失败: {compact.text}")
+
+        # ==========================================
+        # 场景 5: 限时游览推荐 (60 分钟，从西门出发)
+        # ==========================================
+        print("\n⏱️ [测试 5] 限时游览推荐: 西门(1) 出发，60 分钟")
+        res = requests.post(f"{BASE_URL}/navigate/tour", json={"start_id": 1, "budget_minutes": 60})
+        if res.status_code == 200:
+            data = res.json()
+            print(f"   ✅ 推荐景点: {data['visit_names']}")
+            print(f"   ⭐ 吸引力: {data['total_appeal']}，耗时 {data['total_minutes']} 分钟")
+            if data['total_minutes'] > 60:
+                print("   ❌ 超出时间预算")
+        else:
+            print(f"   ❌ 失败: {res.text}")
+
+        # ==========================================
+        # 场景 6: 地图数据的浏览器缓存 (ETag / 304)
+        # ==========================================
+        print("\n🗂️ [测试 6] 地图数据缓存: 带 If-None-Match 再请求一次")
+        for path in ["/graph", "/spots/list"]:
+            first = requests.get(f"{BASE_URL}{path}")
+            etag = first.headers.get("ETag")
+            if first.status_code != 200 or not etag:
+                print(f"   ❌ {path} 没有返回 ETag: {first.status_code}")
+                continue
+            again = requests.get(f"{BASE_URL}{path}", headers={"If-None-Match": etag})
+            if again.status_code == 304 and not again.content:
+                print(f"   ✅ {path}: {len(first.content)} 字节 -> 304 (ETag {etag})")
+            else:
+                print(f"   ❌ {path} 应返回 304，实际 {again.status_code}")
+
     except Exception as e:
         print(f"❌ 连接失败: {e}")
 
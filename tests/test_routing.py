@@ -0,0 +1,385 @@
+import json
+import os
+import random
+import sys
+import tempfile
+
+# 这个脚本不需要启动服务，直接导入 src 下的模块在进程内测
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from algorithms import (dijkstra_search, batch_routes, reachable_within, nearest_targets,
+                        k_shortest_paths, ch_search, astar_search, get_edge_weight,
+                        time_dependent_search)
+from contraction import build_contraction_hierarchies
+from derived_rebuild import DerivedRebuilder
+from landmarks import build_landmarks
+from road_chains import contract_road_chains
+from route_cache import RouteCache
+from snapshot import GraphSnapshot, save_snapshot, graph_from_snapshot
+from utils import load_graph_from_json, get_data_path
+
+# ==========================================
+# 路线一致性测试 (离线)
+# ==========================================
+# 缓存、批量、预处理这些加速手段只能更快，不能算错：
+# 每个场景都拿它们的结果和最朴素的 dijkstra_search (不建任何预处理的新地图) 对比消耗。
+#
+# 用法: python tests/test_routing.py
+
+MODES = [('dist', 'walk'), ('dist', 'bike'), ('time', 'walk'), ('time', 'bike')]
+
+# 每个场景随机抽取的查询数
+SAMPLES = 200
+
+
+def load_map():
+    """每个场景各自加载一张新地图 (不建全源表等预处理)，互不影响"""
+    return load_graph_from_json(get_data_path())
+
+
+def random_pairs(graph, rng, count=SAMPLES, sources=None):
+    """随机起终点对；给了 sources 时起点只从这几个里选 (模拟热门起点)"""
+    ids = list(graph.spots)
+    pairs = []
+    while len(pairs) < count:
+        start = rng.choice(sources) if sources else rng.choice(ids)
+        end = rng.choice(ids)
+        if start != end:
+            pairs.append((start, end))
+    return pairs
+
+
+def same_cost(a, b) -> bool:
+    return abs(a - b) <= 1e-6
+
+
+def path_cost(graph, path, strategy, transport) -> float:
+    """沿着返回的路径逐段把消耗加起来 (两点之间有多条路时取最便宜的)；有一段不存在就是无穷大"""
+    steps = {}
+    for edge in graph.edges:
+        pair = frozenset((edge.u, edge.v))
+        steps[pair] = min(steps.get(pair, float('inf')), get_edge_weight(edge, strategy, transport))
+    return sum(steps.get(frozenset(step), float('inf')) for step in zip(path, path[1:]))
+
+
+def report(name, mismatches, total) -> bool:
+    if mismatches:
+        print(f"   ❌ {name}: {len(mismatches)}/{total} 个结果和 dijkstra_search 不一致，例如 {mismatches[0]}")
+        return False
+    print(f"   ✅ {name}: {total} 个结果和 dijkstra_search 一致")
+    return True
+
+
+def main():
+    print("🧪 [路线一致性测试] 加速结果 vs dijkstra_search")
+    rng = random.Random(42)
+    results = []
+
+    # ==========================================
+    # 场景 1: 路径缓存 (第一次未命中、之后命中 / 走最短路径树)
+    # ==========================================
+    print("\n🗃️ [测试 1] 路径缓存")
+    graph = load_map()
+    plain = load_map()
+    cache = RouteCache()
+    sources = rng.sample(list(graph.spots), 5)
+    for strategy, transport in MODES:
+        mismatches = []
+        pairs = random_pairs(graph, rng, sources=sources)
+        for _ in range(2):
+            for start, end in pairs:
+                path, cost = cache.find_route(graph, start, end, strategy=strategy, transport=transport)
+                _, expected = dijkstra_search(plain, start, end, strategy, transport)
+                if not same_cost(cost, expected) or (path and (path[0], path[-1]) != (start, end)):
+                    mismatches.append((start, end, cost, expected))
+        results.append(report(f"{strategy}/{transport}", mismatches, len(pairs) * 2))
+    stats = cache.stats()
+    print(f"   📊 命中 {stats['hits']}，未命中 {stats['misses']}，最短路径树命中 {stats['tree_hits']}")
+
+    # ==========================================
+    # 场景 2: 拥挤度变化后再查 (缓存失效 + 最短路径树增量修复)
+    # ==========================================
+    # 沿用场景 1 已经热起来的缓存，几轮随机调高/调低拥挤度后，
+    # 缓存给出的结果必须和在更新后的地图上重新搜索一样
+    print("\n🚦 [测试 2] 拥挤度变化后再查")
+    for round_no in range(3):
+        updates = [(k, None, rng.choice([0.5, 1.0, 2.0, 5.0]))
+                   for k in rng.sample(range(len(graph.edges)), 20)]
+        graph.update_edges(updates)
+        plain.update_edges(updates)
+        mismatches = []
+        total = 0
+        for strategy, transport in MODES:
+            for start, end in random_pairs(graph, rng, count=SAMPLES // 4, sources=sources):
+                path, cost = cache.find_route(graph, start, end, strategy=strategy, transport=transport)
+                _, expected = dijkstra_search(plain, start, end, strategy, transport)
+                if not same_cost(cost, expected):
+                    mismatches.append((strategy, transport, start, end, cost, expected))
+                total += 1
+        results.append(report(f"第 {round_no + 1} 轮更新后", mismatches, total))
+    stats = cache.stats()
+    print(f"   📊 失效路线 {stats['invalidations']}，修复最短路径树 {stats['tree_repairs']}")
+
+    # ==========================================
+    # 场景 3: 批量点对查询 (按起点分组)
+    # ==========================================
+    print("\n📦 [测试 3] 批量点对查询")
+    graph = load_map()
+    plain = load_map()
+    for strategy, transport in MODES:
+        pairs = random_pairs(graph, rng, sources=rng.sample(list(graph.spots), 10))
+        mismatches = []
+        for (start, end), (path, cost) in zip(pairs, batch_routes(graph, pairs, strategy, transport)):
+            _, expected = dijkstra_search(plain, start, end, strategy, transport)
+            if not same_cost(cost, expected) or (path and (path[0], path[-1]) != (start, end)):
+                mismatches.append((start, end, cost, expected))
+        results.append(report(f"{strategy}/{transport}", mismatches, len(pairs)))
+
+    # ==========================================
+    # 场景 4: 可达范围 (等时圈)
+    # ==========================================
+    # 预算取起点到所有点消耗的中位数，大约一半的点在圈内
+    print("\n⏱️ [测试 4] 可达范围")
+    node_ids = graph.compile().node_ids
+    for strategy, transport in MODES:
+        mismatches = []
+        starts = rng.sample(list(graph.spots), 5)
+        for start in starts:
+            costs = {end: dijkstra_search(plain, start, end, strategy, transport)[1] for end in graph.spots}
+            budget = sorted(c for c in costs.values() if c >= 0)[len(costs) // 2]
+            reached, _ = reachable_within(graph, start, budget, strategy, transport)
+            got = {node_ids[i]: cost for i, cost in reached.items()}
+            expected = {end: cost for end, cost in costs.items() if 0 <= cost <= budget}
+            if got.keys() != expected.keys() or not all(same_cost(got[e], expected[e]) for e in got):
+                mismatches.append((start, budget, sorted(got.keys() ^ expected.keys())))
+        results.append(report(f"{strategy}/{transport}", mismatches, len(starts)))
+
+    # ==========================================
+    # 场景 5: 最近设施 (一次多目标搜索)
+    # ==========================================
+    # 返回的 k 个消耗必须等于对每个候选点分别搜索、排序后的前 k 个
+    print("\n🍚 [测试 5] 最近设施")
+    for strategy, transport in MODES:
+        mismatches = []
+        starts = rng.sample(list(graph.spots), 20)
+        for start in starts:
+            candidates = rng.sample([s for s in graph.spots if s != start], 10)
+            found = nearest_targets(graph, start, candidates, 3, strategy, transport)
+            expected = sorted(c for c in (dijkstra_search(plain, start, end, strategy, transport)[1]
+                                          for end in candidates) if c >= 0)[:3]
+            got = [cost for _, _, cost in found]
+            if len(got) != len(expected) or not all(map(same_cost, got, expected)):
+                mismatches.append((start, got, expected))
+        results.append(report(f"{strategy}/{transport}", mismatches, len(starts)))
+
+    # ==========================================
+    # 场景 6: k 条备选路线
+    # ==========================================
+    # 第一条就是最短路径；后面的按消耗不减，而且都是起终点正确、不绕回头的无环路线
+    print("\n🔀 [测试 6] k 条备选路线")
+    for strategy, transport in MODES:
+        mismatches = []
+        pairs = random_pairs(graph, rng, count=SAMPLES // 4)
+        for start, end in pairs:
+            routes = k_shortest_paths(graph, start, end, 3, strategy, transport)
+            _, expected = dijkstra_search(plain, start, end, strategy, transport)
+            costs = [cost for _, cost in routes]
+            ok = bool(routes) and same_cost(costs[0], expected)
+            ok = ok and all(a <= b + 1e-6 for a, b in zip(costs, costs[1:]))
+            ok = ok and all((p[0], p[-1]) == (start, end) and len(set(p)) == len(p) for p, _ in routes)
+            if not ok:
+                mismatches.append((start, end, costs, expected))
+        results.append(report(f"{strategy}/{transport}", mismatches, len(pairs)))
+
+    # ==========================================
+    # 场景 7: 二进制快照加载的地图
+    # ==========================================
+    # 快照写到临时目录，不碰 data/ 下真正的快照；之后再改一轮拥挤度，确认快照地图也能正确更新
+    print("\n💾 [测试 7] 二进制快照")
+    with tempfile.TemporaryDirectory() as tmp:
+        snap_path = save_snapshot(load_map(), get_data_path(), os.path.join(tmp, "campus_map.snap"))
+        snap_graph = graph_from_snapshot(GraphSnapshot(snap_path))
+        updates = [(k, None, rng.choice([0.5, 2.0, 5.0])) for k in rng.sample(range(len(plain.edges)), 20)]
+        for label in ("加载后", "拥挤度更新后"):
+            if label == "拥挤度更新后":
+                snap_graph.update_edges(updates)
+                plain.update_edges(updates)
+            mismatches = []
+            total = 0
+            for strategy, transport in MODES:
+                for start, end in random_pairs(plain, rng, count=SAMPLES // 4):
+                    path, cost = dijkstra_search(snap_graph, start, end, strategy, transport)
+                    _, expected = dijkstra_search(plain, start, end, strategy, transport)
+                    if not same_cost(cost, expected) or (path and (path[0], path[-1]) != (start, end)):
+                        mismatches.append((strategy, transport, start, end, cost, expected))
+                    total += 1
+            results.append(report(label, mismatches, total))
+
+    # ==========================================
+    # 场景 8: 只能步行的道路
+    # ==========================================
+    # 随机把四分之一的道路标成 'walk'：骑车路线不能经过它们，
+    # 消耗要等于在 "直接删掉这些道路" 的地图上搜索的结果；步行路线不受影响
+    print("\n🚲 [测试 8] 只能步行的道路")
+    with open(get_data_path(), encoding='utf-8') as f:
+        data = json.load(f)
+    for item in data['edges']:
+        item['type'] = 'walk' if rng.random() < 0.25 else 'bike'
+    walk_only = {frozenset((e['u'], e['v'])) for e in data['edges'] if e['type'] == 'walk'}
+    with tempfile.TemporaryDirectory() as tmp:
+        typed_path = os.path.join(tmp, "typed.json")
+        bike_path = os.path.join(tmp, "bike_only.json")
+        with open(typed_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        with open(bike_path, 'w', encoding='utf-8') as f:
+            json.dump({**data, 'edges': [e for e in data['edges'] if e['type'] == 'bike']}, f, ensure_ascii=False)
+        typed = load_graph_from_json(typed_path)
+        references = {'walk': load_map(), 'bike': load_graph_from_json(bike_path)}
+    # 两点之间还有能骑车的平行道路时，经过这一段不算违规
+    bike_pairs = {frozenset((e['u'], e['v'])) for e in data['edges'] if e['type'] == 'bike'}
+    for strategy, transport in MODES:
+        mismatches = []
+        pairs = random_pairs(typed, rng)
+        for start, end in pairs:
+            path, cost = dijkstra_search(typed, start, end, strategy, transport)
+            _, expected = dijkstra_search(references[transport], start, end, strategy, transport)
+            steps = {frozenset(step) for step in zip(path, path[1:])}
+            if transport == 'bike' and steps & (walk_only - bike_pairs):
+                mismatches.append((start, end, "骑车经过了只能步行的道路"))
+            elif not same_cost(cost, expected):
+                mismatches.append((start, end, cost, expected))
+        results.append(report(f"{strategy}/{transport}", mismatches, len(pairs)))
+
+    # ==========================================
+    # 场景 9: 路点链收缩 (骨架图)
+    # ==========================================
+    # 起终点落在路点上时会回退到完整的图，所以这里从所有节点里抽；
+    # 展开回来的路径逐段加起来也要等于返回的消耗。最后改一轮拥挤度，骨架边的权重要跟着变
+    print("\n🦴 [测试 9] 路点链收缩")
+    graph = load_map()
+    plain = load_map()
+    skeleton = contract_road_chains(graph, min_ratio=0)
+    if skeleton is None:
+        print("   ⚠️ 地图里没有可以收缩的路点链，跳过")
+    else:
+        print(f"   📊 骨架图 {skeleton.graph.num_nodes}/{graph.compile().num_nodes} 个节点")
+        updates = [(k, None, rng.choice([0.5, 2.0, 5.0])) for k in rng.sample(range(len(plain.edges)), 20)]
+        for label in ("收缩后", "拥挤度更新后"):
+            if label == "拥挤度更新后":
+                graph.update_edges(updates)
+                plain.update_edges(updates)
+            mismatches = []
+            total = 0
+            for strategy, transport in MODES:
+                for start, end in random_pairs(graph, rng, count=SAMPLES // 4):
+                    path, cost = dijkstra_search(graph, start, end, strategy, transport)
+                    _, expected = dijkstra_search(plain, start, end, strategy, transport)
+                    if not same_cost(cost, expected) or (path and (path[0], path[-1]) != (start, end)):
+                        mismatches.append((strategy, transport, start, end, cost, expected))
+                    elif path and not same_cost(path_cost(plain, path, strategy, transport), cost):
+                        mismatches.append((strategy, transport, start, end, "展开的路径和消耗对不上"))
+                    total += 1
+            results.append(report(label, mismatches, total))
+
+    # ==========================================
+    # 场景 10: 收缩层次 (CH) 查询
+    # ==========================================
+    # 拥挤度变化后 'time' 的收缩层次作废，查询回退到普通搜索；后台重建之后又用回 CH。
+    # 这里直接在当前线程调用 rebuild()，不等去抖
+    print("\n🏔️ [测试 10] 收缩层次")
+    graph = load_map()
+    plain = load_map()
+    build_contraction_hierarchies(graph)
+    updates = [(k, None, rng.choice([0.5, 2.0, 5.0])) for k in rng.sample(range(len(plain.edges)), 20)]
+    for label in ("预处理后", "拥挤度更新后 (回退)", "后台重建后"):
+        if label == "拥挤度更新后 (回退)":
+            graph.update_edges(updates)
+            plain.update_edges(updates)
+            print(f"   📊 暂时回退的模式: {sorted(graph.compile().stale.get('contraction', ()))}")
+        elif label == "后台重建后":
+            DerivedRebuilder(delay=0).rebuild(graph)
+            print(f"   📊 可用的收缩层次: {sorted(graph.compile().contraction)}")
+        mismatches = []
+        total = 0
+        for strategy, transport in MODES:
+            for start, end in random_pairs(graph, rng, count=SAMPLES // 4):
+                path, cost = ch_search(graph, start, end, strategy, transport)
+                _, expected = dijkstra_search(plain, start, end, strategy, transport)
+                if not same_cost(cost, expected) or (path and (path[0], path[-1]) != (start, end)):
+                    mismatches.append((strategy, transport, start, end, cost, expected))
+                elif path and not same_cost(path_cost(plain, path, strategy, transport), cost):
+                    mismatches.append((strategy, transport, start, end, "展开的路径和消耗对不上"))
+                total += 1
+        results.append(report(label, mismatches, total))
+
+    # ==========================================
+    # 场景 11: 地标 A* (ALT)
+    # ==========================================
+    # 和服务启动时一样先收缩路点链再建地标；拥挤度调低会让旧的下界偏大，
+    # 所以更新一轮之后 (地标距离随编译结果一起修复) 再查一次
+    print("\n🧭 [测试 11] 地标 A*")
+    graph = load_map()
+    plain = load_map()
+    contract_road_chains(graph)
+    build_landmarks(graph)
+    updates = [(k, None, rng.choice([0.2, 0.5, 2.0, 5.0])) for k in rng.sample(range(len(plain.edges)), 20)]
+    for label in ("预处理后", "拥挤度更新后"):
+        if label == "拥挤度更新后":
+            graph.update_edges(updates)
+            plain.update_edges(updates)
+        mismatches = []
+        total = 0
+        for strategy, transport in MODES:
+            for start, end in random_pairs(graph, rng, count=SAMPLES // 4):
+                path, cost = astar_search(graph, start, end, strategy, transport)
+                _, expected = dijkstra_search(plain, start, end, strategy, transport)
+                if not same_cost(cost, expected) or (path and (path[0], path[-1]) != (start, end)):
+                    mismatches.append((strategy, transport, start, end, cost, expected))
+                total += 1
+        results.append(report(label, mismatches, total))
+
+    # ==========================================
+    # 场景 12: 分时段导航跨过时段边界
+    # ==========================================
+    # 时段只有 1 分钟，拥挤度在 0.2 ~ 5 之间乱跳，大部分道路都会跨好几个时段。
+    # 这里没有 dijkstra_search 可以对比，检查的是时间依赖最短路应有的性质：
+    #   1. 晚出发不会早到达 (FIFO)
+    #   2. A* 和 Dijkstra 给出相同的耗时
+    #   3. 所有时段的拥挤度都相同时，和普通 'time' 策略的结果一致
+    print("\n🕛 [测试 12] 分时段导航 (跨时段边界)")
+    with open(get_data_path(), encoding='utf-8') as f:
+        data = json.load(f)
+    data['crowding_bucket_minutes'] = 1
+    flat = json.loads(json.dumps(data))
+    for item, same in zip(data['edges'], flat['edges']):
+        item['crowding_profile'] = [rng.choice([0.2, 0.5, 1.0, 2.0, 5.0]) for _ in range(24 * 60)]
+        same['crowding_profile'] = [same.get('crowding', 1.0)] * (24 * 60)
+    graphs = []
+    for content in (data, flat):
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False, encoding='utf-8') as f:
+            json.dump(content, f)
+        graphs.append(load_graph_from_json(f.name))
+        os.remove(f.name)
+    graph, flat_graph = graphs
+    plain = load_map()
+    for transport in ('walk', 'bike'):
+        mismatches = []
+        pairs = random_pairs(graph, rng, count=SAMPLES // 4)
+        for start, end in pairs:
+            depart = rng.uniform(0, 24 * 3600)
+            _, cost = time_dependent_search(graph, start, end, depart, transport)
+            _, later = time_dependent_search(graph, start, end, depart + 30, transport)
+            _, exact = time_dependent_search(graph, start, end, depart, transport, use_heuristic=False)
+            _, flat_cost = time_dependent_search(flat_graph, start, end, depart, transport)
+            _, expected = dijkstra_search(plain, start, end, 'time', transport)
+            if (cost != -1 and later + 30 < cost - 1e-6) or not same_cost(cost, exact) \
+                    or not same_cost(flat_cost, expected):
+                mismatches.append((transport, start, end, depart, cost, later, exact, flat_cost, expected))
+        results.append(report(f"time/{transport}", mismatches, len(pairs)))
+
+    print(f"\n{'🎉 全部通过' if all(results) else '❌ 有场景失败'} ({sum(results)}/{len(results)})")
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
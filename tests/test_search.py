@@ -33,5 +33,18 @@ def main():
     else:
         print("   ❌ 未找到地点")
 
+    # 3. 名称索引: 每个景点用全名搜，排第一的应该就是它自己；结果数不超过 limit
+    print("\n🗂️ 测试 3: 用全名搜索每个景点")
+    spots = requests.get(f"{BASE_URL}/spots/list").json()
+    wrong = []
+    for spot in spots:
+        data = requests.get(f"{BASE_URL}/spots/search", params={"query": spot['name'], "limit": 3}).json()
+        if not data or len(data) > 3 or data[0]['name'] != spot['name']:
+            wrong.append((spot['name'], [d['name'] for d in data]))
+    if wrong:
+        print(f"   ❌ {len(wrong)}/{len(spots)} 个景点没有排在第一，例如 {wrong[0]}")
+    else:
+        print(f"   ✅ {len(spots)} 个景点全名搜索都排在第一")
+
 if __name__ == "__main__":
     main()
\ No newline at end of file